@@ -1,15 +1,34 @@
-from typing_extensions import TypedDict, List
+from typing_extensions import TypedDict, List, Dict, Any
 # from performer.performer import sql_agent
 
 class AgentState(TypedDict):
+    db_config: Dict[str, Any]
     query: str
     analysis: str
     schema: str
+    schema_token_budget: int
+    schema_tokens_saved: int
+    diagnostics: str
+    workload: List[Dict[str, Any]]
+    index_advice: List[Dict[str, Any]]
     execute: bool
+    execution_mode: str
+    run_id: str
+    statement_timeout_ms: int
+    phase_timeout_s: float
     reanalyze: bool
     feedback: str
+    # Feedback rounds re-send only the running summary and the feedback delta
+    incremental: bool
+    analysis_rounds: List[Dict[str, Any]]
+    analysis_summary: str
     execute_query: str
     mrk_down: str
+    target_queries: List[str]
+    validation: List[Dict[str, Any]]
+    index_evaluation: List[Dict[str, Any]]
+    execution_results: List[Dict[str, Any]]
+    undo_session: str
 
     # Add this whenever necessary
     # def __init__(self):
@@ -17,10 +36,34 @@ class AgentState(TypedDict):
     #     self["schema"] = sql_agent.get_schema()
 
 class TestingState(TypedDict):
+    db_config: Dict[str, Any]
     schema: str
+    schema_token_budget: int
     execute_query: str
+    benchmark_queries: List[str]
+    warmup: int
+    repetitions: int
     before_exec: str
     after_exec: str
+    before_metrics: Dict[str, Any]
+    after_metrics: Dict[str, Any]
+    run_id: str
+    statement_timeout_ms: int
+    phase_timeout_s: float
+    cancelled: bool
+    sandbox_strategy: str
+    sandbox_fraction: float
+    sandbox_template: str
+    sandbox_scale: float
+    sandbox: Dict[str, Any]
+    plan_diffs: List[Dict[str, Any]]
+    replay_workload: List[Dict[str, Any]]
+    replay_clients: int
+    replay_duration: float
+    before_replay: Dict[str, Any]
+    after_replay: Dict[str, Any]
     results: str
     wind_up: str
-    proceed_cleanup: bool
\ No newline at end of file
+    proceed_cleanup: bool
+    # Journal session of the changes applied outside a sandbox; windup replays their inverses
+    undo_session: str
\ No newline at end of file
@@ -1,11 +1,27 @@
 import streamlit as st
+import hashlib
+import contextvars
+import json
 import logging
-from typing import Dict, Any
-from performer.performer import create_performer_graph
+import queue
+import threading
+import time
+from performer.performer import get_performer_graph
 from agentstate.agent_state import AgentState
-from utils.sql_utils import extract_sql_queries
+from utils.sql_utils import extract_sql_queries, extract_streaming_sql
 from sql.sql_agent import SQLAgent
-from tester.tester import create_tester_graph
+from sql.result_set import QueryResult
+from sql.workload import collect_workload
+from sql.budget import (
+    DEFAULT_PHASE_TIMEOUT_S, DEFAULT_STATEMENT_TIMEOUT_MS, EXECUTOR_PHASE_TIMEOUT_S,
+    EXECUTOR_STATEMENT_TIMEOUT_MS, Budget, cancel_run, cancel_token, reset_run,
+)
+from tester.replay import DEFAULT_CLIENTS
+from tester.sandbox import DEFAULT_SAMPLE_FRACTION, STRATEGIES
+from sql.undo_log import APPLIED, IRREVERSIBLE, UNDONE, UndoRecorder, format_rollback, get_journal, rollback, target_of
+from sql.validator import format_validation, invalid, validate_script
+from tester.tester import get_tester_graph
+from utils.telemetry import run_breakdown, start_metrics_server, trace_run
 from agentstate.agent_state import TestingState
 
 logging.basicConfig(
@@ -17,6 +33,16 @@ logging.basicConfig(
     ]
 )
 logger = logging.getLogger(__name__)
+# Prometheus endpoint on METRICS_PORT; started once per server process
+start_metrics_server()
+
+# Graph nodes whose LLM tokens are streamed into the report as they arrive
+STREAMED_NODES = ("analyze_database", "create_human_readable")
+RENDER_INTERVAL = 0.1
+# Rows of each executed statement kept in memory and shown in the UI
+PREVIEW_ROWS = 200
+# How often a blocked run hands control back to Streamlit so Cancel can interrupt it
+TICK_INTERVAL = 0.5
 
 st.set_page_config(page_title="DB Optimizer", layout="wide")
 st.title("PostgreSQL Database Optimization Assistant")
@@ -28,7 +54,47 @@ with st.sidebar:
     db_user = st.text_input("Username", value="postgres")
     db_password = st.text_input("Password", type="password", value="postgres")
     db_name = st.text_input("Database Name", value="ecommerce_db")
+    with st.expander("Session Settings"):
+        db_search_path = st.text_input("Search Path", value="")
+        db_statement_timeout = st.number_input("Statement Timeout (ms)", value=0, min_value=0, step=1000)
+    with st.expander("Query Budgets"):
+        test_statement_budget = st.number_input(
+            "Test statement budget (s)", value=DEFAULT_STATEMENT_TIMEOUT_MS / 1000, min_value=1.0, step=10.0
+        )
+        test_phase_budget = st.number_input(
+            "Test phase budget (s)", value=DEFAULT_PHASE_TIMEOUT_S, min_value=1.0, step=60.0
+        )
+        execute_statement_budget = st.number_input(
+            "Execute statement budget (s)", value=EXECUTOR_STATEMENT_TIMEOUT_MS / 1000, min_value=1.0, step=60.0
+        )
+    with st.expander("Test Sandbox"):
+        sandbox_strategy = st.selectbox(
+            "Sandbox", STRATEGIES,
+            help="schema: sampled copy in sandbox schemas; template: CREATE DATABASE ... TEMPLATE; "
+                 "off: test on the configured database itself"
+        )
+        sandbox_fraction = st.slider(
+            "Sample fraction of large tables", min_value=0.01, max_value=1.0, value=DEFAULT_SAMPLE_FRACTION
+        )
+        sandbox_template = st.text_input("Template database", value="", help="Defaults to the configured database")
+        sandbox_scale = st.number_input(
+            "Scale data (×)", value=1.0, min_value=1.0, step=1.0,
+            help="Grow the sandbox with synthetic rows that follow pg_stats distributions before testing"
+        )
+    with st.expander("Load Test"):
+        replay_duration = st.number_input(
+            "Concurrent replay (s)", value=0.0, min_value=0.0, step=5.0,
+            help="Replay the workload under concurrent load before and after the change; 0 disables it. "
+                 "Writes are rolled back but still take row locks"
+        )
+        replay_clients = st.number_input("Replay clients", value=DEFAULT_CLIENTS, min_value=1, step=1)
     test_connection = st.button("Test Connection")
+    telemetry_panel = st.container()
+    st.button(
+        "Cancel running queries",
+        on_click=lambda: cancel_run(st.session_state.get("running_run_id") or ""),
+        help="Cancels the statements of the test or execution in progress"
+    )
 
 db_config = {
     "host": db_host,
@@ -37,6 +103,11 @@ db_config = {
     "password": db_password,
     "database": db_name
 }
+# Session settings are applied by the connection pool to every connection it opens
+if db_search_path:
+    db_config["search_path"] = db_search_path
+if db_statement_timeout:
+    db_config["statement_timeout"] = int(db_statement_timeout)
 
 if test_connection:
     try:
@@ -53,12 +124,83 @@ query = st.text_area(
     placeholder="E.g.: 'Analyze query performance for slow orders report'",
     height=100
 )
+use_workload = st.checkbox(
+    "Focus on observed workload",
+    value=True,
+    help="Rank the statements that consume the most database time (pg_stat_statements, "
+         "or pg_stat_activity samples) and analyze those first"
+)
 
-if "thread_id" not in st.session_state:
-    st.session_state.thread_id = f"thread_{hash(frozenset(db_config.items()))}"
+def stable_id(*parts) -> str:
+    # hash() is salted per process; checkpoints must find their thread after a restart
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+# One analysis thread per database; the password does not identify the database
+st.session_state.thread_id = f"thread_{stable_id({k: v for k, v in db_config.items() if k != 'password'})}"
 if "analysis_history" not in st.session_state:
     st.session_state.analysis_history = []
 
+def start_run(run_id: str):
+    """Make run_id the run the Cancel button stops, clearing an earlier cancellation."""
+    reset_run(run_id)
+    st.session_state.running_run_id = run_id
+
+def run_cancellable(fn, tick):
+    """Run fn in a worker thread, calling tick() on this thread until it returns.
+
+    Streamlit acts on a button click only at the script's next st call, so
+    ticking keeps the Cancel button live while fn is blocked in the database.
+    """
+    outcome = {}
+
+    def work():
+        try:
+            outcome["value"] = fn()
+        except Exception as e:
+            outcome["error"] = e
+
+    # The worker's spans belong to the run traced on this thread
+    context = contextvars.copy_context()
+    worker = threading.Thread(target=context.run, args=(work,), daemon=True)
+    worker.start()
+    while worker.is_alive():
+        worker.join(TICK_INTERVAL)
+        tick()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("value")
+
+def remember_run(label: str, trace_id: str):
+    st.session_state.setdefault("telemetry_runs", []).append((label, trace_id))
+
+def display_telemetry():
+    """Sidebar breakdown of the latest run: graph nodes split into LLM and database time."""
+    runs = st.session_state.get("telemetry_runs")
+    if not runs:
+        return
+    label, trace_id = runs[-1]
+    breakdown = run_breakdown(trace_id)
+    if not breakdown["name"]:
+        return
+    with telemetry_panel.expander(f"Last run: {label}", expanded=False):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Total", f"{breakdown['total_ms'] / 1000:.1f}s")
+        col2.metric("LLM", f"{breakdown['llm_ms'] / 1000:.1f}s")
+        col3.metric("Database", f"{breakdown['db_ms'] / 1000:.1f}s")
+        st.caption(
+            f"{breakdown['llm_calls']} LLM calls ({breakdown['cache_hits']} cached), "
+            f"{breakdown['prompt_tokens']} prompt / {breakdown['completion_tokens']} completion tokens, "
+            f"{breakdown['statements']} statements, {breakdown['rows']} rows, "
+            f"{breakdown['connect_ms']:.0f} ms waiting for connections"
+        )
+        if breakdown["nodes"]:
+            st.dataframe(
+                [{"node": n["node"], "total ms": n["wall_ms"], "LLM ms": n["llm_ms"],
+                  "DB ms": n["db_ms"], "other ms": n["other_ms"]} for n in breakdown["nodes"]],
+                hide_index=True, use_container_width=True
+            )
+
 def initialize_agent():
     try:
         logger.info("Initializing SQL agent...")
@@ -73,7 +215,17 @@ def run_analysis():
     agent = initialize_agent()
     schema = agent.get_schema()
     
-    st.session_state.graph = create_performer_graph(db_config)
+    st.session_state.graph = get_performer_graph(db_config)
+
+    workload = []
+    if use_workload:
+        with st.spinner("Collecting workload statistics..."):
+            try:
+                workload = collect_workload(db_config)
+            except Exception as e:
+                st.warning(f"Workload collection failed: {str(e)}")
+                logger.warning(f"Workload collection error: {str(e)}")
+    st.session_state.workload = workload
     
     initial_state = AgentState(
         query=query,
@@ -83,28 +235,97 @@ def run_analysis():
         feedback="",
         execute=False,
         reanalyze=False,
+        analysis_rounds=[],
+        analysis_summary="",
         execute_query="",
-        mrk_down=""
+        mrk_down="",
+        workload=workload
     )
     
-    with st.status("Running optimization analysis...", expanded=True) as status:
+    stream_analysis(initial_state, "Running optimization analysis...")
+
+def stream_analysis(graph_input, label: str):
+    """Stream the performer graph from graph_input (None resumes the checkpointed thread)."""
+    graph = get_performer_graph(db_config)
+    with st.expander("Latest Optimization Report", expanded=True):
+        live_report = st.empty()
+        live_sql = st.empty()
+
+    with st.status(label, expanded=True) as status, \
+            trace_run("analysis", run_id=st.session_state.thread_id) as run:
+        remember_run("analysis", run.trace_id)
         try:
-            for event in st.session_state.graph.stream(
-                initial_state,
+            started = time.monotonic()
+            streamed = ""
+            last_render = 0.0
+            for mode, payload in graph.stream(
+                graph_input,
                 {"configurable": {"thread_id": st.session_state.thread_id}},
-                stream_mode="values"
+                stream_mode=["messages", "values"]
             ):
-                if "analysis" in event:
+                if mode == "messages":
+                    chunk, metadata = payload
+                    if metadata.get("langgraph_node") not in STREAMED_NODES or not chunk.content:
+                        continue
+                    if not streamed:
+                        logger.info(f"First token after {time.monotonic() - started:.2f}s")
+                    streamed += chunk.content
+                    if time.monotonic() - last_render >= RENDER_INTERVAL:
+                        render_partial_report(streamed, live_report, live_sql)
+                        last_render = time.monotonic()
+                    continue
+
+                event = payload
+                if event.get("analysis") and event["analysis"] not in st.session_state.analysis_history[-1:]:
                     st.session_state.analysis_history.append(event["analysis"])
                     status.write(f"Analysis iteration {len(st.session_state.analysis_history)} completed")
                     logger.info(f"New analysis generated: {event['analysis'][:50]}...")
+                    streamed = ""
             
+            live_report.empty()
+            live_sql.empty()
             status.update(label="Analysis complete!", state="complete", expanded=False)
         except Exception as e:
             st.error(f"Analysis pipeline failed: {str(e)}")
             logger.error(f"Graph stream error: {str(e)}")
             st.stop()
 
+def request_reanalysis():
+    """Feedback form: send the analyst's comments back to analyze_database for another round."""
+    if not st.session_state.analysis_history:
+        return
+
+    with st.form("analysis_feedback"):
+        feedback = st.text_area("Feedback on the latest analysis", height=100,
+                                placeholder="e.g. the orders table is write-heavy, avoid more indexes on it")
+        incremental = st.checkbox(
+            "Incremental",
+            value=True,
+            help="Send only the new feedback, a summary of earlier rounds and the tables it mentions"
+        )
+        if not st.form_submit_button("Re-analyze with feedback"):
+            return
+    if not feedback.strip():
+        st.warning("Please enter feedback for the next round")
+        return
+
+    config = {"configurable": {"thread_id": st.session_state.thread_id}}
+    try:
+        get_performer_graph(db_config).update_state(
+            config, {"feedback": feedback.strip(), "reanalyze": True, "incremental": incremental}
+        )
+    except Exception as e:
+        st.error(f"Could not resume the analysis: {str(e)}")
+        logger.error(f"Feedback update failed: {str(e)}")
+        return
+    stream_analysis(None, "Re-analyzing with feedback...")
+
+def render_partial_report(content: str, report_placeholder, sql_placeholder):
+    report_placeholder.markdown(content + " ▌")
+    complete, open_block = extract_streaming_sql(content)
+    if complete or open_block:
+        sql_placeholder.code("\n\n".join(complete + [open_block]), language="sql")
+
 def display_analysis():
     if not st.session_state.analysis_history:
         return
@@ -125,44 +346,106 @@ def run_performance_test(queries: str):
         agent = SQLAgent(db_config)
         schema = agent.get_schema()
         
-        test_graph = create_tester_graph()
+        test_graph = get_tester_graph(db_config)
         
         initial_test_state = TestingState(
+            db_config=db_config,
             schema=str(schema),
             execute_query=queries,
             before_exec="",
             after_exec="",
             results="",
-            wind_up=""
+            wind_up="",
+            replay_workload=st.session_state.get("workload") or []
         )
         
-        test_id = f"{schema}-{queries}"
-        test_thread_id = f"test_{hash(test_id)}"
+        test_thread_id = f"test_{stable_id(st.session_state.thread_id, queries)}"
+        start_run(test_thread_id)
+        initial_test_state.update(
+            run_id=test_thread_id,
+            statement_timeout_ms=int(test_statement_budget * 1000),
+            phase_timeout_s=float(test_phase_budget),
+            sandbox_strategy=sandbox_strategy,
+            sandbox_fraction=float(sandbox_fraction),
+            sandbox_template=sandbox_template or None,
+            sandbox_scale=float(sandbox_scale),
+            replay_duration=float(replay_duration),
+            replay_clients=int(replay_clients),
+        )
         
-        with st.status("Running performance tests...", expanded=True) as status:
+        with st.status("Running performance tests...", expanded=True) as status, \
+                trace_run("performance_test", run_id=test_thread_id) as run:
+            remember_run("performance test", run.trace_id)
             current_state = initial_test_state
-            
-            for event in test_graph.stream(
-                current_state,
-                {"configurable": {
-                    "thread_id": test_thread_id,
-                    "checkpoint_ns": "test_performance",
-                    "checkpoint_id": f"query_{hash(queries)}"
-                }},
-                stream_mode="values"
-            ):
+            events = queue.Queue()
+            waiting = st.empty()
+            started = time.monotonic()
+
+            def consume():
+                for event in test_graph.stream(
+                    current_state,
+                    {"configurable": {
+                        "thread_id": test_thread_id,
+                        "checkpoint_ns": "test_performance",
+                        "checkpoint_id": f"query_{hash(queries)}"
+                    }},
+                    stream_mode="values"
+                ):
+                    events.put(event)
+
+            def show_events():
+                waiting.caption(f"Running for {time.monotonic() - started:.0f}s")
+                while not events.empty():
+                    show_event(events.get())
+
+            def show_event(event):
+                if event.get("sandbox") and "sandbox" not in current_state:
+                    sandbox = event["sandbox"]
+                    sampled = f", {len(sandbox['sampled'])} sampled at {sandbox['fraction']:.0%}" if sandbox.get("sampled") else ""
+                    grown = f", grown {sandbox['scale']:g}× with {sandbox['generated_rows']} synthetic rows" if sandbox.get("scale") else ""
+                    status.write(f"🧪 Testing in sandbox {sandbox['name']} ({sandbox['strategy']}{sampled}{grown})")
+                    current_state.update(sandbox=sandbox)
                 if "before_exec" in event:
                     status.write("✅ Initial performance baseline established")
                     current_state.update(event)
                 if "after_exec" in event:
                     status.write("✅ Optimization impact measured")
                     current_state.update(event)
+                if "before_replay" in event and "before_replay" not in current_state:
+                    status.write("✅ Concurrent load baseline established")
+                    current_state.update(event)
+                if "after_replay" in event and "after_replay" not in current_state:
+                    status.write("✅ Concurrent load impact measured")
+                    current_state.update(event)
                 if "results" in event:
                     status.write("✅ Analysis complete")
                     st.markdown("### Performance Analysis")
                     st.markdown(event["results"])   
                     current_state.update(event)
-            
+                if event.get("plan_diffs") and "plan_diffs" not in current_state:
+                    with st.expander("Plan diff details"):
+                        for diff in event["plan_diffs"]:
+                            st.code(diff["query"], language="sql")
+                            st.json({k: v for k, v in diff.items() if k != "query"}, expanded=False)
+                    current_state.update(event)
+
+            run_cancellable(consume, show_events)
+            show_events()
+            waiting.empty()
+            if current_state.get("cancelled"):
+                status.update(label="Performance test cancelled", state="error")
+
+            # Without a sandbox the tested changes were applied to the configured
+            # database; resume the graph past human_in_loop so windup undoes them.
+            resume_config = {"configurable": {"thread_id": test_thread_id}}
+            tested = test_graph.get_state(resume_config)
+            if "human_in_loop" in tested.next and tested.values.get("undo_session") \
+                    and not tested.values.get("sandbox"):
+                test_graph.update_state(resume_config, {"proceed_cleanup": True})
+                for event in test_graph.stream(None, resume_config, stream_mode="values"):
+                    if event.get("wind_up"):
+                        status.write(f"🧹 Test changes rolled back:\n\n{event['wind_up']}")
+
             return current_state.get("results")
             
     except Exception as e:
@@ -180,6 +463,13 @@ def execute_queries():
     if not sql_queries:
         st.warning("No SQL queries found in the analysis")
         return
+
+    # Cached per statement and schema version, so reruns of the page are free
+    try:
+        for problem in invalid(validate_script(db_config, sql_queries)):
+            st.warning(f"Statement {problem['index']} (line {problem['line']}) will fail: {problem['error']}")
+    except Exception as e:
+        logger.warning(f"SQL validation unavailable: {str(e)}")
     
     with st.form("query_execution"):
         edited_queries = st.text_area(
@@ -187,6 +477,12 @@ def execute_queries():
             value=sql_queries,
             height=300
         )
+        online = st.checkbox(
+            "Online DDL (build indexes CONCURRENTLY, retry on lock timeouts)",
+            value=False,
+            help="Plain index builds no longer block writes, but each statement commits on its own: "
+                 "a failure halfway leaves the earlier statements applied"
+        )
         
         col1, col2 = st.columns(2)
         
@@ -204,27 +500,149 @@ def execute_queries():
             if "test_results" not in st.session_state:
                 st.warning("Please run performance tests before executing queries")
                 return
-                
+
             try:
+                problems = invalid(validate_script(db_config, edited_queries))
+                if problems:
+                    st.error("Fix the invalid statements before executing:\n\n" + format_validation(problems))
+                    return
                 agent = SQLAgent(db_config)
-                queries = [q.strip() for q in edited_queries.split(";") if q.strip()]
                 
-                with st.status("Executing SQL...") as status:
-                    for i, query in enumerate(queries, 1):
-                        try:
-                            st.write(f"**Query {i}:**")
-                            st.code(query, language="sql")
-                            result = agent.execute_query(query)
-                            st.json(result)
-                            st.success("Executed successfully")
-                            logger.info(f"Executed query {i}: {query[:50]}...")
-                        except Exception as e:
-                            st.error(f"Execution failed: {str(e)}")
-                            logger.error(f"Query {i} error: {str(e)}")
+                with st.status("Executing SQL...") as status, \
+                        trace_run("execute", run_id=st.session_state.thread_id) as run:
+                    remember_run("execute", run.trace_id)
+                    run_id = st.session_state.thread_id
+                    start_run(run_id)
+                    budget = Budget(
+                        statement_timeout_ms=int(execute_statement_budget * 1000),
+                        phase_timeout_s=EXECUTOR_PHASE_TIMEOUT_S,
+                        token=cancel_token(run_id),
+                    )
+                    progress_bar = st.progress(0.0, text="Executing...")
+                    latest = {}
+
+                    def show_progress():
+                        if latest:
+                            fraction = latest["progress"]["fraction"]
+                            progress_bar.progress(
+                                fraction if fraction is not None else 0.0,
+                                text=f"Query {latest['index']}: {latest['progress']['phase']}"
+                            )
+
+                    undo = UndoRecorder(db_config, run_id, source="executor")
+
+                    def execute():
+                        if online:
+                            return agent.execute_script(
+                                edited_queries, mode="online", max_rows=PREVIEW_ROWS, budget=budget, undo=undo,
+                                on_progress=lambda index, progress: latest.update(index=index, progress=progress)
+                            )
+                        # One connection and one commit; a failing statement is rolled
+                        # back to its savepoint without undoing the others.
+                        return agent.execute_script(edited_queries, mode="savepoint", max_rows=PREVIEW_ROWS,
+                                                    budget=budget, undo=undo)
+
+                    results = run_cancellable(execute, show_progress)
+                    progress_bar.empty()
+                    st.session_state.truncated_queries = {}
+                    for result in results:
+                        i = result["index"]
+                        st.write(f"**Query {i}:** ({result['elapsed_ms']} ms)")
+                        st.code(result["statement"], language="sql")
+                        if result.get("rewritten_from"):
+                            st.caption("Rewritten to run without blocking writes")
+                        if result.get("attempts", 1) > 1:
+                            st.caption(f"Acquired its lock after {result['attempts']} attempts")
+                        for name in result.get("cleaned_up", []):
+                            st.warning(f"Dropped invalid index {name} left by the failed build")
+                        if result["status"] == "ok":
+                            if result["columns"]:
+                                st.dataframe(
+                                    [dict(zip(result["columns"], row)) for row in result["rows"]],
+                                    use_container_width=True
+                                )
+                            if result["truncated"]:
+                                st.caption(f"Showing the first {len(result['rows'])} rows")
+                                st.session_state.truncated_queries[i] = result["statement"]
+                            st.success(f"Executed successfully ({result['rowcount']} rows)")
+                            logger.info(f"Executed query {i}: {result['statement'][:50]}...")
+                        elif result["status"] in ("timeout", "cancelled"):
+                            st.warning(f"{result['status'].capitalize()}: {result['error']}")
+                            logger.warning(f"Query {i} {result['status']}: {result['error']}")
+                        elif result["status"] in ("skipped", "rolled_back"):
+                            st.info(f"Not applied ({result['status'].replace('_', ' ')})")
+                        else:
+                            st.error(f"Execution failed: {result['error']}")
+                            logger.error(f"Query {i} error: {result['error']}")
             except Exception as e:
                 st.error(f"Execution setup failed: {str(e)}")
                 logger.error(f"Execution setup error: {str(e)}")
 
+def display_undo_journal():
+    """Changes executed in this session, with point-in-time rollback from the undo journal."""
+    try:
+        entries = get_journal().entries(st.session_state.thread_id, target_of(db_config))
+    except Exception as e:
+        logger.warning(f"Undo journal unavailable: {str(e)}")
+        return
+    applied = [e for e in entries if e["status"] in (APPLIED, IRREVERSIBLE)]
+    if not entries:
+        return
+
+    with st.expander(f"Undo Journal ({len(applied)} changes applied)", expanded=False):
+        for entry in entries:
+            st.caption(f"#{entry['id']} · {entry['status']} · "
+                       f"{time.strftime('%H:%M:%S', time.localtime(entry['recorded_at']))}")
+            st.code(entry["statement"], language="sql")
+            if entry["status"] == APPLIED:
+                st.code(f"-- undo\n{entry['inverse']}", language="sql")
+            elif entry["note"]:
+                st.caption(entry["note"])
+        if not applied:
+            return
+        points = {"Before the first change": 0}
+        points.update({f"After #{e['id']}: {' '.join(e['statement'].split())[:60]}": e["id"] for e in applied[:-1]})
+        point = st.selectbox("Roll back to", list(points))
+        if st.button("Roll back"):
+            with st.spinner("Replaying the undo journal..."):
+                try:
+                    results = rollback(db_config, st.session_state.thread_id, to_id=points[point])
+                except Exception as e:
+                    st.error(f"Rollback failed: {str(e)}")
+                    logger.error(f"Rollback error: {str(e)}")
+                    return
+            failed = [r for r in results if r["status"] == "error"]
+            (st.error if failed else st.success)(
+                f"Undid {sum(r['status'] == UNDONE for r in results)} of {len(results)} changes")
+            st.code(format_rollback(results))
+
+def display_row_counts():
+    """Offer full row counts for truncated results; each count runs only when asked for."""
+    for i, statement in st.session_state.get("truncated_queries", {}).items():
+        if st.button(f"Count all rows of query {i}", key=f"count_rows_{i}"):
+            try:
+                total = QueryResult(query=statement, truncated=True, db_config=db_config).total_count()
+                st.info(f"Query {i} returns {total} rows")
+            except Exception as e:
+                st.error(f"Row count failed: {str(e)}")
+
+def restore_session():
+    """Pick up the analysis checkpointed for this database by an earlier session."""
+    if st.session_state.analysis_history:
+        return
+    try:
+        snapshot = get_performer_graph(db_config).get_state(
+            {"configurable": {"thread_id": st.session_state.thread_id}}
+        )
+    except Exception as e:
+        logger.warning(f"Could not load checkpoint: {str(e)}")
+        return
+    if snapshot.values.get("analysis"):
+        st.session_state.analysis_history.append(snapshot.values["analysis"])
+        st.session_state.workload = snapshot.values.get("workload") or []
+        st.info("Restored the analysis from your previous session")
+        logger.info(f"Resumed thread {st.session_state.thread_id} at {snapshot.next}")
+
 if st.button("Start/Restart Analysis"):
     if not all(db_config.values()):
         st.error("Please fill all database credentials")
@@ -233,5 +651,10 @@ if st.button("Start/Restart Analysis"):
     else:
         run_analysis()
 
+restore_session()
+request_reanalysis()
 display_analysis()
-execute_queries()
\ No newline at end of file
+execute_queries()
+display_undo_journal()
+display_row_counts()
+display_telemetry()
\ No newline at end of file
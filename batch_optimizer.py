@@ -0,0 +1,347 @@
+"""Headless optimizer: run the performer and tester graphs over many databases.
+
+    python batch_optimizer.py manifest.json --workers 8 --output reports
+
+The manifest lists databases and the optimization requests to run on each:
+
+    {
+      "defaults": {"execute": false, "test": true, "max_concurrency": 1},
+      "databases": [
+        {"name": "shop", "db_config": {"host": "...", "database": "shop", "user": "...",
+                                       "password_env": "SHOP_PASSWORD"},
+         "requests": ["Analyze query performance for slow orders report"]}
+      ]
+    }
+
+human_in_loop is auto-approved: the first analysis is accepted, tested when
+"test" is set (the tester applies the changes to a sampled sandbox copy,
+measures, and drops it; see "sandbox_strategy") and applied for good only
+when "execute" is set, as one transaction unless "execution_mode" is "online".
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+
+logger = logging.getLogger("batch_optimizer")
+
+JOB_DEFAULTS = {
+    "execute": False,
+    # "online" builds indexes without blocking writes but commits statement by statement
+    "execution_mode": "transaction",
+    "test": True,
+    "proceed_cleanup": True,
+    "max_concurrency": 1,
+    "replay_duration": 0,
+    "use_workload": True,
+    "sandbox_strategy": "schema",
+    "sandbox_fraction": None,
+    "sandbox_template": None,
+    "sandbox_scale": None,
+}
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """Expand a manifest into one job per (database, request)."""
+    with open(path) as f:
+        manifest = json.load(f)
+    defaults = {**JOB_DEFAULTS, **manifest.get("defaults", {})}
+    jobs = []
+    for i, database in enumerate(manifest["databases"]):
+        db_config = dict(database["db_config"])
+        password_env = db_config.pop("password_env", None)
+        if password_env:
+            db_config["password"] = os.environ.get(password_env)
+            if db_config["password"] is None:
+                raise ValueError(f"Environment variable {password_env} is not set for database {i}")
+        name = database.get("name") or f"{db_config.get('host')}/{db_config.get('database')}"
+        options = {**defaults, **{k: v for k, v in database.items() if k in JOB_DEFAULTS}}
+        for request in database["requests"]:
+            jobs.append({"database": name, "db_config": db_config, "request": request, **options})
+    return jobs
+
+
+def _thread_id(job: Dict[str, Any]) -> str:
+    identity = {k: v for k, v in job["db_config"].items() if k != "password"}
+    payload = json.dumps([identity, job["request"]], sort_keys=True, default=str)
+    return f"batch_{hashlib.sha256(payload.encode()).hexdigest()[:16]}"
+
+
+def run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one request end to end in a worker process."""
+    # Imported here so the parent process never loads the graphs or opens connections
+    from performer.performer import get_performer_graph
+    from tester.tester import get_tester_graph
+    from sql.sql_agent import SQLAgent
+    from sql.workload import collect_workload
+    from agentstate.agent_state import AgentState, TestingState
+    from utils.telemetry import get_telemetry, run_breakdown, trace_run
+
+    started = time.monotonic()
+    report = {
+        "database": job["database"],
+        "request": job["request"],
+        "status": "ok",
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "error": None,
+    }
+    with trace_run("batch_job", **{"job.database": job["database"], "job.request": job["request"]}) as run:
+        db_config = job["db_config"]
+        try:
+            schema = SQLAgent(db_config).get_schema()
+            workload = []
+            if job["use_workload"]:
+                try:
+                    workload = collect_workload(db_config)
+                except Exception as e:
+                    logger.warning(f"Workload collection failed for {job['database']}: {str(e)}")
+
+            graph = get_performer_graph(db_config)
+            config = {"configurable": {"thread_id": _thread_id(job)}}
+            graph.invoke(AgentState(
+                query=job["request"],
+                schema=str(schema),
+                db_config=db_config,
+                analysis="",
+                feedback="",
+                execute=False,
+                reanalyze=False,
+                analysis_rounds=[],
+                analysis_summary="",
+                execute_query="",
+                mrk_down="",
+                workload=workload,
+            ), config)
+            state = graph.get_state(config).values
+            report.update({
+                "analysis": state.get("analysis"),
+                "diagnostics": state.get("diagnostics"),
+                "workload": [{k: v for k, v in w.items() if k != "plan"} for w in workload],
+            })
+
+            # Auto-approve: let the graph write the report and extract the SQL without executing it
+            graph.update_state(config, {"reanalyze": False, "execute": False})
+            graph.invoke(None, config)
+            state = graph.get_state(config).values
+            execute_query = state.get("execute_query") or ""
+            report.update({
+                "report": state.get("mrk_down"),
+                "execute_query": execute_query,
+                "validation": state.get("validation") or [],
+                "index_evaluation": state.get("index_evaluation") or [],
+            })
+
+            if job["test"] and execute_query:
+                tester = get_tester_graph(db_config)
+                test_config = {"configurable": {"thread_id": f"{config['configurable']['thread_id']}_test"}}
+                tester.invoke(TestingState(
+                    db_config=db_config,
+                    schema=str(schema),
+                    execute_query=execute_query,
+                    before_exec="",
+                    after_exec="",
+                    results="",
+                    wind_up="",
+                    replay_workload=workload,
+                    replay_duration=job["replay_duration"],
+                    sandbox_strategy=job["sandbox_strategy"],
+                    sandbox_fraction=job["sandbox_fraction"],
+                    sandbox_template=job["sandbox_template"],
+                    sandbox_scale=job["sandbox_scale"],
+                ), test_config)
+                tester.update_state(test_config, {"proceed_cleanup": job["proceed_cleanup"]})
+                tester.invoke(None, test_config)
+                test_state = tester.get_state(test_config).values
+                report["test"] = {
+                    "results": test_state.get("results"),
+                    "before_metrics": test_state.get("before_metrics"),
+                    "after_metrics": test_state.get("after_metrics"),
+                    "before_replay": test_state.get("before_replay"),
+                    "after_replay": test_state.get("after_replay"),
+                    "sandbox": test_state.get("sandbox"),
+                    "wind_up": test_state.get("wind_up"),
+                }
+
+            if job["execute"] and execute_query:
+                # Rerun only the executor, on exactly the SQL that was evaluated and tested
+                before_executor = next(s for s in graph.get_state_history(config) if s.next == ("sql_executor",))
+                approval = graph.update_state(before_executor.config,
+                                              {"execute": True, "execution_mode": job["execution_mode"]})
+                graph.invoke(None, approval)
+                results = graph.get_state(config).values.get("execution_results") or []
+                report["execution_results"] = results
+                report["execution_mode"] = job["execution_mode"]
+                # Journal session to pass to sql.undo_log.rollback to revert this job's changes
+                report["undo_session"] = graph.get_state(config).values.get("undo_session")
+                failed = [r for r in results if r["status"] in ("error", "timeout", "cancelled")]
+                if failed:
+                    report["status"] = "failed"
+                    report["error"] = f"{failed[0]['status']}: {failed[0]['error']}"
+        except Exception as e:
+            logger.error(f"Job failed for {job['database']}: {str(e)}")
+            report["status"] = "failed"
+            report["error"] = str(e)
+        finally:
+            # Pool workers exit without running atexit handlers
+            from utils.checkpointer import get_checkpointer
+            get_checkpointer().flush()
+
+    report["telemetry"] = run_breakdown(run.trace_id)
+    get_telemetry().flush()
+    report["elapsed_s"] = round(time.monotonic() - started, 3)
+    return report
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", text).strip("_")[:60] or "job"
+
+
+def write_job_report(report: Dict[str, Any], output: str, index: int):
+    base = os.path.join(output, _slug(report["database"]))
+    os.makedirs(base, exist_ok=True)
+    name = f"{index:03d}_{_slug(report['request'])}"
+    with open(os.path.join(base, f"{name}.json"), "w") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    lines = [
+        f"# {report['database']}: {report['request']}",
+        "",
+        f"Status: **{report['status']}** in {report['elapsed_s']}s",
+    ]
+    if report["error"]:
+        lines += ["", f"Error: `{report['error']}`"]
+    if report.get("report"):
+        lines += ["", report["report"]]
+    if report.get("test", {}).get("results"):
+        lines += ["", "## Performance Test", "", report["test"]["results"]]
+    if report.get("execution_mode"):
+        lines += ["", f"Executed in {report['execution_mode']} mode"]
+    for r in report.get("execution_results", []):
+        error = f" ({r['error'].splitlines()[0]})" if r.get("error") else ""
+        lines.append(f"- Statement {r['index']} {r['status']} in {r['elapsed_ms']} ms: `{r['statement'][:80]}`{error}")
+    with open(os.path.join(base, f"{name}.md"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def summarize(reports: List[Dict[str, Any]], wall_s: float) -> Dict[str, Any]:
+    per_db = defaultdict(lambda: {"jobs": 0, "ok": 0, "failed": 0, "busy_s": 0.0, "errors": []})
+    for r in reports:
+        db = per_db[r["database"]]
+        db["jobs"] += 1
+        db["ok" if r["status"] == "ok" else "failed"] += 1
+        db["busy_s"] = round(db["busy_s"] + r["elapsed_s"], 3)
+        if r["error"]:
+            db["errors"].append(r["error"])
+    failed = sum(1 for r in reports if r["status"] != "ok")
+    return {
+        "jobs": len(reports),
+        "ok": len(reports) - failed,
+        "failed": failed,
+        "wall_s": round(wall_s, 3),
+        "jobs_per_min": round(len(reports) / wall_s * 60, 2) if wall_s else 0.0,
+        "databases": dict(per_db),
+    }
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    lines = [
+        "# Batch summary",
+        "",
+        f"{summary['jobs']} jobs ({summary['ok']} ok, {summary['failed']} failed) in {summary['wall_s']}s, "
+        f"{summary['jobs_per_min']} jobs/min",
+        "",
+        "| Database | Jobs | OK | Failed | Busy (s) | Jobs/min | First error |",
+        "|----------|-----|-----|-----|-----|-----|-----|",
+    ]
+    for name, db in sorted(summary["databases"].items()):
+        rate = round(db["jobs"] / db["busy_s"] * 60, 2) if db["busy_s"] else 0.0
+        error = db["errors"][0].splitlines()[0][:80].replace("|", "\\|") if db["errors"] else ""
+        lines.append(f"| {name} | {db['jobs']} | {db['ok']} | {db['failed']} | {db['busy_s']} | {rate} | {error} |")
+    return "\n".join(lines)
+
+
+def run_batch(jobs: List[Dict[str, Any]], workers: int, output: str) -> Dict[str, Any]:
+    """Fan jobs out over a process pool, never running more than a database's
+    max_concurrency jobs against it at the same time."""
+    os.makedirs(output, exist_ok=True)
+    pending = defaultdict(deque)
+    for index, job in enumerate(jobs, 1):
+        pending[job["database"]].append((index, job))
+    running = defaultdict(int)
+    reports = []
+    started = time.monotonic()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+
+        def schedule():
+            # Round-robin over databases so one large database does not hold every worker
+            progress = True
+            while progress and len(futures) < workers:
+                progress = False
+                for database, queue in pending.items():
+                    if queue and running[database] < queue[0][1]["max_concurrency"] and len(futures) < workers:
+                        index, job = queue.popleft()
+                        futures[pool.submit(run_job, job)] = (index, job)
+                        running[database] += 1
+                        progress = True
+
+        schedule()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, job = futures.pop(future)
+                running[job["database"]] -= 1
+                try:
+                    report = future.result()
+                except Exception as e:
+                    # The worker process itself died
+                    report = {"database": job["database"], "request": job["request"], "status": "failed",
+                              "error": str(e), "elapsed_s": 0.0}
+                reports.append(report)
+                write_job_report(report, output, index)
+                logger.info(f"[{len(reports)}/{len(jobs)}] {job['database']}: {report['status']} "
+                            f"in {report['elapsed_s']}s")
+            schedule()
+
+    summary = summarize(reports, time.monotonic() - started)
+    with open(os.path.join(output, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2, default=str)
+    with open(os.path.join(output, "summary.md"), "w") as f:
+        f.write(format_summary(summary) + "\n")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the optimizer over every database in a manifest")
+    parser.add_argument("manifest", help="JSON manifest of databases and requests")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="worker processes")
+    parser.add_argument("--output", default="reports", help="directory for JSON/Markdown reports")
+    parser.add_argument("--max-per-db", type=int, help="override max_concurrency for every database")
+    parser.add_argument("--execute", action="store_true", help="apply the recommended SQL")
+    parser.add_argument("--no-test", action="store_true", help="skip the tester graph")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    jobs = load_manifest(args.manifest)
+    for job in jobs:
+        if args.max_per_db:
+            job["max_concurrency"] = args.max_per_db
+        job["execute"] = job["execute"] or args.execute
+        job["test"] = job["test"] and not args.no_test
+
+    summary = run_batch(jobs, args.workers, args.output)
+    print(format_summary(summary))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
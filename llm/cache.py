@@ -0,0 +1,240 @@
+# cache.py
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from langchain_core.callbacks import CallbackManager
+from langchain_core.messages import (
+    AIMessage, AIMessageChunk, BaseMessage, BaseMessageChunk,
+    convert_to_messages, messages_from_dict, messages_to_dict,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, LLMResult
+from langchain_core.runnables import ensure_config
+from utils.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = ".llm_cache.sqlite"
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 2000
+
+# Generation parameters that change the response and therefore belong in the key.
+KEY_PARAMS = ("temperature", "top_p", "max_tokens", "seed", "stop")
+
+_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+
+class LLMCache:
+    """On-disk response cache with TTL expiry and size-bounded LRU eviction."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                db.commit()
+                self.misses += 1
+                return None
+            db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            db.commit()
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: str, model: str = None):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, model, value, now, now),
+            )
+            count = db.execute("SELECT count(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db().execute("DELETE FROM responses")
+            self._db().commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._db().execute("SELECT count(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": entries,
+        }
+
+
+@contextmanager
+def bypass_cache():
+    """Skip cache lookups and writes for calls made inside this block."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def token_usage(message: BaseMessage) -> Dict[str, Optional[int]]:
+    """Prompt/completion token counts reported with a response, when the provider reports them."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage:
+        return {"prompt": usage.get("input_tokens"), "completion": usage.get("output_tokens")}
+    usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return {"prompt": usage.get("prompt_tokens"), "completion": usage.get("completion_tokens")}
+
+
+def _normalize(content: Any) -> Any:
+    if isinstance(content, str):
+        # Prompts are built from indented f-strings; whitespace differences do
+        # not change the meaning of the request.
+        return " ".join(content.split())
+    return content
+
+
+class CachedChatModel:
+    """Wraps a chat model so invoke() is served from an LLMCache when possible.
+
+    Every other attribute is delegated to the wrapped model.
+    """
+
+    def __init__(self, model, cache: LLMCache, enabled: bool = True):
+        self.model = model
+        self.cache = cache
+        self.enabled = enabled and os.environ.get("LLM_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.model, "model_name", None) or getattr(self.model, "model", None) or type(self.model).__name__
+
+    def cache_key(self, messages: List[BaseMessage], **kwargs) -> str:
+        params = {p: getattr(self.model, p, None) for p in KEY_PARAMS}
+        params.update({k: v for k, v in kwargs.items() if k in KEY_PARAMS})
+        payload = {
+            "model": self.model_name,
+            "params": params,
+            "messages": [(m.type, _normalize(m.content)) for m in messages],
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def _messages(input) -> List[BaseMessage]:
+        return convert_to_messages(input) if not isinstance(input, str) else convert_to_messages([input])
+
+    def _lookup(self, input, **kwargs):
+        key = self.cache_key(self._messages(input), **kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.debug(f"LLM cache hit for {self.model_name}")
+            return key, messages_from_dict(json.loads(cached))[0]
+        return key, None
+
+    def _report_hit(self, input, config, response: BaseMessage) -> BaseMessage:
+        """Run the model callbacks for a cached response as the model would for a
+        fresh one, so graph streams (stream_mode="messages") still see it."""
+        config = ensure_config(config)
+        manager = CallbackManager.configure(config.get("callbacks"), None, False, config.get("tags"), None,
+                                            config.get("metadata"), None)
+        run = manager.on_chat_model_start({"name": self.model_name}, [self._messages(input)],
+                                          name=config.get("run_name"))[0]
+        response = AIMessage(content=response.content, response_metadata=response.response_metadata,
+                             id=f"lc_run--{run.run_id}")
+        chunk = AIMessageChunk(content=response.content, response_metadata=response.response_metadata,
+                               id=response.id)
+        run.on_llm_new_token(response.content, chunk=ChatGenerationChunk(message=chunk))
+        run.on_llm_end(LLMResult(generations=[[ChatGeneration(message=response)]]))
+        return response
+
+    def invoke(self, input, config=None, **kwargs):
+        with span("llm.invoke", "llm", **{"llm.model": self.model_name, "llm.cache_hit": False}) as call:
+            if not self.enabled or _bypass.get():
+                response = self.model.invoke(input, config, **kwargs)
+            else:
+                key, response = self._lookup(input, **kwargs)
+                if response is not None:
+                    call.set(**{"llm.cache_hit": True})
+                    return self._report_hit(input, config, response)
+                response = self.model.invoke(input, config, **kwargs)
+                if response.content:
+                    self.cache.put(key, json.dumps(messages_to_dict([response])), self.model_name)
+            usage = token_usage(response)
+            call.set(**{"llm.prompt_tokens": usage["prompt"], "llm.completion_tokens": usage["completion"]})
+            return response
+
+    def stream(self, input, config=None, **kwargs) -> Iterator[BaseMessageChunk]:
+        with span("llm.stream", "llm", activate=False, **{"llm.model": self.model_name, "llm.cache_hit": False}) as call:
+            if not self.enabled or _bypass.get():
+                key = None
+            else:
+                key, cached = self._lookup(input, **kwargs)
+                if cached is not None:
+                    call.set(**{"llm.cache_hit": True})
+                    cached = self._report_hit(input, config, cached)
+                    yield AIMessageChunk(content=cached.content, response_metadata=cached.response_metadata,
+                                         id=cached.id)
+                    return
+
+            response = None
+            for chunk in self.model.stream(input, config, **kwargs):
+                if response is None:
+                    call.set(**{"llm.first_token_ms": round(call.duration_ms, 1)})
+                response = chunk if response is None else response + chunk
+                yield chunk
+            if response is not None:
+                usage = token_usage(response)
+                call.set(**{"llm.prompt_tokens": usage["prompt"], "llm.completion_tokens": usage["completion"]})
+            if key and response is not None and response.content:
+                message = AIMessage(content=response.content, response_metadata=response.response_metadata)
+                self.cache.put(key, json.dumps(messages_to_dict([message])), self.model_name)
+
+    def __getattr__(self, name):
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
@@ -1,20 +1,11 @@
-from langchain_groq import ChatGroq as Groq
-from langchain_ollama import ChatOllama as Ollama # Use this for testing purpose only
-import dotenv
+from llm.registry import LazyChatModel
 
 
-llm = Groq (
-    # temperature=0.1,
-    model_name=dotenv.get_key(".env", "GROQ_MODEL"),
-    groq_api_key=dotenv.get_key(".env", "GROQ_API_KEY") 
-)
+# Clients are created, and their provider SDK imported, on first use.
+# LLM_PROVIDER selects the provider of llm/analyze_llm (default: groq); the
+# analyzing model is ANALYZING_MODEL for groq and <PROVIDER>_ANALYZING_MODEL otherwise.
+llm = LazyChatModel()
 
-analyze_llm = Groq (
-    # temperature=0.1,
-    model_name=dotenv.get_key(".env", "ANALYZING_MODEL"),
-    groq_api_key=dotenv.get_key(".env", "GROQ_API_KEY") 
-)
+analyze_llm = LazyChatModel(role="analyzing")
 
-ollama_llm = Ollama(
-    model=dotenv.get_key(".env", "OLLAMA_MODEL"),
-)
\ No newline at end of file
+ollama_llm = LazyChatModel(provider="ollama")  # Use this for testing purpose only
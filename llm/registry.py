@@ -0,0 +1,122 @@
+# registry.py
+import functools
+import importlib
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+import dotenv
+from llm.cache import CachedChatModel, LLMCache
+
+logger = logging.getLogger(__name__)
+
+ENV_FILE = ".env"
+DEFAULT_PROVIDER = "groq"
+
+# Shared on-disk response cache; set LLM_CACHE_DISABLED=1 to bypass it
+response_cache = LLMCache()
+
+_providers: Dict[str, Callable[..., Any]] = {}
+# Setting naming the model a provider uses for a role, e.g. the analyzing model
+_role_settings: Dict[str, Dict[str, str]] = {}
+_clients: Dict[tuple, CachedChatModel] = {}
+_clients_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _dotenv() -> Dict[str, Optional[str]]:
+    return dotenv.dotenv_values(ENV_FILE)
+
+
+def setting(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Value of a setting from the environment or, failing that, the .env file (read once)."""
+    return os.environ.get(name) or _dotenv().get(name) or default
+
+
+def register_provider(name: str, factory: Callable[..., Any], roles: Optional[Dict[str, str]] = None):
+    """Register factory(model, **params) -> chat model under name.
+
+    The factory should import its SDK itself so unused providers are never imported.
+    roles maps a role such as "analyzing" to the setting naming its model;
+    roles left out are read from <NAME>_<ROLE>_MODEL.
+    """
+    _providers[name] = factory
+    _role_settings[name] = dict(roles or {})
+
+
+def role_model(provider: str, role: str) -> Optional[str]:
+    """Model configured for role under provider; None means the provider's default model."""
+    name = _role_settings.get(provider, {}).get(role)
+    if name is None and provider.isidentifier():
+        name = f"{provider.upper()}_{role.upper()}_MODEL"
+    return setting(name) if name else None
+
+
+def _groq(model: Optional[str], **params):
+    from langchain_groq import ChatGroq
+    params.setdefault("groq_api_key", setting("GROQ_API_KEY"))
+    params.setdefault("streaming", True)
+    return ChatGroq(model_name=model or setting("GROQ_MODEL"), **params)
+
+
+def _ollama(model: Optional[str], **params):
+    from langchain_ollama import ChatOllama
+    return ChatOllama(model=model or setting("OLLAMA_MODEL"), **params)
+
+
+def _import_path(path: str) -> Callable[..., Any]:
+    # "package.module:ClassName" providers configured without code changes
+    module, _, attr = path.partition(":")
+
+    def factory(model: Optional[str], **params):
+        cls = getattr(importlib.import_module(module), attr)
+        return cls(model=model, **params)
+    return factory
+
+
+register_provider("groq", _groq, roles={"analyzing": "ANALYZING_MODEL"})
+register_provider("ollama", _ollama)
+
+
+def get_llm(provider: Optional[str] = None, model: Optional[str] = None, cached: bool = True,
+            **params) -> CachedChatModel:
+    """Chat model for (provider, model, params), created on first request and reused afterwards."""
+    provider = provider or setting("LLM_PROVIDER", DEFAULT_PROVIDER)
+    key = (provider, model, tuple(sorted((k, repr(v)) for k, v in params.items())), cached)
+    with _clients_lock:
+        if key not in _clients:
+            factory = _providers.get(provider) or (_import_path(provider) if ":" in provider else None)
+            if factory is None:
+                raise ValueError(f"Unknown LLM provider: {provider}")
+            _clients[key] = CachedChatModel(factory(model, **params), response_cache, enabled=cached)
+            logger.info(f"Created {provider} client for {_clients[key].model_name}")
+        return _clients[key]
+
+
+class LazyChatModel:
+    """Module-level stand-in for a chat model that is resolved through the
+    registry the first time it is used."""
+
+    def __init__(self, provider: Optional[str] = None, role: Optional[str] = None, **params):
+        self._provider = provider
+        self._role = role
+        self._params = params
+        self._model = None
+
+    def resolve(self) -> CachedChatModel:
+        if self._model is None:
+            provider = self._provider or setting("LLM_PROVIDER", DEFAULT_PROVIDER)
+            model = role_model(provider, self._role) if self._role else None
+            self._model = get_llm(provider, model, **self._params)
+        return self._model
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.resolve().invoke(input, config, **kwargs)
+
+    def stream(self, input, config=None, **kwargs):
+        return self.resolve().stream(input, config, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
@@ -1,40 +1,159 @@
 from langgraph.graph import StateGraph, END, START
-from langgraph.checkpoint.memory import MemorySaver
 from agentstate.agent_state import AgentState
 from langchain_core.messages import SystemMessage, HumanMessage
 from llm.llm import llm  # Make sure this is imported properly
-from utils.sql_utils import extract_sql_queries
+from utils.sql_utils import extract_sql_queries, is_explainable, split_sql_statements
 from sql.sql_agent import SQLAgent
+from sql.budget import EXECUTOR_PHASE_TIMEOUT_S, EXECUTOR_STATEMENT_TIMEOUT_MS, Budget
+from sql.whatif import evaluate_index_candidates, format_evaluation, is_index_ddl
+from sql.diagnostics import run_diagnostics
+from sql.workload import format_workload, workload_targets
+from sql.index_advisor import advice_report, advise_indexes, format_advice
+from utils.schema_context import (DEFAULT_SLICE_TOKEN_BUDGET, DEFAULT_TOKEN_BUDGET, estimate_tokens,
+                                  load_schema_context, load_schema_slice)
+from utils.analysis_memory import add_round, feedback_delta, render_summary
 from typing import Literal
 from langgraph.types import Command
+from sql.pool import pool_key
+from sql.undo_log import UndoRecorder
+from sql.validator import format_validation, invalid, validate_script
+from utils.checkpointer import get_checkpointer
+from utils.telemetry import traced_node
 import logging
+import threading
+import uuid
 
 logger = logging.getLogger(__name__)
 
-def create_performer_graph(db_config: dict):
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+# Identical on every call so provider-side prompt caching can reuse the prefix;
+# everything that varies between calls goes into later messages.
+ANALYST_INSTRUCTIONS = """You are a database optimization expert. Analyze the PostgreSQL schema and provide optimization suggestions.
+Put every recommended change in a ```sql code block.
+End your answer with a "## Decision summary" section: at most 6 short bullets listing the changes you
+recommend and any earlier recommendation you withdrew, with the reason in a few words."""
+
+ANALYSIS_TASK = "Provide specific optimization recommendations including indexes, query improvements, and schema changes."
+
+REVISION_TASK = ("Revise your recommendations to address the new feedback. Give the complete revised set of "
+                 "recommendations, not only the changes, and keep earlier decisions the feedback does not touch.")
+
+
+def _prompt_tokens(messages) -> int:
+    return sum(estimate_tokens(m.content) for m in messages)
+
+
+def create_performer_graph(db_config: dict, checkpointer=None):
     logger.info("Creating optimization performer graph...")
     
     builder = StateGraph(AgentState)
 
     def analyze_database(state: AgentState):
         logger.debug("Starting database analysis...")
+
+        rounds = state.get("analysis_rounds") or []
+        feedback = state.get("feedback") or ""
+        if rounds and state.get("reanalyze") and state.get("incremental", True):
+            return revise_analysis(state, rounds, feedback)
+
+        diagnostics = state.get("diagnostics")
+        if not diagnostics:
+            try:
+                diagnostics = run_diagnostics(state.get("db_config") or db_config).to_prompt()
+            except Exception as e:
+                logger.warning(f"Diagnostic sweep failed: {str(e)}")
+                diagnostics = "Diagnostics unavailable"
         
-        system_prompt = SystemMessage(content=f"""
-        You are a database optimization expert. Analyze the PostgreSQL schema and provide optimization suggestions.
-        Schema: {state['schema']}
-        User Query: {state['query']}
-        Previous Feedback: {state.get('feedback', '')}
-        """)
-        
-        user_message = HumanMessage(content="Provide specific optimization recommendations including indexes, query improvements, and schema changes.")
+        schema = state['schema']
+        tokens_saved = 0
+        try:
+            context = load_schema_context(
+                state.get("db_config") or db_config,
+                state["query"],
+                state.get("schema_token_budget") or DEFAULT_TOKEN_BUDGET,
+            )
+            schema, tokens_saved = context.text, context.tokens_saved
+            logger.info(f"Schema context: {context.tokens} tokens for {len(context.tables_included)} tables "
+                        f"({len(context.tables_omitted)} omitted, {tokens_saved} tokens saved)")
+        except Exception as e:
+            logger.warning(f"Schema context unavailable, sending full schema: {str(e)}")
+
+        workload = state.get("workload") or []
+        workload_text = ""
+        if workload:
+            workload_text = ("Observed workload (top statements by database time, focus on these):\n"
+                             + format_workload(workload))
+
+        advice = state.get("index_advice")
+        if advice is None:
+            try:
+                queries = list(state.get("target_queries") or []) + workload_targets(workload)
+                advice = advise_indexes(state.get("db_config") or db_config, queries)
+            except Exception as e:
+                logger.warning(f"Index advisor failed: {str(e)}")
+                advice = []
+        advice_text = ""
+        if advice:
+            advice_text = ("Index advisor findings from Postgres statistics (facts, scored 0-100; "
+                           "confirm or refine them):\n" + format_advice(advice))
+
+        context_message = HumanMessage(content="\n\n".join(part for part in (
+            f"Schema: {schema}", diagnostics, workload_text, advice_text) if part))
+        task = ANALYSIS_TASK + (f"\nPrevious Feedback: {feedback}" if feedback else "")
+        # Most to least stable: the schema and diagnostics are shared by every request
+        # against this database, so they sit ahead of the request in the cached prefix
+        messages = [SystemMessage(content=ANALYST_INSTRUCTIONS), context_message,
+                    HumanMessage(content=f"Optimization request: {state['query']}"),
+                    HumanMessage(content=task)]
+        logger.info(f"Full analysis prompt: ~{_prompt_tokens(messages)} tokens")
         
         try:
-            response = llm.invoke([system_prompt, user_message])
+            response = llm.invoke(messages)
             logger.info("Successfully generated analysis")
-            return {"analysis": response.content}
+            rounds = add_round(rounds, feedback, response.content)
+            return {"analysis": response.content, "diagnostics": diagnostics, "schema_tokens_saved": tokens_saved,
+                    "index_advice": advice, "analysis_rounds": rounds, "analysis_summary": render_summary(rounds)}
         except Exception as e:
             logger.error(f"Analysis failed: {str(e)}")
-            return {"analysis": "Error in analysis generation"}
+            if advice:
+                logger.info("Falling back to the index advisor report")
+                return {"analysis": advice_report(advice), "diagnostics": diagnostics, "index_advice": advice}
+            return {"analysis": "Error in analysis generation", "diagnostics": diagnostics, "index_advice": advice}
+
+    def revise_analysis(state: AgentState, rounds: list, feedback: str):
+        """Feedback round: the running summary, the new feedback and only the tables it mentions."""
+        delta = feedback_delta(rounds, feedback)
+        schema_slice = ""
+        if delta:
+            try:
+                context = load_schema_slice(state.get("db_config") or db_config, delta, DEFAULT_SLICE_TOKEN_BUDGET)
+                schema_slice = context.text
+                logger.debug(f"Schema slice for feedback: {context.tables_included}")
+            except Exception as e:
+                logger.warning(f"Schema slice unavailable: {str(e)}")
+
+        parts = [render_summary(rounds)]
+        if schema_slice:
+            parts.append(f"Tables referenced by the feedback:\n{schema_slice}")
+        parts.append(f"New feedback: {delta}" if delta else "No new feedback: re-check the current recommendations.")
+        messages = [SystemMessage(content=ANALYST_INSTRUCTIONS),
+                    HumanMessage(content=f"Optimization request: {state['query']}"),
+                    HumanMessage(content="\n\n".join(parts)),
+                    HumanMessage(content=REVISION_TASK)]
+        logger.info(f"Incremental analysis prompt (round {len(rounds) + 1}): ~{_prompt_tokens(messages)} tokens")
+
+        try:
+            response = llm.invoke(messages)
+            logger.info("Successfully revised analysis")
+            rounds = add_round(rounds, delta, response.content)
+            return {"analysis": response.content, "analysis_rounds": rounds,
+                    "analysis_summary": render_summary(rounds)}
+        except Exception as e:
+            logger.error(f"Incremental analysis failed: {str(e)}")
+            # Keep the previous round's analysis rather than replacing it with an error
+            return {"analysis": state.get("analysis") or "Error in analysis generation"}
 
     def human_in_loop(state: AgentState):
         logger.info("Requesting human feedback...")
@@ -53,39 +172,110 @@ def create_performer_graph(db_config: dict):
         try:
             response = llm.invoke([system_prompt, user_message])
             sql_queries = extract_sql_queries(response.content)
-            logger.info(f"Extracted {len(sql_queries.split(';'))} SQL queries")
+            logger.info(f"Extracted {len(split_sql_statements(sql_queries))} SQL queries")
             return {
                 "mrk_down": response.content,
                 "execute_query": sql_queries
             }
         except Exception as e:
             logger.error(f"Report generation failed: {str(e)}")
+            sql_queries = extract_sql_queries(state["analysis"])
+            if sql_queries:
+                # The analysis is already markdown when it came from the index advisor
+                return {"mrk_down": state["analysis"], "execute_query": sql_queries}
             return {"mrk_down": "Error generating report", "execute_query": ""}
 
-    def sql_executor(state: AgentState) -> Command[Literal["sql_executor", END]]: # type: ignore
+    def validate_sql(state: AgentState):
+        logger.debug("Validating extracted SQL...")
+
+        try:
+            validation = validate_script(state.get("db_config") or db_config, state.get("execute_query", ""))
+        except Exception as e:
+            logger.error(f"SQL validation failed: {str(e)}")
+            return {"validation": []}
+        if invalid(validation):
+            logger.warning(f"Invalid SQL in the recommendations:\n{format_validation(validation)}")
+        return {"validation": validation}
+
+    def evaluate_indexes(state: AgentState):
+        logger.debug("Evaluating candidate indexes...")
+
+        statements = split_sql_statements(state.get("execute_query", ""))
+        rejected = {r["statement"] for r in invalid(state.get("validation") or [])}
+        candidates = [q for q in statements if is_index_ddl(q) and q.strip().rstrip(";") not in rejected]
+        targets = (list(state.get("target_queries") or []) + workload_targets(state.get("workload") or [])
+                   + [q for q in statements if is_explainable(q)])
+        targets = list(dict.fromkeys(q for q in targets if q.strip().rstrip(";") not in rejected))
+        if not candidates or not targets:
+            logger.info("No candidate indexes or target queries to evaluate")
+            return {"index_evaluation": []}
+
+        try:
+            evaluation = evaluate_index_candidates(state.get("db_config") or db_config, candidates, targets)
+            logger.info(f"Ranked {len(evaluation)} candidate indexes:\n{format_evaluation(evaluation)}")
+            return {"index_evaluation": evaluation}
+        except Exception as e:
+            logger.error(f"Index evaluation failed: {str(e)}")
+            return {"index_evaluation": []}
+
+    def sql_executor(state: AgentState) -> Command[Literal[END]]: # type: ignore
         logger.info("Executing SQL queries...")
         
         if not state.get("execute_query"):
             logger.warning("No SQL queries to execute")
-            return END
+            return Command(goto=END)
+
+        if not state.get("execute", False):
+            logger.info("Execution not authorized, skipping...")
+            return Command(goto=END)
             
+        # Every committed statement is journaled with its inverse under the run's session
+        session = state.get("undo_session") or state.get("run_id") or f"executor_{uuid.uuid4().hex[:12]}"
         try:
-            sql_agent = SQLAgent(db_config=state["db_config"])
-            for query in state["execute_query"].split(";"):
-                query = query.strip()
-                if query:
-                    logger.info(f"Executing: {query[:50]}...")
-                    sql_agent.execute_query(query)
-            logger.info("All SQL queries executed successfully")
-            return END
+            config = state.get("db_config") or db_config
+            # Cached from validate_sql unless the statements or the schema changed since
+            problems = invalid(validate_script(config, state["execute_query"]))
+            if problems:
+                logger.error(f"Not executing invalid SQL:\n{format_validation(problems)}")
+                return Command(goto=END, update={"execution_results": [
+                    {"index": p["index"], "statement": p["statement"], "status": "error", "rowcount": None,
+                     "elapsed_ms": None, "error": f"Validation failed at line {p['line']}: {p['error']}"}
+                    for p in problems
+                ]})
+            sql_agent = SQLAgent(db_config=config)
+            undo = UndoRecorder(config, session, source="executor")
+            # "transaction" applies the script atomically; "online" (opt-in) builds indexes
+            # CONCURRENTLY but commits statement by statement, so a failure leaves earlier ones applied
+            mode = state.get("execution_mode") or "transaction"
+            budget = Budget.from_state(state, EXECUTOR_STATEMENT_TIMEOUT_MS, EXECUTOR_PHASE_TIMEOUT_S)
+            results = sql_agent.execute_script(state["execute_query"], mode=mode, budget=budget, undo=undo)
+            for result in results:
+                logger.info(f"Statement {result['index']} {result['status']} in {result['elapsed_ms']} ms: {result['statement'][:50]}...")
+            update = {"execution_results": [{k: v for k, v in r.items() if k != "rows"} for r in results],
+                      "undo_session": session}
+            if any(r["status"] in ("error", "timeout", "cancelled") for r in results):
+                # Rerunning the same statements would fail the same way, so stop here.
+                # In transaction mode the whole batch was rolled back; online mode
+                # keeps the statements that succeeded and drops invalid indexes.
+                logger.error(f"SQL execution failed ({mode} mode)")
+            else:
+                logger.info("All SQL queries executed successfully")
+            return Command(goto=END, update=update)
         except Exception as e:
+            # Statements before the failure may have committed; running the script
+            # again would apply them twice, so report and stop.
             logger.error(f"SQL execution failed: {str(e)}")
-            return "sql_executor"
+            return Command(goto=END, update={"undo_session": session, "execution_results": [
+                {"index": None, "statement": state["execute_query"], "status": "error", "rowcount": None,
+                 "elapsed_ms": None, "error": str(e)}
+            ]})
 
-    builder.add_node("analyze_database", analyze_database)
-    builder.add_node("human_in_loop", human_in_loop)
-    builder.add_node("create_human_readable", create_human_readable)
-    builder.add_node("sql_executor", sql_executor)
+    builder.add_node("analyze_database", traced_node("performer", "analyze_database", analyze_database))
+    builder.add_node("human_in_loop", traced_node("performer", "human_in_loop", human_in_loop))
+    builder.add_node("create_human_readable", traced_node("performer", "create_human_readable", create_human_readable))
+    builder.add_node("validate_sql", traced_node("performer", "validate_sql", validate_sql))
+    builder.add_node("evaluate_indexes", traced_node("performer", "evaluate_indexes", evaluate_indexes))
+    builder.add_node("sql_executor", traced_node("performer", "sql_executor", sql_executor))
 
     builder.add_edge(START, "analyze_database")
     builder.add_edge("analyze_database", "human_in_loop")
@@ -94,9 +284,20 @@ def create_performer_graph(db_config: dict):
         lambda s: "analyze_database" if s.get("reanalyze", False) else "create_human_readable",
         {"analyze_database", "create_human_readable"}
     )
-    builder.add_edge("create_human_readable", "sql_executor")
+    builder.add_edge("create_human_readable", "validate_sql")
+    builder.add_edge("validate_sql", "evaluate_indexes")
+    builder.add_edge("evaluate_indexes", "sql_executor")
 
     return builder.compile(
         interrupt_before=['human_in_loop'],
-        checkpointer=MemorySaver()
-    )
\ No newline at end of file
+        checkpointer=checkpointer or get_checkpointer()
+    )
+
+
+def get_performer_graph(db_config: dict):
+    """Compiled performer graph for db_config, built once per process."""
+    key = pool_key(db_config)
+    with _graphs_lock:
+        if key not in _graphs:
+            _graphs[key] = create_performer_graph(db_config)
+        return _graphs[key]
@@ -0,0 +1,185 @@
+# budget.py
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+import psycopg2
+from psycopg2 import errors, extensions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATEMENT_TIMEOUT_MS = 60000
+DEFAULT_PHASE_TIMEOUT_S = 600.0
+# Approved changes (index builds on large tables) get far longer than test queries
+EXECUTOR_STATEMENT_TIMEOUT_MS = 3600000
+EXECUTOR_PHASE_TIMEOUT_S = 3600.0
+# How long after statement_timeout the client-side watchdog cancels the backend,
+# covering scripts that raise or disable statement_timeout themselves.
+WATCHDOG_GRACE_S = 2.0
+
+TIMEOUT = "timeout"
+CANCELLED = "cancelled"
+
+
+class BudgetExceeded(RuntimeError):
+    def __init__(self, message: str, outcome: str):
+        super().__init__(message)
+        self.outcome = outcome
+
+
+class CancelToken:
+    """Cancellation flag shared by every connection working for one run."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._conns = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def register(self, conn):
+        with self._lock:
+            self._conns.add(conn)
+        if self.cancelled:
+            conn.cancel()
+
+    def unregister(self, conn):
+        with self._lock:
+            self._conns.discard(conn)
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            conns = list(self._conns)
+        for conn in conns:
+            try:
+                conn.cancel()
+            except psycopg2.Error as e:
+                logger.warning(f"Cancel request failed: {str(e)}")
+        logger.info(f"Cancelled {len(conns)} running statements")
+
+    def reset(self):
+        self._event.clear()
+
+
+_tokens: Dict[str, CancelToken] = {}
+_tokens_lock = threading.Lock()
+
+
+def cancel_token(run_id: Optional[str]) -> CancelToken:
+    """Token registered under run_id (a graph thread id); a private one when run_id is None."""
+    if run_id is None:
+        return CancelToken()
+    with _tokens_lock:
+        return _tokens.setdefault(run_id, CancelToken())
+
+
+def cancel_run(run_id: str) -> bool:
+    """Cancel every statement running for run_id; False when nothing is registered."""
+    with _tokens_lock:
+        token = _tokens.get(run_id)
+    if token is None:
+        return False
+    token.cancel()
+    return True
+
+
+def reset_run(run_id: str):
+    """Clear a previous cancellation before starting a new run under run_id."""
+    with _tokens_lock:
+        token = _tokens.get(run_id)
+    if token is not None:
+        token.reset()
+
+
+class Budget:
+    """Time limits for one phase of work: a cap per statement and a deadline for
+    the phase as a whole, plus the run's cancel token.
+
+    Each statement runs under guard(conn), which sets statement_timeout to
+    whichever limit is closer and arms a watchdog that cancels the backend if
+    the server has not given up on its own shortly after that.
+    """
+
+    def __init__(self, statement_timeout_ms: int = DEFAULT_STATEMENT_TIMEOUT_MS,
+                 phase_timeout_s: float = DEFAULT_PHASE_TIMEOUT_S, token: Optional[CancelToken] = None):
+        self.statement_timeout_ms = statement_timeout_ms
+        self.phase_timeout_s = phase_timeout_s
+        self.deadline = time.monotonic() + phase_timeout_s if phase_timeout_s else None
+        self.token = token or CancelToken()
+        self.timed_out = False
+
+    @classmethod
+    def from_state(cls, state, statement_timeout_ms: int = DEFAULT_STATEMENT_TIMEOUT_MS,
+                   phase_timeout_s: float = DEFAULT_PHASE_TIMEOUT_S) -> "Budget":
+        """Budget from a graph state's statement_timeout_ms / phase_timeout_s,
+        tied to the cancel token of its run_id."""
+        return cls(
+            statement_timeout_ms=state.get("statement_timeout_ms") or statement_timeout_ms,
+            phase_timeout_s=state.get("phase_timeout_s") or phase_timeout_s,
+            token=cancel_token(state.get("run_id")),
+        )
+
+    @property
+    def cancelled(self) -> bool:
+        return self.token.cancelled
+
+    def remaining_ms(self) -> Optional[int]:
+        if self.deadline is None:
+            return None
+        return max(int((self.deadline - time.monotonic()) * 1000), 0)
+
+    def check(self):
+        """Raise BudgetExceeded when the run was cancelled or the phase is out of time."""
+        if self.cancelled:
+            raise BudgetExceeded("Cancelled by user", CANCELLED)
+        if self.remaining_ms() == 0:
+            self.timed_out = True
+            raise BudgetExceeded(f"Phase time budget of {self.phase_timeout_s}s exhausted", TIMEOUT)
+
+    def effective_timeout_ms(self) -> int:
+        # A spent phase leaves 0 ms remaining, which must not fall back to the statement cap
+        limits = [ms for ms in (self.statement_timeout_ms or None, self.remaining_ms()) if ms is not None]
+        return max(min(limits), 1) if limits else 0
+
+    def outcome(self, error: BaseException) -> str:
+        """'timeout', 'cancelled' or 'error' for an exception raised under this budget."""
+        if isinstance(error, BudgetExceeded):
+            return error.outcome
+        if isinstance(error, errors.QueryCanceled):
+            return CANCELLED if self.cancelled else TIMEOUT
+        return "error"
+
+    @contextmanager
+    def guard(self, conn):
+        self.check()
+        timeout_ms = self.effective_timeout_ms()
+        watchdog = None
+        if timeout_ms:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT set_config('statement_timeout', %s, false)", (str(timeout_ms),))
+            watchdog = threading.Timer(timeout_ms / 1000 + WATCHDOG_GRACE_S, self._expire, (conn,))
+            watchdog.daemon = True
+            watchdog.start()
+        self.token.register(conn)
+        try:
+            yield
+        finally:
+            self.token.unregister(conn)
+            if watchdog:
+                watchdog.cancel()
+                # An aborted transaction is rolled back by the caller, which undoes the setting too
+                if not conn.closed and conn.info.transaction_status != extensions.TRANSACTION_STATUS_INERROR:
+                    with conn.cursor() as cursor:
+                        cursor.execute("RESET statement_timeout")
+
+    def _expire(self, conn):
+        self.timed_out = True
+        logger.warning("Statement outlived its time budget, cancelling it")
+        try:
+            conn.cancel()
+        except psycopg2.Error as e:
+            logger.warning(f"Cancel request failed: {str(e)}")
@@ -0,0 +1,527 @@
+# datagen.py
+import logging
+import math
+import multiprocessing
+import os
+import random
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Any, List, Optional
+from sql.introspection import get_catalog, invalidate
+from sql.pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCALE = 2.0
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# Rows generated per column-wise batch; each batch is one CSV chunk handed to COPY
+BATCH_ROWS = 10000
+COPY_BUFFER = 1 << 20
+# Referenced keys held in memory per foreign key; larger parents are sampled
+KEY_POOL_SIZE = 1000000
+FALLBACK_INT_RANGE = 1000000
+FALLBACK_DAYS = 365
+
+INTEGER_TYPES = ("smallint", "integer", "bigint")
+FLOAT_TYPES = ("real", "double precision")
+TEXT_TYPES = ("text", "character varying", "character", "citext")
+# Stands in for "draw from the histogram" among the most common values
+_HISTOGRAM = object()
+
+STATS_QUERY = """
+    SELECT s.schemaname || '.' || s.tablename, s.attname, s.null_frac, s.n_distinct,
+           s.most_common_vals::text::text[], s.most_common_freqs, s.histogram_bounds::text::text[]
+    FROM pg_stats s
+    JOIN pg_namespace n ON n.nspname = s.schemaname
+    JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = s.tablename
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attname = s.attname
+    JOIN pg_type t ON t.oid = a.atttypid
+    WHERE s.schemaname = ANY(%s) AND t.typcategory <> 'A'
+    ORDER BY s.inherited
+"""
+
+KEYS_QUERY = """
+    SELECT n.nspname || '.' || t.relname, c.contype,
+           ARRAY(SELECT a.attname::text FROM unnest(c.conkey) WITH ORDINALITY k(attnum, pos)
+                 JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum ORDER BY k.pos),
+           rn.nspname || '.' || r.relname,
+           ARRAY(SELECT a.attname::text FROM unnest(c.confkey) WITH ORDINALITY k(attnum, pos)
+                 JOIN pg_attribute a ON a.attrelid = c.confrelid AND a.attnum = k.attnum ORDER BY k.pos)
+    FROM pg_constraint c
+    JOIN pg_class t ON t.oid = c.conrelid
+    JOIN pg_namespace n ON n.oid = t.relnamespace
+    LEFT JOIN pg_class r ON r.oid = c.confrelid
+    LEFT JOIN pg_namespace rn ON rn.oid = r.relnamespace
+    WHERE c.contype IN ('p', 'u', 'f') AND n.nspname = ANY(%s)
+"""
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _qualified(table: Dict[str, Any]) -> str:
+    return f"{_ident(table['schema'])}.{_ident(table['name'])}"
+
+
+def _category(type_name: str) -> str:
+    if type_name.endswith("[]"):
+        return "array"
+    base = type_name.split("(")[0].strip()
+    if base in INTEGER_TYPES:
+        return "integer"
+    if base == "numeric" or base in FLOAT_TYPES:
+        return "numeric"
+    if base == "date":
+        return "date"
+    if base.startswith("timestamp"):
+        return "timestamp"
+    if base in TEXT_TYPES:
+        return "text"
+    if base in ("uuid", "boolean", "json", "jsonb"):
+        return base
+    return "other"
+
+
+def _modifiers(type_name: str) -> List[int]:
+    match = re.search(r"\(([\d,\s]+)\)", type_name)
+    return [int(m) for m in match.group(1).split(",")] if match else []
+
+
+def _max_length(type_name: str) -> Optional[int]:
+    if _category(type_name) != "text":
+        return None
+    modifiers = _modifiers(type_name)
+    return modifiers[0] if modifiers else None
+
+
+def _numeric_scale(type_name: str) -> Optional[int]:
+    modifiers = _modifiers(type_name)
+    return modifiers[1] if type_name.startswith("numeric") and len(modifiers) == 2 else None
+
+
+def _fit(value: str, suffix: str, max_length: Optional[int]) -> str:
+    if max_length:
+        value = value[:max(max_length - len(suffix), 0)]
+    return value + suffix
+
+
+def _parse_bounds(category: str, bounds: List[str]):
+    """Bounds as numbers to interpolate between; None when values can only be picked."""
+    try:
+        if category == "integer":
+            return [int(b) for b in bounds]
+        if category == "numeric":
+            return [float(b) for b in bounds]
+        if category == "date":
+            return [date.fromisoformat(b).toordinal() for b in bounds]
+        if category == "timestamp":
+            return [datetime.fromisoformat(b) for b in bounds]
+    except ValueError:
+        # infinity, NaN or a non-ISO DateStyle
+        pass
+    return None
+
+
+def _format(category: str, value, scale: Optional[int], tz) -> str:
+    if category == "integer":
+        return str(int(value))
+    if category == "numeric":
+        return f"{value:.{scale}f}" if scale is not None else repr(value)
+    if category == "date":
+        return date.fromordinal(int(value)).isoformat()
+    if tz:
+        return datetime.fromtimestamp(value, tz).isoformat(sep=" ")
+    return (datetime(1970, 1, 1) + timedelta(seconds=value)).isoformat(sep=" ")
+
+
+def _stats_generator(spec: Dict[str, Any], rng: random.Random) -> Callable[[int], List[Optional[str]]]:
+    """Values following a column's null_frac, most common values and histogram."""
+    category, bounds = spec["category"], spec["bounds"] or []
+    parsed = _parse_bounds(category, bounds) if len(bounds) > 1 else None
+    tz = None
+    if category == "timestamp" and parsed:
+        tz = parsed[0].tzinfo
+        parsed = [b.timestamp() if tz else (b - datetime(1970, 1, 1)).total_seconds() for b in parsed]
+    # Spread text values over as many distinct values as the column should have
+    spread = 0
+    if category == "text" and bounds and spec["distinct"] > 2 * (len(bounds) + len(spec["mcv"])):
+        spread = math.ceil(spec["distinct"] / len(bounds))
+
+    mcv_total = sum(spec["mcv_freqs"])
+    histogram = max(1.0 - spec["null_frac"] - mcv_total, 0.0) if bounds else 0.0
+    population = [None] + spec["mcv"] + ([_HISTOGRAM] if histogram else [])
+    weights = [spec["null_frac"]] + spec["mcv_freqs"] + ([histogram] if histogram else [])
+    if not any(weights):
+        weights = [1.0] * len(population)
+
+    # random() arithmetic instead of randrange(): this runs once per generated value
+    uniform, buckets, discrete = rng.random, max(len(bounds) - 1, 1), category in ("integer", "date")
+
+    def from_histogram() -> str:
+        i = int(uniform() * buckets)
+        if parsed:
+            lo, hi = parsed[i], parsed[i + 1]
+            value = lo + int(uniform() * (hi - lo + 1)) if discrete else lo + uniform() * (hi - lo)
+            return _format(category, value, spec["scale"], tz)
+        value = bounds[i + (uniform() < 0.5)] if len(bounds) > 1 else bounds[0]
+        return _fit(value, f"-{int(uniform() * spread)}", spec["max_length"]) if spread else value
+
+    def generate(n: int) -> List[Optional[str]]:
+        values = rng.choices(population, weights, k=n)
+        return [from_histogram() if v is _HISTOGRAM else v for v in values]
+
+    return generate
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _fallback_generator(spec: Dict[str, Any], rng: random.Random) -> Callable[[int], List[Optional[str]]]:
+    """Plausible values for a NOT NULL column that has no statistics yet."""
+    category, today, now = spec["category"], date.today().toordinal(), datetime.now()
+    makers = {
+        "integer": lambda: str(rng.randrange(FALLBACK_INT_RANGE)),
+        "numeric": lambda: f"{rng.random() * FALLBACK_INT_RANGE:.{spec['scale'] or 2}f}",
+        "date": lambda: date.fromordinal(today - rng.randrange(FALLBACK_DAYS)).isoformat(),
+        "timestamp": lambda: (now - timedelta(seconds=rng.randrange(FALLBACK_DAYS * 86400))).isoformat(sep=" "),
+        "text": lambda: _fit(_uuid(rng).replace("-", ""), "", spec["max_length"]),
+        "uuid": lambda: _uuid(rng),
+        "boolean": lambda: rng.choice(("t", "f")),
+        "json": lambda: "{}",
+        "jsonb": lambda: "{}",
+        "array": lambda: "{}",
+    }
+    make = makers[category]
+    return lambda n: [make() for _ in range(n)]
+
+
+def _generator(spec: Dict[str, Any], offset: int, rng: random.Random) -> Callable[[int], List[List[Optional[str]]]]:
+    """Batch generator for one column group, returning one value list per column.
+
+    offset is the index of this producer's first row, which keeps serial and
+    unique values of parallel producers apart.
+    """
+    kind = spec["kind"]
+    counter = [offset]
+
+    def advance(n: int) -> range:
+        start = counter[0]
+        counter[0] += n
+        return range(start, start + n)
+
+    if kind == "serial":
+        return lambda n: [[str(spec["start"] + i) for i in advance(n)]]
+    if kind == "uuid":
+        null_frac = spec["null_frac"]
+        return lambda n: [[None if rng.random() < null_frac else _uuid(rng) for _ in range(n)]]
+    if kind == "unique_text":
+        bases = spec["bases"] or spec["columns"]
+        return lambda n: [[_fit(rng.choice(bases), f"-{spec['token']}{i}", spec["max_length"]) for i in advance(n)]]
+    if kind == "foreign_key":
+        pool, width, uniform = spec["pool"], len(spec["columns"]), rng.random
+        mcv_total = sum(spec["mcv_freqs"])
+        population = [None] + [(v,) for v in spec["mcv"]] + [_HISTOGRAM]
+        weights = [spec["null_frac"]] + spec["mcv_freqs"] + [max(1.0 - spec["null_frac"] - mcv_total, 0.0)]
+        if not pool:
+            population, weights = population[:-1], weights[:-1]
+
+        def references(n: int) -> List[List[Optional[str]]]:
+            keys = [pool[int(uniform() * len(pool))] if k is _HISTOGRAM else k
+                    for k in rng.choices(population, weights, k=n)]
+            return [[k[c] if k else None for k in keys] for c in range(width)]
+        return references
+    if kind == "stats":
+        generate = _stats_generator(spec, rng)
+    else:
+        generate = _fallback_generator(spec, rng)
+    return lambda n: [generate(n)]
+
+
+def _csv_field(value: Any) -> str:
+    # COPY's CSV format reads an unquoted empty field as NULL and a quoted one as ''
+    if value is None:
+        return ""
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class _CsvStream:
+    """File-like object COPY reads from, generating CSV one batch of rows at a time."""
+
+    def __init__(self, generators: List[Callable], rows: int):
+        self.generators = generators
+        self.remaining = rows
+        self.buffer = bytearray()
+
+    def _fill(self):
+        n = min(BATCH_ROWS, self.remaining)
+        columns = []
+        for generate in self.generators:
+            columns.extend(generate(n))
+        lines = [",".join(_csv_field(value) for value in row) for row in zip(*columns)]
+        self.buffer += "".join(f"{line}\n" for line in lines).encode()
+        self.remaining -= n
+
+    def read(self, size: int = -1) -> bytes:
+        while self.remaining and (size < 0 or len(self.buffer) < size):
+            self._fill()
+        size = len(self.buffer) if size < 0 else size
+        chunk = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return chunk
+
+
+def _produce(db_config: Dict[str, Any], plan: Dict[str, Any], rows: int, offset: int, seed: int) -> Dict[str, int]:
+    """Generate rows rows for one table and stream them in with COPY."""
+    rng = random.Random(seed)
+    generators = [_generator(group, offset, rng) for group in plan["groups"]]
+    columns = ", ".join(_ident(c) for c in plan["columns"])
+    with get_pool(db_config).connection() as conn:
+        with conn.cursor() as cursor:
+            target = plan["target"]
+            if plan["conflicts"]:
+                # Uniqueness is not guaranteed by construction: stage, then skip duplicates
+                cursor.execute(f"CREATE TEMP TABLE datagen_stage ON COMMIT DROP AS "
+                               f"SELECT {columns} FROM {target} WITH NO DATA")
+                target = "datagen_stage"
+            cursor.copy_expert(f"COPY {target} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                               _CsvStream(generators, rows), size=COPY_BUFFER)
+            inserted = rows
+            if plan["conflicts"]:
+                cursor.execute(f"INSERT INTO {plan['target']} ({columns}) SELECT {columns} FROM datagen_stage "
+                               f"ON CONFLICT DO NOTHING")
+                inserted = cursor.rowcount
+    return {"rows": rows, "inserted": inserted}
+
+
+def _load_order(tables: Dict[str, Dict[str, Any]], keys: List[tuple]) -> List[str]:
+    """Referenced tables before the tables referencing them."""
+    parents = {name: set() for name in tables}
+    for table, kind, _, referenced, _ in keys:
+        if kind == "f" and table in tables and referenced in tables and referenced != table:
+            parents[table].add(referenced)
+    order = []
+    while parents:
+        ready = sorted(name for name, deps in parents.items() if not deps - set(order))
+        if not ready:
+            logger.warning(f"Foreign key cycle among {', '.join(sorted(parents))}; loading in name order")
+            ready = sorted(parents)
+        for name in ready:
+            order.append(name)
+            parents.pop(name)
+    return order
+
+
+class DataGenerator:
+    """Grow tables with synthetic rows that follow their pg_stats distributions.
+
+    Columns are drawn from null_frac, the most common values and their
+    frequencies, and the histogram (numbers, dates and timestamps are
+    interpolated within buckets; text keeps to the histogram's values, spread
+    out to the column's n_distinct). Foreign keys draw from keys that exist
+    in the referenced table, hot keys keeping their frequency, and parents
+    are loaded before children. Single-column unique integer, uuid and text
+    columns get fresh values; rows that could still collide with a unique
+    constraint are staged and inserted with ON CONFLICT DO NOTHING.
+    Columns without statistics fall back to their default, NULL, or a
+    plausible value of their type.
+
+    Rows are streamed through COPY FROM STDIN as CSV, from several processes
+    when workers > 1.
+    """
+
+    def __init__(self, db_config: Dict[str, Any], schemas: Optional[List[str]] = None,
+                 workers: int = DEFAULT_WORKERS, seed: Optional[int] = None):
+        self.db_config = db_config
+        self.workers = max(workers, 1)
+        self.random = random.Random(seed)
+        self.token = uuid.uuid4().hex[:6]
+        catalog = get_catalog(db_config, force=True)
+        self.tables = {key: table for key, table in catalog.items()
+                       if table["kind"] in ("table", "partitioned table")
+                       and (schemas is None or table["schema"] in schemas)}
+        self.schemas = sorted({t["schema"] for t in self.tables.values()})
+        with get_pool(db_config).connection() as conn:
+            with conn.cursor() as cursor:
+                # Statistics come back as text in the session's DateStyle
+                cursor.execute("SET LOCAL DateStyle = 'ISO, YMD'")
+                cursor.execute(STATS_QUERY, (self.schemas,))
+                self.stats = {(table, column): {"null_frac": null_frac, "n_distinct": n_distinct,
+                                                "mcv": mcv or [], "mcv_freqs": freqs or [], "bounds": bounds or []}
+                              for table, column, null_frac, n_distinct, mcv, freqs, bounds in cursor.fetchall()}
+                cursor.execute(KEYS_QUERY, (self.schemas,))
+                self.keys = cursor.fetchall()
+
+    def current_rows(self, key: str) -> int:
+        table = self.tables[key]
+        return max(table["row_estimate"] or 0, table["n_live_tup"] or 0)
+
+    def plan(self, key: str, total_rows: int) -> Dict[str, Any]:
+        """Column groups and COPY column list for one table."""
+        table = self.tables[key]
+        columns = {c["name"]: c for c in table["columns"]}
+        groups, covered, unique_columns = [], set(), set()
+
+        with get_pool(self.db_config).connection() as conn:
+            with conn.cursor() as cursor:
+                for table_key, kind, key_columns, referenced, referenced_columns in self.keys:
+                    if table_key != key or kind != "f" or covered & set(key_columns):
+                        continue
+                    groups.append(self._foreign_key(cursor, key, key_columns, referenced, referenced_columns))
+                    covered.update(key_columns)
+
+                for table_key, kind, key_columns, _, _ in self.keys:
+                    if table_key != key or kind not in ("p", "u") or len(key_columns) != 1 or key_columns[0] in covered:
+                        continue
+                    name = key_columns[0]
+                    group = self._unique(cursor, table, columns[name])
+                    if group:
+                        groups.append(group)
+                        covered.add(name)
+                        unique_columns.add(name)
+
+        for name, column in columns.items():
+            if name in covered or column.get("generated"):
+                continue
+            category = _category(column["type"])
+            stats = self.stats.get((key, name))
+            if category == "uuid" and (stats is None or stats["n_distinct"] < -0.5):
+                groups.append({"kind": "uuid", "columns": [name], "null_frac": stats["null_frac"] if stats else 0.0})
+            elif stats and (stats["mcv"] or stats["bounds"]):
+                n_distinct = stats["n_distinct"]
+                groups.append({
+                    "kind": "stats", "columns": [name], "category": category,
+                    "null_frac": 0.0 if column["not_null"] else stats["null_frac"], "mcv": stats["mcv"], "mcv_freqs": stats["mcv_freqs"],
+                    "bounds": stats["bounds"], "scale": _numeric_scale(column["type"]),
+                    "max_length": _max_length(column["type"]),
+                    "distinct": -n_distinct * total_rows if n_distinct < 0 else n_distinct,
+                })
+            elif column["default"] is not None or column.get("identity") or not column["not_null"]:
+                continue
+            elif category == "other":
+                raise RuntimeError(f"Cannot synthesize {key}.{name} ({column['type']}): no statistics; ANALYZE it first")
+            else:
+                groups.append({"kind": "fallback", "columns": [name], "category": category,
+                               "scale": _numeric_scale(column["type"]), "max_length": _max_length(column["type"])})
+            covered.add(name)
+
+        conflicts = any(
+            kind in ("p", "u") and not unique_columns & set(key_columns)
+            for table_key, kind, key_columns, _, _ in self.keys if table_key == key
+        )
+        return {"table": key, "target": _qualified(table), "groups": groups, "conflicts": conflicts,
+                "columns": [c for g in groups for c in g["columns"]]}
+
+    def _unique(self, cursor, table: Dict[str, Any], column: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        category, name = _category(column["type"]), column["name"]
+        if category == "integer":
+            cursor.execute(f"SELECT coalesce(max({_ident(name)}), 0) FROM {_qualified(table)}")
+            return {"kind": "serial", "columns": [name], "start": cursor.fetchone()[0] + 1}
+        if category == "uuid":
+            return {"kind": "uuid", "columns": [name], "null_frac": 0.0}
+        if category == "text":
+            stats = self.stats.get((f"{table['schema']}.{table['name']}", name)) or {}
+            return {"kind": "unique_text", "columns": [name], "token": self.token,
+                    "bases": (stats.get("bounds") or stats.get("mcv") or [])[:100],
+                    "max_length": _max_length(column["type"])}
+        return None
+
+    def _foreign_key(self, cursor, key: str, key_columns: List[str], referenced: str,
+                     referenced_columns: List[str]) -> Dict[str, Any]:
+        parent = self.tables.get(referenced)
+        if parent is None:
+            raise RuntimeError(f"{key} references {referenced}, which is not being generated or readable")
+        target = _qualified(parent)
+        select = ", ".join(f"{_ident(c)}::text" for c in referenced_columns)
+        estimate = max(self.current_rows(referenced), 1)
+        sample = f" TABLESAMPLE SYSTEM ({min(100.0, 200.0 * KEY_POOL_SIZE / estimate)})" if estimate > KEY_POOL_SIZE else ""
+        cursor.execute(f"SELECT {select} FROM {target}{sample} LIMIT %s", (KEY_POOL_SIZE,))
+        pool = cursor.fetchall()
+
+        stats = self.stats.get((key, key_columns[0])) or {}
+        mcv, freqs = [], []
+        if len(key_columns) == 1 and stats.get("mcv"):
+            parent_type = next(c["type"] for c in parent["columns"] if c["name"] == referenced_columns[0])
+            cursor.execute(f"SELECT {select} FROM {target} WHERE {_ident(referenced_columns[0])} = ANY(%s::{parent_type}[])",
+                           (stats["mcv"],))
+            existing = {row[0] for row in cursor.fetchall()}
+            for value, freq in zip(stats["mcv"], stats["mcv_freqs"]):
+                if value in existing:
+                    mcv.append(value)
+                    freqs.append(freq)
+
+        nullable = all(not c["not_null"] for c in self.tables[key]["columns"] if c["name"] in key_columns)
+        if not pool and not mcv and not nullable:
+            raise RuntimeError(f"{referenced} has no rows for {key} to reference")
+        return {"kind": "foreign_key", "columns": key_columns, "pool": pool, "mcv": mcv, "mcv_freqs": freqs,
+                "null_frac": stats.get("null_frac", 0.0) if nullable else 0.0}
+
+    def generate(self, scale: float = DEFAULT_SCALE, rows: Optional[Dict[str, int]] = None,
+                 analyze: bool = True) -> Dict[str, Dict[str, Any]]:
+        """Add rows to every table: rows[table] where given, else enough to reach scale times its current size."""
+        rows = rows or {}
+        report = {}
+        context = multiprocessing.get_context("spawn")
+        # Spawned, not forked: children must not inherit this process's pooled connections
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context) if self.workers > 1 else None
+        try:
+            for key in _load_order(self.tables, self.keys):
+                current = self.current_rows(key)
+                count = rows.get(key, round(current * (scale - 1)))
+                if count <= 0:
+                    continue
+                started = time.monotonic()
+                plan = self.plan(key, current + count)
+                if not plan["columns"]:
+                    logger.warning(f"Nothing to generate for {key}: every column has a default")
+                    continue
+                chunks = [count // self.workers + (1 if i < count % self.workers else 0) for i in range(self.workers)]
+                chunks = [c for c in chunks if c] if executor and count >= self.workers * BATCH_ROWS else [count]
+                offsets = [sum(chunks[:i]) for i in range(len(chunks))]
+                seeds = [self.random.randrange(2 ** 32) for _ in chunks]
+                if len(chunks) > 1:
+                    results = list(executor.map(_produce, [self.db_config] * len(chunks), [plan] * len(chunks),
+                                                chunks, offsets, seeds))
+                else:
+                    results = [_produce(self.db_config, plan, count, 0, seeds[0])]
+                inserted = sum(r["inserted"] for r in results)
+                elapsed = time.monotonic() - started
+                report[key] = {"rows": count, "inserted": inserted, "skipped": count - inserted,
+                               "producers": len(chunks), "elapsed_s": round(elapsed, 2),
+                               "rows_per_s": round(inserted / elapsed) if elapsed else None}
+                logger.info(f"Generated {inserted} rows for {key} in {elapsed:.1f}s "
+                            f"({report[key]['rows_per_s']} rows/s, {len(chunks)} producers)")
+                # Later foreign keys see this table's new size
+                self.tables[key] = dict(self.tables[key], row_estimate=current + inserted)
+        finally:
+            if executor:
+                executor.shutdown()
+        self._finish(report, analyze)
+        return report
+
+    def _finish(self, report: Dict[str, Dict[str, Any]], analyze: bool):
+        """Move sequences past the generated keys and refresh statistics."""
+        with get_pool(self.db_config).connection() as conn:
+            with conn.cursor() as cursor:
+                for key in report:
+                    table = self.tables[key]
+                    for column in table["columns"]:
+                        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", (_qualified(table), column["name"]))
+                        sequence = cursor.fetchone()[0]
+                        if sequence:
+                            cursor.execute(f"SELECT setval(%s, max({_ident(column['name'])})) FROM {_qualified(table)} "
+                                           f"HAVING max({_ident(column['name'])}) IS NOT NULL", (sequence,))
+                    if analyze:
+                        cursor.execute(f"ANALYZE {_qualified(table)}")
+        invalidate(self.db_config)
+
+
+def generate_data(db_config: Dict[str, Any], scale: float = DEFAULT_SCALE, rows: Optional[Dict[str, int]] = None,
+                  schemas: Optional[List[str]] = None, workers: int = DEFAULT_WORKERS,
+                  seed: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """Grow the tables of db_config to scale times their size with statistics-faithful rows."""
+    return DataGenerator(db_config, schemas=schemas, workers=workers, seed=seed).generate(scale=scale, rows=rows)
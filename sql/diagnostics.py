@@ -0,0 +1,111 @@
+# diagnostics.py
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Union
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from sql.pool import get_pool, ConnectionPool
+from utils.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+PROBE_CATALOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "performance_queries.json")
+DEFAULT_PROBE_TIMEOUT_MS = 5000
+MAX_ROWS_PER_PROBE = 50
+
+
+@dataclass
+class ProbeResult:
+    name: str
+    description: str
+    context: str
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    error: Optional[str] = None
+    elapsed_ms: float = 0.0
+
+
+@dataclass
+class DiagnosticSnapshot:
+    database: str
+    probes: List[ProbeResult]
+    elapsed_ms: float
+
+    @property
+    def failed(self) -> List[ProbeResult]:
+        return [p for p in self.probes if p.error]
+
+    def to_prompt(self, max_rows: int = 10) -> str:
+        """Render the snapshot as compact text for inclusion in an LLM prompt."""
+        lines = [f"Diagnostics for {self.database} ({len(self.probes)} probes, {len(self.failed)} failed):"]
+        for probe in self.probes:
+            if probe.error:
+                lines.append(f"- {probe.name}: unavailable ({probe.error.splitlines()[0]})")
+                continue
+            if not probe.rows:
+                lines.append(f"- {probe.name}: no rows")
+                continue
+            lines.append(f"- {probe.name} ({probe.description}):")
+            for row in probe.rows[:max_rows]:
+                lines.append("    " + ", ".join(f"{k}={v}" for k, v in row.items()))
+            if len(probe.rows) > max_rows:
+                lines.append(f"    ... {len(probe.rows) - max_rows} more rows")
+        return "\n".join(lines)
+
+
+def load_probes(context: Union[str, List[str], None] = None, path: str = PROBE_CATALOG) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        probes = json.load(f)
+    if context:
+        contexts = {context} if isinstance(context, str) else set(context)
+        probes = [p for p in probes if p.get("context") in contexts]
+    return probes
+
+
+def run_probe(pool: ConnectionPool, probe: Dict[str, Any], timeout_ms: int = DEFAULT_PROBE_TIMEOUT_MS) -> ProbeResult:
+    """Run one probe in a read-only transaction bounded by statement_timeout."""
+    result = ProbeResult(name=probe["name"], description=probe.get("description", ""),
+                         context=probe.get("context", ""))
+    start = time.perf_counter()
+    try:
+        with pool.connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", (str(int(timeout_ms)),))
+                cursor.execute(probe["query"], probe.get("args") or None)
+                rows = cursor.fetchmany(MAX_ROWS_PER_PROBE) if cursor.description else []
+                result.rows = [{k: _plain(v) for k, v in row.items()} for row in rows]
+            conn.rollback()
+    except psycopg2.Error as e:
+        result.error = str(e).strip()
+        logger.warning(f"Probe '{probe['name']}' failed: {result.error.splitlines()[0]}")
+    result.elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+
+def _plain(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def run_diagnostics(db_config: Dict[str, Any], context: Union[str, List[str], None] = None,
+                    timeout_ms: int = DEFAULT_PROBE_TIMEOUT_MS, max_workers: Optional[int] = None) -> DiagnosticSnapshot:
+    """Run the probe catalog (or one context of it) in parallel on pooled connections."""
+    probes = load_probes(context)
+    pool = get_pool(db_config)
+    start = time.perf_counter()
+    if probes:
+        workers = max_workers or min(len(probes), pool.max_connections)
+        # Probe threads do not inherit the caller's span; time the sweep as a whole
+        with span("db.diagnostics", "db", **{"db.probes": len(probes)}), \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="diagnostics") as executor:
+            results = list(executor.map(lambda p: run_probe(pool, p, timeout_ms), probes))
+    else:
+        results = []
+    elapsed = round((time.perf_counter() - start) * 1000, 2)
+    logger.info(f"Diagnostic sweep ran {len(results)} probes in {elapsed} ms")
+    return DiagnosticSnapshot(database=db_config.get("database", ""), probes=results, elapsed_ms=elapsed)
@@ -0,0 +1,405 @@
+# index_advisor.py
+import hashlib
+import logging
+import math
+import re
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+from sql.pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+# Tables smaller than this are cheap to scan; indexes rarely pay off there.
+MIN_ROWS = 10000
+# Unused-index findings are less trustworthy when statistics were reset recently.
+MIN_STATS_AGE_DAYS = 7
+# |pg_stats.correlation| above which a range predicate is served well by BRIN on large tables.
+BRIN_CORRELATION = 0.9
+BRIN_MIN_ROWS = 1000000
+# Planner default selectivity of an inequality without histogram data.
+RANGE_SELECTIVITY = 1 / 3
+MIN_SCORE = 5.0
+# PostgreSQL truncates longer identifiers, which could make two index names collide
+MAX_IDENTIFIER = 63
+
+TABLE_STATS = """
+    SELECT s.schemaname, s.relname, s.seq_scan, s.seq_tup_read, coalesce(s.idx_scan, 0),
+           s.n_live_tup, s.n_tup_ins + s.n_tup_upd + s.n_tup_del AS writes,
+           pg_relation_size(s.relid)
+    FROM pg_stat_user_tables s
+"""
+
+INDEX_STATS = """
+    SELECT n.nspname, t.relname, i.relname, am.amname,
+           ARRAY(SELECT a.attname::text
+                 FROM unnest(ix.indkey::int2[]) WITH ORDINALITY k(attnum, pos)
+                 LEFT JOIN pg_attribute a ON a.attrelid = ix.indrelid AND a.attnum = k.attnum
+                 WHERE k.pos <= ix.indnkeyatts
+                 ORDER BY k.pos) AS columns,
+           ix.indexprs IS NOT NULL OR ix.indpred IS NOT NULL AS special,
+           ix.indisunique, ix.indisprimary, ix.indisvalid,
+           EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = ix.indexrelid) AS constraint_backed,
+           coalesce(s.idx_scan, 0), pg_relation_size(ix.indexrelid),
+           regexp_replace(pg_get_indexdef(ix.indexrelid), '^CREATE (UNIQUE )?INDEX ("[^"]*"|\\S+) ON ', '') AS signature
+    FROM pg_index ix
+    JOIN pg_class i ON i.oid = ix.indexrelid
+    JOIN pg_class t ON t.oid = ix.indrelid
+    JOIN pg_namespace n ON n.oid = t.relnamespace
+    JOIN pg_am am ON am.oid = i.relam
+    LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = ix.indexrelid
+    WHERE n.nspname NOT IN ('pg_catalog', 'information_schema') AND n.nspname NOT LIKE 'pg_toast%'
+"""
+
+COLUMN_STATS = """
+    SELECT schemaname, tablename, attname, n_distinct, correlation, null_frac
+    FROM pg_stats
+    WHERE schemaname NOT IN ('pg_catalog', 'information_schema')
+"""
+
+FOREIGN_KEYS = """
+    SELECT n.nspname, t.relname, c.conname,
+           ARRAY(SELECT a.attname::text
+                 FROM unnest(c.conkey) WITH ORDINALITY k(attnum, pos)
+                 JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+                 ORDER BY k.pos),
+           c.confrelid::regclass::text
+    FROM pg_constraint c
+    JOIN pg_class t ON t.oid = c.conrelid
+    JOIN pg_namespace n ON n.oid = t.relnamespace
+    WHERE c.contype = 'f'
+"""
+
+STATS_AGE = """
+    SELECT extract(epoch FROM now() - coalesce(stats_reset, pg_postmaster_start_time())) / 86400
+    FROM pg_stat_database WHERE datname = current_database()
+"""
+
+IDENTIFIERS = "SELECT name, quote_ident(name) FROM unnest(%s::text[]) AS name"
+
+PREDICATE = re.compile(
+    r"(?:\b(?P<alias>\w+)\.)?\b(?P<column>\w+)\s*(?P<op>=|<>|!=|<=|>=|<|>|\bin\b|\bbetween\b|\blike\b|\bis\b)",
+    re.IGNORECASE,
+)
+RELATION = re.compile(r"\b(?:from|join)\s+(?:only\s+)?(?P<name>[\w.\"]+)(?:\s+(?:as\s+)?(?P<alias>\w+))?",
+                      re.IGNORECASE)
+NOT_ALIASES = {"where", "join", "on", "left", "right", "inner", "outer", "full", "cross", "group", "order",
+               "limit", "using", "natural", "lateral", "union", "having", "window", "offset", "fetch", "for"}
+
+
+def _key(schema: str, table: str) -> str:
+    return f"{schema}.{table}"
+
+
+def _quote(stats: Dict[str, Any], name: str) -> str:
+    # quote_ident as computed by the server; names it has not seen are always quoted
+    return stats.get("quoted", {}).get(name) or '"' + name.replace('"', '""') + '"'
+
+
+def _qualified(stats: Dict[str, Any], key: str) -> str:
+    schema, table = key.split(".", 1)
+    return _quote(stats, table) if schema == "public" else f"{_quote(stats, schema)}.{_quote(stats, table)}"
+
+
+def _column_list(stats: Dict[str, Any], columns: List[str]) -> str:
+    return ", ".join(_quote(stats, c) for c in columns)
+
+
+def _index_name(key: str, columns: List[str]) -> str:
+    """idx_<table>_<columns> as a plain lowercase identifier that needs no quoting,
+    with a hash suffix instead of silent truncation past MAX_IDENTIFIER."""
+    name = re.sub(r"[^a-z0-9_]", "_", f"idx_{key.split('.', 1)[1]}_{'_'.join(columns)}".lower())
+    if len(name) > MAX_IDENTIFIER:
+        digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+        name = f"{name[:MAX_IDENTIFIER - len(digest) - 1]}_{digest}"
+    return name
+
+
+def _collect(conn) -> Dict[str, Any]:
+    with conn.cursor() as cursor:
+        cursor.execute(TABLE_STATS)
+        tables = {
+            _key(schema, name): {"seq_scan": seq_scan, "seq_tup_read": seq_tup_read, "idx_scan": idx_scan,
+                                 "rows": rows, "writes": writes, "bytes": size}
+            for schema, name, seq_scan, seq_tup_read, idx_scan, rows, writes, size in cursor.fetchall()
+        }
+        cursor.execute(INDEX_STATS)
+        indexes = defaultdict(list)
+        for (schema, table, name, method, columns, special, unique, primary, valid, backed,
+             scans, size, signature) in cursor.fetchall():
+            indexes[_key(schema, table)].append({
+                "name": name, "schema": schema, "method": method, "columns": [c for c in columns if c],
+                "expression": special or None in columns, "unique": unique, "primary": primary,
+                "valid": valid, "constraint": backed, "scans": scans, "bytes": size, "signature": signature,
+            })
+        cursor.execute(COLUMN_STATS)
+        columns = {
+            (_key(schema, table), column): {"n_distinct": n_distinct, "correlation": correlation, "null_frac": null_frac}
+            for schema, table, column, n_distinct, correlation, null_frac in cursor.fetchall()
+        }
+        cursor.execute(FOREIGN_KEYS)
+        foreign_keys = [
+            {"table": _key(schema, table), "name": name, "columns": cols, "references": ref}
+            for schema, table, name, cols, ref in cursor.fetchall()
+        ]
+        cursor.execute(STATS_AGE)
+        stats_age = float(cursor.fetchone()[0] or 0)
+        names = {part for key in tables for part in key.split(".", 1)}
+        names.update(column for _, column in columns)
+        for key, idxs in indexes.items():
+            names.update(part for part in key.split(".", 1))
+            for idx in idxs:
+                names.update([idx["name"], idx["schema"], *idx["columns"]])
+        for fk in foreign_keys:
+            names.update(part for part in fk["table"].split(".", 1))
+            names.update(fk["columns"])
+        cursor.execute(IDENTIFIERS, (sorted(names),))
+        quoted = dict(cursor.fetchall())
+    return {"tables": tables, "indexes": indexes, "columns": columns,
+            "foreign_keys": foreign_keys, "stats_age_days": stats_age, "quoted": quoted}
+
+
+def selectivity(column_stats: Optional[Dict[str, Any]], rows: int) -> float:
+    """Estimated fraction of rows matching an equality predicate on the column."""
+    if not column_stats or not rows:
+        return 0.1
+    n_distinct = column_stats["n_distinct"] or 0
+    distinct = n_distinct if n_distinct > 0 else -n_distinct * rows
+    if distinct <= 0:
+        return 0.1
+    return min(1.0, (1 - (column_stats["null_frac"] or 0)) / distinct)
+
+
+def _covered(columns: List[str], indexes: List[Dict[str, Any]], equalities: Optional[int] = None) -> bool:
+    """Whether a btree serves a predicate set: its key starts with the first equalities
+    columns in any order (all of them by default), then the rest, such as a range column, in order."""
+    equalities = len(columns) if equalities is None else equalities
+    for idx in indexes:
+        if idx["valid"] and not idx["expression"] and idx["method"] == "btree":
+            prefix = idx["columns"][:len(columns)]
+            if set(prefix[:equalities]) == set(columns[:equalities]) and prefix[equalities:] == columns[equalities:]:
+                return True
+    return False
+
+
+def _size_score(size: int) -> float:
+    # 0 at 8kB, ~50 at 100MB, 100 at 10GB and above
+    return max(0.0, min(100.0, (math.log10(max(size, 1)) - 3.9) * 16.5))
+
+
+def extract_predicates(query: str, catalog_columns: Dict[str, List[str]]) -> Dict[str, Dict[str, str]]:
+    """Map table key -> {column: "eq" | "range"} for columns the query filters or joins on."""
+    relations = {}
+    for match in RELATION.finditer(query):
+        name = match.group("name").strip('"').lower()
+        key = name if "." in name else f"public.{name}"
+        if key not in catalog_columns:
+            continue
+        relations[key] = key
+        alias = (match.group("alias") or "").lower()
+        if alias and alias not in NOT_ALIASES:
+            relations[alias] = key
+        relations[name.split(".")[-1]] = key
+
+    found = defaultdict(dict)
+    for match in PREDICATE.finditer(query):
+        column = match.group("column").lower()
+        op = match.group("op").lower()
+        alias = (match.group("alias") or "").lower()
+        if alias:
+            candidates = [relations[alias]] if alias in relations else []
+        else:
+            candidates = [k for k in set(relations.values()) if column in catalog_columns[k]]
+        kind = "eq" if op in ("=", "in", "is") else ("range" if op in ("<", ">", "<=", ">=", "between", "like") else None)
+        if kind is None or len(candidates) != 1 or column not in catalog_columns[candidates[0]]:
+            continue
+        # An equality on a column beats a range on it for index ordering
+        if found[candidates[0]].get(column) != "eq":
+            found[candidates[0]][column] = kind
+    return found
+
+
+def _missing_from_queries(stats: Dict[str, Any], queries: List[str]) -> List[Dict[str, Any]]:
+    catalog_columns = defaultdict(set)
+    for key, column in stats["columns"]:
+        catalog_columns[key].add(column)
+    for key, idxs in stats["indexes"].items():
+        for idx in idxs:
+            catalog_columns[key].update(idx["columns"])
+    for key in stats["tables"]:
+        catalog_columns.setdefault(key, set())
+
+    proposals = {}
+    for query in queries:
+        for key, predicates in extract_predicates(query, catalog_columns).items():
+            table = stats["tables"].get(key)
+            if not table or table["rows"] < MIN_ROWS:
+                continue
+            sel = {c: selectivity(stats["columns"].get((key, c)), table["rows"]) if kind == "eq" else RANGE_SELECTIVITY
+                   for c, kind in predicates.items()}
+            eq = sorted((c for c, kind in predicates.items() if kind == "eq"), key=lambda c: sel[c])
+            ranges = sorted((c for c, kind in predicates.items() if kind == "range"), key=lambda c: sel[c])
+            # Equality columns first, most selective first, then at most one range column
+            columns = [c for c in eq if sel[c] < 0.5][:3] + ranges[:1]
+            if not columns or _covered(columns, stats["indexes"].get(key, []), len(columns) - len(ranges[:1])):
+                continue
+
+            method = "btree"
+            if not eq and ranges and table["rows"] >= BRIN_MIN_ROWS:
+                corr = (stats["columns"].get((key, ranges[0])) or {}).get("correlation") or 0
+                if abs(corr) >= BRIN_CORRELATION:
+                    method = "brin"
+            combined = math.prod(sel[c] for c in columns)
+            scans = table["seq_scan"] / max(table["seq_scan"] + table["idx_scan"], 1)
+            score = min(100.0, math.log10(1 + table["seq_tup_read"] + table["rows"]) * 10
+                        * (1 - combined) * (0.5 + 0.5 * scans))
+            if score < MIN_SCORE:
+                continue
+            name = _index_name(key, columns)
+            using = " USING brin" if method == "brin" else ""
+            proposal = proposals.setdefault((key, tuple(columns)), {
+                "kind": "missing",
+                "table": key,
+                "index": name,
+                "columns": columns,
+                "ddl": f"CREATE INDEX CONCURRENTLY {name} ON {_qualified(stats, key)}{using} "
+                       f"({_column_list(stats, columns)});",
+                "score": 0.0,
+                "queries": 0,
+                "reason": (f"{table['rows']} rows, {table['seq_scan']} seq scans vs {table['idx_scan']} index scans; "
+                           f"filtered on {', '.join(f'{c} (selectivity {sel[c]:.2g})' for c in columns)}"),
+            })
+            proposal["queries"] += 1
+            proposal["score"] = round(min(100.0, score + 5 * (proposal["queries"] - 1)), 1)
+    return list(proposals.values())
+
+
+def _unindexed_foreign_keys(stats: Dict[str, Any]) -> List[Dict[str, Any]]:
+    proposals = []
+    for fk in stats["foreign_keys"]:
+        table = stats["tables"].get(fk["table"])
+        if not table or _covered(fk["columns"], stats["indexes"].get(fk["table"], [])):
+            continue
+        name = _index_name(fk["table"], fk["columns"])
+        # Joins on the key and every delete/update of the referenced row scan this table
+        score = min(100.0, 20 + math.log10(1 + table["rows"]) * 8)
+        proposals.append({
+            "kind": "missing",
+            "table": fk["table"],
+            "index": name,
+            "columns": fk["columns"],
+            "ddl": f"CREATE INDEX CONCURRENTLY {name} ON {_qualified(stats, fk['table'])} "
+                   f"({_column_list(stats, fk['columns'])});",
+            "score": round(score, 1),
+            "reason": f"foreign key {fk['name']} to {fk['references']} has no supporting index ({table['rows']} rows)",
+        })
+    return proposals
+
+
+def _drop(stats: Dict[str, Any], idx: Dict[str, Any]) -> str:
+    return f"DROP INDEX CONCURRENTLY {_qualified(stats, _key(idx['schema'], idx['name']))};"
+
+
+def _droppable(idx: Dict[str, Any]) -> bool:
+    return idx["valid"] and not (idx["primary"] or idx["unique"] or idx["constraint"])
+
+
+def _surplus_indexes(stats: Dict[str, Any]) -> List[Dict[str, Any]]:
+    proposals, flagged = [], set()
+    for key, indexes in stats["indexes"].items():
+        table = stats["tables"].get(key) or {"writes": 0}
+        write_weight = min(20.0, math.log10(1 + table["writes"]) * 3)
+
+        by_signature = defaultdict(list)
+        for idx in indexes:
+            by_signature[idx["signature"]].append(idx)
+        for same in by_signature.values():
+            if len(same) < 2:
+                continue
+            # Keep the index that backs a constraint, then the most used one
+            keep = max(same, key=lambda i: (i["constraint"] or i["primary"] or i["unique"], i["scans"], i["name"]))
+            # The survivor is not offered for removal as well
+            flagged.add(keep["name"])
+            for idx in same:
+                if idx is keep or not _droppable(idx):
+                    continue
+                flagged.add(idx["name"])
+                proposals.append({
+                    "kind": "duplicate", "table": key, "index": idx["name"], "columns": idx["columns"],
+                    "ddl": _drop(stats, idx), "score": round(min(100.0, 50 + _size_score(idx["bytes"]) * 0.3 + write_weight), 1),
+                    "reason": f"identical to {keep['name']} ({idx['bytes']} bytes, {idx['scans']} scans)",
+                })
+
+        for idx in indexes:
+            if idx["name"] in flagged or not _droppable(idx) or idx["expression"] or idx["method"] != "btree":
+                continue
+            for other in indexes:
+                if (other is idx or other["expression"] or other["method"] != "btree" or not other["valid"]
+                        or len(other["columns"]) <= len(idx["columns"])):
+                    continue
+                if other["columns"][:len(idx["columns"])] == idx["columns"]:
+                    flagged.add(idx["name"])
+                    proposals.append({
+                        "kind": "redundant", "table": key, "index": idx["name"], "columns": idx["columns"],
+                        "ddl": _drop(stats, idx),
+                        "score": round(min(100.0, 30 + _size_score(idx["bytes"]) * 0.4 + write_weight), 1),
+                        "reason": f"its columns lead {other['name']} ({', '.join(other['columns'])}), "
+                                  f"which serves the same lookups",
+                    })
+                    break
+
+        for idx in indexes:
+            if idx["name"] in flagged or not _droppable(idx) or idx["scans"]:
+                continue
+            score = 10 + _size_score(idx["bytes"]) * 0.5 + write_weight
+            reason = f"never scanned in {stats['stats_age_days']:.0f} days of statistics, {idx['bytes']} bytes"
+            if stats["stats_age_days"] < MIN_STATS_AGE_DAYS:
+                score *= 0.5
+                reason += " (statistics are recent, verify before dropping)"
+            proposals.append({
+                "kind": "unused", "table": key, "index": idx["name"], "columns": idx["columns"],
+                "ddl": _drop(stats, idx), "score": round(min(100.0, score), 1), "reason": reason,
+            })
+    return proposals
+
+
+def recommend_indexes(stats: Dict[str, Any], queries: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Rank index recommendations from collected statistics, highest score first."""
+    recommendations = _unindexed_foreign_keys(stats)
+    for proposal in _missing_from_queries(stats, queries or []):
+        known = next((r for r in recommendations if r["table"] == proposal["table"]
+                      and r["columns"] == proposal["columns"]), None)
+        if known:
+            known["score"] = max(known["score"], proposal["score"])
+            known["reason"] += f"; {proposal['reason']}"
+        else:
+            recommendations.append(proposal)
+    recommendations += _surplus_indexes(stats)
+    return sorted(recommendations, key=lambda r: (-r["score"], r["kind"], r["table"], r["index"]))
+
+
+def advise_indexes(db_config: Dict[str, Any], queries: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Missing, duplicate, redundant and unused indexes of db_config, from Postgres statistics alone."""
+    with get_pool(db_config).connection() as conn:
+        stats = _collect(conn)
+    recommendations = recommend_indexes(stats, queries)
+    logger.info(f"Index advisor produced {len(recommendations)} recommendations")
+    return recommendations
+
+
+def format_advice(recommendations: List[Dict[str, Any]], limit: int = 20) -> str:
+    lines = []
+    for r in recommendations[:limit]:
+        lines.append(f"[{r['kind']}, score {r['score']}] {r['ddl']} -- {r['reason']}")
+    return "\n".join(lines)
+
+
+def advice_report(recommendations: List[Dict[str, Any]], limit: int = 20) -> str:
+    """Standalone markdown report, used when no LLM is available."""
+    if not recommendations:
+        return "## Index Advisor\n\nNo index changes are indicated by the current statistics."
+    lines = ["## Index Advisor", "",
+             "Recommendations derived from pg_stat_user_tables, pg_stat_user_indexes and pg_stats.", ""]
+    for r in recommendations[:limit]:
+        lines.append(f"- **{r['kind']}** `{r['index']}` on `{r['table']}` (score {r['score']}): {r['reason']}")
+    lines += ["", "```sql", *[r["ddl"] for r in recommendations[:limit]], "```"]
+    return "\n".join(lines)
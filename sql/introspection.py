@@ -0,0 +1,225 @@
+# introspection.py
+import logging
+import threading
+import time
+from typing import Dict, Any, List, Tuple
+from sql.pool import get_pool, pool_key
+
+logger = logging.getLogger(__name__)
+
+# Skip the fingerprint round trip entirely when the cache was validated this recently.
+REVALIDATE_AFTER = 5.0
+# Sizes, row estimates and scan counters change without DDL (VACUUM/ANALYZE update
+# pg_class in place), so they are cached apart from the structure and refetched this often.
+STATS_TTL = 30.0
+
+USER_NAMESPACES = """
+    n.nspname NOT IN ('pg_catalog', 'information_schema')
+    AND n.nspname NOT LIKE 'pg_toast%'
+    AND n.nspname NOT LIKE 'pg_temp_%'
+"""
+
+# Changes whenever a relation is created, dropped, altered or rewritten
+# (pg_class/pg_attribute row versions) or a constraint/index is added or removed.
+FINGERPRINT_QUERY = f"""
+    WITH rels AS (
+        SELECT c.oid, c.xmin, c.relfilenode
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE {USER_NAMESPACES}
+    )
+    SELECT concat_ws(':',
+        (SELECT md5(coalesce(string_agg(oid::text || '.' || xmin::text || '.' || relfilenode::text, ',' ORDER BY oid), ''))
+         FROM rels),
+        (SELECT count(*) || '.' || coalesce(sum(a.xmin::text::bigint), 0)
+         FROM pg_attribute a WHERE a.attrelid IN (SELECT oid FROM rels)),
+        (SELECT count(*) || '.' || coalesce(max(oid::text::bigint), 0) FROM pg_constraint),
+        (SELECT count(*) FROM pg_index WHERE indrelid IN (SELECT oid FROM rels))
+    );
+"""
+
+CATALOG_QUERY = f"""
+    SELECT n.nspname, c.relname, c.relkind,
+           (SELECT json_agg(json_build_object(
+                       'name', a.attname,
+                       'type', format_type(a.atttypid, a.atttypmod),
+                       'not_null', a.attnotnull,
+                       'default', pg_get_expr(d.adbin, d.adrelid),
+                       'identity', a.attidentity <> '',
+                       'generated', a.attgenerated <> '') ORDER BY a.attnum)
+            FROM pg_attribute a
+            LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+            WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped) AS columns,
+           (SELECT json_agg(json_build_object(
+                       'name', i.relname,
+                       'definition', pg_get_indexdef(ix.indexrelid),
+                       'unique', ix.indisunique,
+                       'primary', ix.indisprimary,
+                       'valid', ix.indisvalid) ORDER BY i.relname)
+            FROM pg_index ix
+            JOIN pg_class i ON i.oid = ix.indexrelid
+            WHERE ix.indrelid = c.oid) AS indexes,
+           (SELECT json_agg(json_build_object(
+                       'name', con.conname,
+                       'type', con.contype,
+                       'definition', pg_get_constraintdef(con.oid),
+                       'references', CASE WHEN con.contype = 'f'
+                                          THEN rn.nspname || '.' || r.relname END) ORDER BY con.conname)
+            FROM pg_constraint con
+            LEFT JOIN pg_class r ON r.oid = con.confrelid
+            LEFT JOIN pg_namespace rn ON rn.oid = r.relnamespace
+            WHERE con.conrelid = c.oid) AS constraints
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.relkind IN ('r', 'p', 'v', 'm', 'f')
+      AND NOT c.relispartition
+      AND {USER_NAMESPACES}
+    ORDER BY n.nspname, c.relname;
+"""
+
+STATS_QUERY = f"""
+    SELECT n.nspname, c.relname,
+           greatest(c.reltuples, 0)::bigint AS row_estimate,
+           CASE WHEN c.relkind IN ('r', 'm', 'p') THEN pg_total_relation_size(c.oid) END AS total_bytes,
+           s.seq_scan, s.idx_scan, s.n_live_tup,
+           (SELECT json_object_agg(i.relname, json_build_object(
+                       'bytes', pg_relation_size(ix.indexrelid),
+                       'scans', si.idx_scan))
+            FROM pg_index ix
+            JOIN pg_class i ON i.oid = ix.indexrelid
+            LEFT JOIN pg_stat_user_indexes si ON si.indexrelid = ix.indexrelid
+            WHERE ix.indrelid = c.oid) AS indexes
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE c.relkind IN ('r', 'p', 'v', 'm', 'f')
+      AND NOT c.relispartition
+      AND {USER_NAMESPACES};
+"""
+
+NO_STATS = {"row_estimate": None, "total_bytes": None, "seq_scan": None, "idx_scan": None, "n_live_tup": None}
+
+RELKINDS = {"r": "table", "p": "partitioned table", "v": "view", "m": "materialized view", "f": "foreign table"}
+
+_cache: Dict[Tuple, Dict[str, Any]] = {}
+_cache_lock = threading.Lock()
+
+
+def catalog_fingerprint(conn) -> str:
+    with conn.cursor() as cursor:
+        cursor.execute(FINGERPRINT_QUERY)
+        return cursor.fetchone()[0]
+
+
+def fetch_catalog(conn) -> Dict[str, Dict[str, Any]]:
+    """Read tables, columns, indexes and constraints in one round trip."""
+    catalog = {}
+    with conn.cursor() as cursor:
+        cursor.execute(CATALOG_QUERY)
+        for schema, name, kind, columns, indexes, constraints in cursor.fetchall():
+            catalog[f"{schema}.{name}"] = {
+                "schema": schema,
+                "name": name,
+                "kind": RELKINDS.get(kind, kind),
+                "columns": columns or [],
+                "indexes": indexes or [],
+                "constraints": constraints or [],
+            }
+    return catalog
+
+
+def fetch_stats(conn) -> Dict[str, Dict[str, Any]]:
+    """Read size estimates and scan counters, which move without any DDL."""
+    stats = {}
+    with conn.cursor() as cursor:
+        cursor.execute(STATS_QUERY)
+        for schema, name, row_estimate, total_bytes, seq_scan, idx_scan, n_live_tup, indexes in cursor.fetchall():
+            stats[f"{schema}.{name}"] = {
+                "row_estimate": row_estimate,
+                "total_bytes": total_bytes,
+                "seq_scan": seq_scan,
+                "idx_scan": idx_scan,
+                "n_live_tup": n_live_tup,
+                "indexes": indexes or {},
+            }
+    return stats
+
+
+def merge_stats(catalog: Dict[str, Dict[str, Any]], stats: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Copy of catalog with each table's and index's current statistics filled in."""
+    merged = {}
+    for key, table in catalog.items():
+        table_stats = stats.get(key, {})
+        index_stats = table_stats.get("indexes", {})
+        merged[key] = dict(table, **{k: table_stats.get(k) for k in NO_STATS}, indexes=[
+            dict(idx, bytes=index_stats.get(idx["name"], {}).get("bytes"),
+                 scans=index_stats.get(idx["name"], {}).get("scans"))
+            for idx in table["indexes"]
+        ])
+    return merged
+
+
+def get_catalog(db_config: Dict[str, Any], force: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Return the introspected catalog for db_config from the process-wide cache.
+
+    The structure is revalidated against the catalog fingerprint and only
+    refetched when the schema has actually changed; statistics are refetched
+    once they are older than STATS_TTL.
+    """
+    key = pool_key(db_config)
+    with _cache_lock:
+        entry = _cache.get(key)
+    now = time.monotonic()
+    if (entry and not force and now - entry["checked_at"] < REVALIDATE_AFTER
+            and now - entry["stats_at"] < STATS_TTL):
+        return entry["merged"]
+
+    with get_pool(db_config).connection() as conn:
+        fingerprint = catalog_fingerprint(conn)
+        if entry and not force and entry["fingerprint"] == fingerprint:
+            logger.debug("Schema fingerprint unchanged, using cached catalog")
+            catalog = entry["catalog"]
+        else:
+            start = time.perf_counter()
+            catalog = fetch_catalog(conn)
+            logger.info(f"Introspected {len(catalog)} relations in {(time.perf_counter() - start) * 1000:.1f} ms")
+        if entry and not force and catalog is entry["catalog"] and now - entry["stats_at"] < STATS_TTL:
+            stats, stats_at = entry["stats"], entry["stats_at"]
+        else:
+            stats, stats_at = fetch_stats(conn), time.monotonic()
+
+    merged = entry["merged"] if entry and stats is entry["stats"] else merge_stats(catalog, stats)
+    with _cache_lock:
+        _cache[key] = {"fingerprint": fingerprint, "catalog": catalog, "stats": stats, "stats_at": stats_at,
+                       "merged": merged, "checked_at": time.monotonic()}
+    return merged
+
+
+def get_fingerprint(db_config: Dict[str, Any]) -> str:
+    """Return the fingerprint of the cached catalog, revalidating it if needed."""
+    get_catalog(db_config)
+    with _cache_lock:
+        return _cache[pool_key(db_config)]["fingerprint"]
+
+
+def invalidate(db_config: Dict[str, Any] = None):
+    with _cache_lock:
+        if db_config is None:
+            _cache.clear()
+        else:
+            _cache.pop(pool_key(db_config), None)
+
+
+def display_name(schema: str, name: str) -> str:
+    return name if schema == "public" else f"{schema}.{name}"
+
+
+def column_summary(catalog: Dict[str, Dict[str, Any]], with_types: bool = True) -> Dict[str, List[str]]:
+    """Flatten a catalog into the legacy {table: [columns]} mapping."""
+    summary = {}
+    for table in catalog.values():
+        summary[display_name(table["schema"], table["name"])] = [
+            f"{col['name']} ({col['type']})" if with_types else col["name"]
+            for col in table["columns"]
+        ]
+    return summary
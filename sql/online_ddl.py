@@ -0,0 +1,226 @@
+# online_ddl.py
+import logging
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional
+import psycopg2
+from psycopg2 import errors
+from sql.whatif import INDEX_DDL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCK_TIMEOUT_MS = 5000
+# 0 keeps the session's statement_timeout (set through the pool), which may be none;
+# index builds on large tables legitimately take long
+DEFAULT_STATEMENT_TIMEOUT_MS = 0
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+PROGRESS_INTERVAL = 1.0
+
+# Lock acquisition failures worth waiting out and trying again
+RETRYABLE = (errors.LockNotAvailable, errors.DeadlockDetected, errors.SerializationFailure)
+
+INDEX_TABLE = re.compile(r"\bon\s+(?:only\s+)?(?P<table>(?:\"[^\"]+\"|[\w$]+)(?:\.(?:\"[^\"]+\"|[\w$]+))?)",
+                         re.IGNORECASE)
+DROP_INDEX = re.compile(r"^\s*drop\s+index\s+(?!concurrently\b)", re.IGNORECASE)
+REINDEX = re.compile(r"^\s*reindex\s+(?P<kind>index|table)\s+(?!concurrently\b)", re.IGNORECASE)
+
+PROGRESS_QUERY = """
+    SELECT phase, blocks_done, blocks_total, tuples_done, tuples_total,
+           lockers_done, lockers_total, partitions_done, partitions_total
+    FROM pg_stat_progress_create_index
+    WHERE pid = %s
+"""
+
+INVALID_INDEXES = """
+    SELECT x.indexrelid, i.oid::regclass::text
+    FROM pg_index x
+    JOIN pg_class i ON i.oid = x.indexrelid
+    WHERE x.indrelid = to_regclass(%s) AND NOT x.indisvalid
+"""
+
+
+def index_table(statement: str) -> Optional[str]:
+    match = INDEX_DDL.match(statement)
+    if not match:
+        return None
+    table = INDEX_TABLE.search(statement, match.end() - 2)
+    return table.group("table") if table else None
+
+
+def to_concurrent(statement: str) -> Optional[str]:
+    """The CONCURRENTLY form of an index build, drop or reindex; None when not applicable."""
+    statement = statement.strip().rstrip(";")
+    match = INDEX_DDL.match(statement)
+    if match:
+        if re.search(r"\bconcurrently\b", statement[:match.end()], re.IGNORECASE):
+            return None
+        return re.sub(r"\b(index)\b", lambda m: f"{m.group(1)} {'concurrently' if m.group(1).islower() else 'CONCURRENTLY'}",
+                      statement, count=1, flags=re.IGNORECASE)
+    if DROP_INDEX.match(statement):
+        # DROP INDEX CONCURRENTLY takes a single index and no CASCADE
+        if "," in statement or re.search(r"\bcascade\b", statement, re.IGNORECASE):
+            return None
+        return DROP_INDEX.sub(lambda m: f"{m.group(0).rstrip()} CONCURRENTLY ", statement, count=1)
+    if REINDEX.match(statement):
+        return REINDEX.sub(lambda m: f"{m.group(0).rstrip()} CONCURRENTLY ", statement, count=1)
+    return None
+
+
+def _is_partitioned(cursor, table: str) -> bool:
+    # CREATE INDEX CONCURRENTLY is not supported on partitioned tables
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def _invalid_indexes(cursor, table: str) -> Dict[int, str]:
+    cursor.execute(INVALID_INDEXES, (table,))
+    return dict(cursor.fetchall())
+
+
+def _fraction(progress: Dict[str, Any]) -> Optional[float]:
+    for done, total in (("blocks_done", "blocks_total"), ("tuples_done", "tuples_total"),
+                        ("lockers_done", "lockers_total")):
+        if progress.get(total):
+            return min(progress[done] / progress[total], 1.0)
+    return None
+
+
+def _read_progress(monitor, pid: int) -> Optional[Dict[str, Any]]:
+    with monitor.cursor() as cursor:
+        cursor.execute(PROGRESS_QUERY, (pid,))
+        row = cursor.fetchone()
+        columns = [d[0] for d in cursor.description]
+    monitor.rollback()
+    if not row:
+        return None
+    progress = dict(zip(columns, row))
+    progress["fraction"] = _fraction(progress)
+    return progress
+
+
+def _execute(conn, statement: str):
+    with conn.cursor() as cursor:
+        cursor.execute(statement)
+
+
+def _execute_watched(conn, statement: str, run: Callable, monitor,
+                     on_progress: Optional[Callable[[Dict[str, Any]], None]]):
+    """Run statement on conn in a worker thread while the calling thread reports
+    its pg_stat_progress_create_index row, so callbacks run on the caller's thread."""
+    if monitor is None or on_progress is None:
+        return run(conn, statement)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_backend_pid()")
+        pid = cursor.fetchone()[0]
+    outcome = {}
+
+    def work():
+        try:
+            outcome["output"] = run(conn, statement)
+        except BaseException as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=work, daemon=True)
+    worker.start()
+    while worker.is_alive():
+        worker.join(PROGRESS_INTERVAL)
+        if worker.is_alive():
+            try:
+                progress = _read_progress(monitor, pid)
+            except psycopg2.Error as e:
+                logger.debug(f"Progress query failed: {str(e)}")
+                monitor.rollback()
+                continue
+            if progress:
+                on_progress(progress)
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("output")
+
+
+def _drop_invalid(conn, table: str, known: Dict[int, str], lock_timeout_ms: int) -> List[str]:
+    """Drop INVALID indexes a failed concurrent build left on table."""
+    dropped = []
+    with conn.cursor() as cursor:
+        for oid, name in _invalid_indexes(cursor, table).items():
+            if oid in known:
+                continue
+            for attempt in range(DEFAULT_RETRIES):
+                try:
+                    cursor.execute(f"SET lock_timeout = {int(lock_timeout_ms)}")
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                    dropped.append(name)
+                    logger.info(f"Dropped invalid index {name} left by a failed build")
+                    break
+                except RETRYABLE:
+                    time.sleep(min(DEFAULT_BACKOFF * 2 ** attempt, MAX_BACKOFF))
+                except psycopg2.Error as e:
+                    logger.error(f"Could not drop invalid index {name}: {str(e).strip()}")
+                    break
+    return dropped
+
+
+def run_online(conn, statement: str, monitor=None, on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+               run: Callable = _execute, lock_timeout_ms: int = DEFAULT_LOCK_TIMEOUT_MS, statement_timeout_ms: int = DEFAULT_STATEMENT_TIMEOUT_MS,
+               retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF) -> Dict[str, Any]:
+    """Run one DDL statement without holding long blocking locks.
+
+    Index builds, drops and reindexes are rewritten to their CONCURRENTLY
+    form. The statement runs in autocommit mode under lock_timeout and is
+    retried with exponential backoff while it cannot get its lock. When a
+    concurrent build fails, the INVALID index it leaves behind is dropped.
+    monitor is an optional second connection used to report build progress;
+    run(conn, statement) executes the statement and its return value is kept
+    as the result's "output".
+    """
+    result = {"statement": statement.strip().rstrip(";"), "rewritten_from": None, "status": "pending",
+              "attempts": 0, "cleaned_up": [], "output": None, "error": None, "sqlstate": None}
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        table = index_table(result["statement"])
+        concurrent = to_concurrent(result["statement"])
+        if concurrent and not (table and _is_partitioned(cursor, table)):
+            result["rewritten_from"], result["statement"] = result["statement"], concurrent
+        builds_concurrently = table is not None and bool(re.search(r"\bconcurrently\b", result["statement"], re.IGNORECASE))
+        cursor.execute(f"SET lock_timeout = {int(lock_timeout_ms)}")
+        # 0 keeps the session default configured through the pool
+        if statement_timeout_ms > 0:
+            cursor.execute(f"SET statement_timeout = {int(statement_timeout_ms)}")
+
+    try:
+        for attempt in range(retries + 1):
+            result["attempts"] = attempt + 1
+            known = {}
+            if builds_concurrently:
+                with conn.cursor() as cursor:
+                    known = _invalid_indexes(cursor, table)
+            try:
+                result["output"] = _execute_watched(conn, result["statement"], run,
+                                                    monitor if builds_concurrently else None, on_progress)
+                result["status"] = "ok"
+                result["error"] = result["sqlstate"] = None
+                break
+            except psycopg2.Error as e:
+                result["status"] = "error"
+                result["error"] = str(e).strip()
+                result["sqlstate"] = e.pgcode
+                if builds_concurrently:
+                    result["cleaned_up"] += _drop_invalid(conn, table, known, lock_timeout_ms)
+                if not isinstance(e, RETRYABLE) or attempt == retries:
+                    break
+                delay = min(backoff * 2 ** attempt, MAX_BACKOFF) * random.uniform(0.5, 1.0)
+                logger.warning(f"Lock not available for {result['statement'][:50]}..., retrying in {delay:.1f}s")
+                time.sleep(delay)
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("RESET lock_timeout")
+            if statement_timeout_ms > 0:
+                cursor.execute("RESET statement_timeout")
+        conn.autocommit = autocommit
+    return result
@@ -0,0 +1,271 @@
+# pool.py
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+import psycopg2
+from psycopg2 import extensions
+from utils.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+# db_config keys that are applied as per-session settings instead of being
+# passed to psycopg2.connect as connection parameters.
+SESSION_SETTINGS = ("search_path", "statement_timeout", "lock_timeout")
+
+DEFAULT_MAX_CONNECTIONS = 10
+DEFAULT_IDLE_TIMEOUT = 300.0
+DEFAULT_HEALTH_CHECK_INTERVAL = 30.0
+DEFAULT_CHECKOUT_TIMEOUT = 30.0
+
+
+class PoolExhaustedError(RuntimeError):
+    pass
+
+
+def split_db_config(db_config: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Split a db_config into psycopg2 connection parameters and session settings."""
+    params = {k: v for k, v in db_config.items() if k not in SESSION_SETTINGS and v is not None}
+    settings = {k: db_config[k] for k in SESSION_SETTINGS if db_config.get(k) is not None}
+    return params, settings
+
+
+# Passwords by server and role, so configs persisted without one (graph
+# checkpoints) still connect once the same server has been used in this process
+_passwords: Dict[Tuple, str] = {}
+_passwords_lock = threading.Lock()
+
+
+def _server(db_config: Dict[str, Any]) -> Tuple:
+    return tuple(str(db_config.get(k)) for k in ("host", "port", "user"))
+
+
+def with_password(db_config: Dict[str, Any]) -> Dict[str, Any]:
+    """db_config with its password, remembered from an earlier config of the same server if missing."""
+    with _passwords_lock:
+        if db_config.get("password") is not None:
+            _passwords[_server(db_config)] = db_config["password"]
+            return db_config
+        password = _passwords.get(_server(db_config))
+    return db_config if password is None else dict(db_config, password=password)
+
+
+def redact(db_config: Dict[str, Any]) -> Dict[str, Any]:
+    """db_config without its password, e.g. before it is written to disk; get_pool restores it."""
+    with_password(db_config)
+    return {k: v for k, v in db_config.items() if k != "password"}
+
+
+def pool_key(db_config: Dict[str, Any]) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in with_password(db_config).items() if v is not None))
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "last_used", "last_checked")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.last_used = now
+        self.last_checked = now
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        db_config: Dict[str, Any],
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL,
+        checkout_timeout: float = DEFAULT_CHECKOUT_TIMEOUT,
+    ):
+        self.db_config = db_config
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+        self._params, self._settings = split_db_config(db_config)
+        self._idle: List[_PooledConnection] = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _options(self) -> Optional[str]:
+        # Settings passed as startup options become the session defaults, so a
+        # RESET ALL issued by a caller still lands on the configured values.
+        if not self._settings:
+            return None
+        options = [self._params.get("options", "")]
+        for name, value in self._settings.items():
+            value = str(value).replace(" ", "\\ ")
+            options.append(f"-c {name}={value}")
+        return " ".join(o for o in options if o)
+
+    def _connect(self):
+        params = dict(self._params)
+        options = self._options()
+        if options:
+            params["options"] = options
+        start = time.perf_counter()
+        conn = psycopg2.connect(**params)
+        conn.autocommit = False
+        logger.debug(f"Opened connection to {self._params.get('database')} in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return conn
+
+    def _is_healthy(self, entry: _PooledConnection) -> bool:
+        if entry.conn.closed:
+            return False
+        if time.monotonic() - entry.last_checked < self.health_check_interval:
+            return True
+        try:
+            with entry.conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            entry.conn.rollback()
+            entry.last_checked = time.monotonic()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Discarding unhealthy pooled connection: {str(e)}")
+            return False
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        keep = []
+        for entry in self._idle:
+            if now - entry.last_used > self.idle_timeout:
+                self._close_quietly(entry.conn)
+            else:
+                keep.append(entry)
+        self._idle = keep
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                self._evict_idle()
+                entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    if self._in_use >= self.max_connections:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise PoolExhaustedError(
+                                f"No free connection to {self._params.get('database')} "
+                                f"after {self.checkout_timeout}s ({self.max_connections} in use)"
+                            )
+                        self._cond.wait(remaining)
+                        continue
+                self._in_use += 1
+            if entry is not None:
+                # Health checks run outside the lock so a slow round trip does
+                # not block other threads checking out connections.
+                if self._is_healthy(entry):
+                    return entry.conn
+                self._close_quietly(entry.conn)
+                self._release_slot()
+                continue
+            try:
+                return self._connect()
+            except Exception:
+                self._release_slot()
+                raise
+
+    def _release_slot(self):
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def putconn(self, conn, discard: bool = False):
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard or conn.closed or self._closed:
+                self._close_quietly(conn)
+            else:
+                entry = _PooledConnection(conn)
+                self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection, returning it to the pool when the block exits.
+
+        The transaction is committed on success and rolled back on error.
+        """
+        with span("db.connection", "db", **{"db.name": self._params.get("database")}) as session:
+            start = time.perf_counter()
+            conn = self.getconn()
+            session.set(**{"db.connect_ms": round((time.perf_counter() - start) * 1000, 3)})
+            discard = False
+            try:
+                yield conn
+                if not conn.closed and not conn.autocommit:
+                    conn.commit()
+            except Exception:
+                if not conn.closed:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        discard = True
+                raise
+            finally:
+                self.putconn(conn, discard=discard or bool(conn.closed))
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for entry in self._idle:
+                self._close_quietly(entry.conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"idle": len(self._idle), "in_use": self._in_use, "max": self.max_connections}
+
+
+_pools: Dict[Tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_config: Dict[str, Any], **kwargs) -> ConnectionPool:
+    """Return the process-wide pool for db_config, creating it on first use."""
+    db_config = with_password(db_config)
+    key = pool_key(db_config)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(dict(db_config), **kwargs)
+            _pools[key] = pool
+            logger.info(f"Created connection pool for {db_config.get('database')}")
+        return pool
+
+
+def close_pool(db_config: Dict[str, Any]):
+    """Close and forget the pool for db_config, e.g. before its database is dropped."""
+    with _pools_lock:
+        pool = _pools.pop(pool_key(db_config), None)
+    if pool is not None:
+        pool.closeall()
+
+
+def close_all_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
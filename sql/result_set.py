@@ -0,0 +1,153 @@
+# result_set.py
+import logging
+import re
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from sql.pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MAX_ROWS = 1000
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+DATA_MODIFYING = re.compile(r"\b(insert|update|delete|merge)\b", re.IGNORECASE)
+
+
+def is_read_only_query(query: str) -> bool:
+    """True for statements a server-side (DECLARE) cursor can run."""
+    # utils.sql_utils imports this module
+    from utils.sql_utils import _strip_leading_comments
+    query = _strip_leading_comments(query)
+    words = query.lstrip("( \n\t").split(None, 1)
+    if not words:
+        return False
+    first = words[0].lower()
+    if first in ("values", "table"):
+        return True
+    if first == "select":
+        return not _select_into(query)
+    return first == "with" and not DATA_MODIFYING.search(query)
+
+
+def _select_into(query: str) -> bool:
+    # SELECT ... INTO new_table creates a table and cannot be declared as a cursor
+    return bool(re.match(r"^\s*select\b(?:(?!\bfrom\b).)*\binto\b", query, re.IGNORECASE | re.DOTALL))
+
+
+@dataclass
+class QueryResult:
+    """Bounded result of one statement: column names plus row tuples."""
+    query: str
+    columns: List[str] = field(default_factory=list)
+    rows: List[tuple] = field(default_factory=list)
+    rowcount: int = -1
+    truncated: bool = False
+    bytes: int = 0
+    db_config: Optional[Dict[str, Any]] = field(default=None, repr=False)
+    _total: Optional[int] = field(default=None, repr=False)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+    def total_count(self) -> Optional[int]:
+        """Number of rows the full query returns, counted on the server on first use."""
+        if self._total is None:
+            if not self.truncated:
+                self._total = len(self.rows)
+            elif self.db_config is None or not is_read_only_query(self.query):
+                return None
+            else:
+                with get_pool(self.db_config).connection() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute(f"SELECT count(*) FROM ({self.query}) AS stonebraker_count")
+                        self._total = cursor.fetchone()[0]
+        return self._total
+
+
+def _row_bytes(row: tuple) -> int:
+    # Cheap approximation of the in-memory footprint of a row
+    return sum(len(str(v)) for v in row if v is not None) + 8 * len(row)
+
+
+def iter_batches(conn, query: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Tuple[List[str], List[tuple]]]:
+    """Yield (columns, rows) batches from a named server-side cursor.
+
+    Must run inside a transaction (autocommit off) on conn.
+    """
+    with conn.cursor(name=f"stonebraker_{uuid.uuid4().hex[:12]}") as cursor:
+        cursor.itersize = batch_size
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [d[0] for d in cursor.description], rows
+
+
+def _fetch_named(conn, result: QueryResult, max_rows: int, max_bytes: int, batch_size: int) -> QueryResult:
+    with conn.cursor(name=f"stonebraker_{uuid.uuid4().hex[:12]}") as named:
+        named.itersize = batch_size
+        named.execute(result.query)
+        while not result.truncated:
+            rows = named.fetchmany(min(batch_size, max_rows - len(result.rows) + 1))
+            if not result.columns and named.description:
+                result.columns = [d[0] for d in named.description]
+            if not rows:
+                break
+            for row in rows:
+                size = _row_bytes(row)
+                if len(result.rows) >= max_rows or result.bytes + size > max_bytes:
+                    result.truncated = True
+                    break
+                result.rows.append(tuple(row))
+                result.bytes += size
+    result.rowcount = len(result.rows)
+    return result
+
+
+def fetch_bounded(conn, query: str, max_rows: int = DEFAULT_MAX_ROWS, max_bytes: int = DEFAULT_MAX_BYTES,
+                  batch_size: int = DEFAULT_BATCH_SIZE, cursor=None) -> QueryResult:
+    """Execute query on conn and materialize at most max_rows rows / max_bytes bytes.
+
+    Read-only queries stream through a named server-side cursor so the
+    server never ships more than what is kept; on an autocommit connection
+    they run in a short transaction of their own, which such a cursor needs.
+    Other statements run on cursor (or a new client cursor) and report their
+    rowcount.
+    """
+    result = QueryResult(query=query)
+    if is_read_only_query(query):
+        if not conn.autocommit:
+            return _fetch_named(conn, result, max_rows, max_bytes, batch_size)
+        conn.autocommit = False
+        try:
+            _fetch_named(conn, result, max_rows, max_bytes, batch_size)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+        return result
+
+    own_cursor = cursor is None
+    cursor = cursor or conn.cursor()
+    try:
+        cursor.execute(query)
+        result.rowcount = cursor.rowcount
+        if cursor.description:
+            result.columns = [d[0] for d in cursor.description]
+            for row in cursor.fetchmany(max_rows):
+                size = _row_bytes(tuple(row.values()) if isinstance(row, dict) else row)
+                if result.bytes + size > max_bytes:
+                    result.truncated = True
+                    break
+                result.rows.append(tuple(row.values()) if isinstance(row, dict) else tuple(row))
+                result.bytes += size
+            result.truncated = result.truncated or cursor.rowcount > len(result.rows)
+    finally:
+        if own_cursor:
+            cursor.close()
+    return result
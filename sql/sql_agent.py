@@ -1,9 +1,21 @@
 # sql_agent.py
 import logging
-from typing import Dict, Any, List
+import time
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from psycopg2 import sql as psql
+from psycopg2 import errors
+from psycopg2.errorcodes import QUERY_CANCELED
+from sql.pool import get_pool
+from sql.introspection import get_catalog, column_summary
+from sql.result_set import (
+    DEFAULT_BATCH_SIZE, DEFAULT_MAX_BYTES, DEFAULT_MAX_ROWS, QueryResult, fetch_bounded, iter_batches,
+)
+from sql.budget import Budget, BudgetExceeded
+from sql.online_ddl import DEFAULT_LOCK_TIMEOUT_MS, run_online
+from sql.undo_log import UndoRecorder
+from sql.validator import invalid, validate_script
+from utils.sql_utils import split_sql_statements, requires_autocommit
+from utils.telemetry import span
 
 logger = logging.getLogger(__name__)
 
@@ -11,74 +23,216 @@ class SQLAgent:
     def __init__(self, db_config: Dict[str, Any], name: str = "SQLAgent"):
         self.db_config = db_config
         self.name = name
-        self._schema = None
+        self.pool = get_pool(db_config)
         logger.info(f"Initialized SQLAgent for {db_config['database']}")
 
     def get_connection(self):
-        try:
-            conn = psycopg2.connect(
-                host=self.db_config["host"],
-                port=self.db_config["port"],
-                user=self.db_config["user"],
-                password=self.db_config["password"],
-                database=self.db_config["database"]
-            )
-            conn.autocommit = False
-            return conn
-        except Exception as e:
-            logger.error(f"Connection failed: {str(e)}")
-            raise
+        """Check out a pooled connection; use as a context manager."""
+        return self.pool.connection()
 
     def get_schema(self) -> Dict[str, List[str]]:
-        if self._schema:
-            return self._schema
-            
-        logger.debug("Fetching schema...")
-        schema = {}
         try:
-            with self.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("""
-                        SELECT table_name, column_name, data_type 
-                        FROM information_schema.columns 
-                        WHERE table_schema = 'public'
-                        ORDER BY table_name, ordinal_position;
-                    """)
-                    for table, column, dtype in cursor.fetchall():
-                        if table not in schema:
-                            schema[table] = []
-                        schema[table].append(f"{column} ({dtype})")
-                    self._schema = schema
-                    logger.info(f"Schema loaded with {len(schema)} tables")
-                    return schema
+            schema = column_summary(self.get_schema_details())
+            logger.info(f"Schema loaded with {len(schema)} tables")
+            return schema
         except Exception as e:
             logger.error(f"Schema fetch failed: {str(e)}")
             raise
 
-    def execute_query(self, query: str) -> List[Dict]:
+    def get_schema_details(self) -> Dict[str, Dict[str, Any]]:
+        logger.debug("Fetching schema...")
+        return get_catalog(self.db_config)
+
+    def execute_query(self, query: str, max_rows: int = DEFAULT_MAX_ROWS) -> List[Dict]:
+        return self.stream_query(query, max_rows=max_rows).to_dicts()
+
+    def stream_query(self, query: str, max_rows: int = DEFAULT_MAX_ROWS, max_bytes: int = DEFAULT_MAX_BYTES,
+                     batch_size: int = DEFAULT_BATCH_SIZE) -> QueryResult:
+        """Execute a query keeping at most max_rows rows / max_bytes bytes of its result."""
         logger.info(f"Executing query: {query[:100]}...")
         try:
-            with self.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    cursor.execute(query)
-                    result = cursor.fetchall()
-                    conn.commit()
-                    logger.debug(f"Query affected {cursor.rowcount} rows")
-                    return result
+            with self.get_connection() as conn, span("db.query", "db", **{"db.statement": query}) as stmt:
+                result = fetch_bounded(conn, query, max_rows, max_bytes, batch_size)
+                stmt.set(**{"db.rows": result.rowcount})
+                result.db_config = self.db_config
+                logger.debug(f"Query affected {result.rowcount} rows (truncated: {result.truncated})")
+                return result
         except psycopg2.Error as e:
             logger.error(f"Query error: {str(e)}")
-            conn.rollback()
             raise RuntimeError(f"SQL Error: {str(e)}") from e
         except Exception as e:
             logger.error(f"Execution failed: {str(e)}")
             raise RuntimeError(f"Execution error: {str(e)}") from e
 
+    def iter_query(self, query: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """Stream (columns, rows) batches of a read-only query from a server-side cursor."""
+        with self.get_connection() as conn:
+            yield from iter_batches(conn, query, batch_size)
+
     def validate_query(self, query: str) -> bool:
         try:
-            with self.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute(psql.SQL("EXPLAIN {query}").format(query=psql.SQL(query)))
-                    return True
+            problems = invalid(validate_script(self.db_config, query))
         except Exception as e:
             logger.warning(f"Invalid query: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+        if problems:
+            logger.warning(f"Invalid query: {problems[0]['error']}")
+        return not problems
+
+    def execute_script(self, script: str, mode: str = "transaction", max_rows: int = DEFAULT_MAX_ROWS,
+                       max_bytes: int = DEFAULT_MAX_BYTES, on_progress: Optional[Callable] = None,
+                       lock_timeout_ms: int = DEFAULT_LOCK_TIMEOUT_MS,
+                       budget: Optional[Budget] = None, undo: Optional[UndoRecorder] = None) -> List[Dict[str, Any]]:
+        """
+        Run every statement of a script over one connection.
+
+        mode="transaction" runs the script as a single transaction: the first
+        failure rolls everything back and the remaining statements are skipped.
+        mode="savepoint" wraps each statement in a savepoint so a failure only
+        undoes that statement and the rest are committed together.
+        Statements PostgreSQL refuses inside a transaction block (VACUUM,
+        CREATE INDEX CONCURRENTLY, ...) commit the work so far and run in
+        autocommit mode. Each statement keeps at most max_rows rows of output.
+        mode="online" commits every statement on its own under lock_timeout,
+        see execute_online.
+        Statements run under budget (unlimited by default). One that runs out of
+        time gets status "timeout", or "cancelled" when the run was cancelled,
+        and is handled like a failure; a cancelled or exhausted budget skips the
+        statements that have not started yet.
+        With an undo recorder, every statement that commits is journaled
+        together with its inverse, so it can be rolled back later.
+        """
+        if mode not in ("transaction", "savepoint", "online"):
+            raise ValueError(f"Unknown execution mode: {mode}")
+        statements = split_sql_statements(script)
+        results = [{"index": i, "statement": stmt, "status": "pending", "rowcount": None,
+                    "columns": [], "rows": [], "truncated": False, "elapsed_ms": None, "error": None}
+                   for i, stmt in enumerate(statements, 1)]
+        logger.info(f"Executing script of {len(statements)} statements ({mode} mode)")
+        budget = budget or Budget(statement_timeout_ms=0, phase_timeout_s=0)
+        if mode == "online":
+            return self.execute_online(results, max_rows, max_bytes, on_progress, lock_timeout_ms, budget, undo)
+        committed_upto = 0
+        pending = {}
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                for result in results:
+                    statement = result["statement"]
+                    autocommit = requires_autocommit(statement)
+                    savepoint = mode == "savepoint" and not autocommit
+                    with span("db.statement", "db", **{"db.statement": statement, "db.mode": mode}) as stmt:
+                        start = time.perf_counter()
+                        try:
+                            if autocommit:
+                                logger.warning(f"Running outside the transaction: {statement[:50]}...")
+                                conn.commit()
+                                conn.autocommit = True
+                            if undo:
+                                pending[result["index"]] = undo.before(conn, statement)
+                            with budget.guard(conn):
+                                if savepoint:
+                                    cursor.execute("SAVEPOINT stonebraker_stmt")
+                                try:
+                                    fetched = fetch_bounded(conn, statement, max_rows, max_bytes, cursor=cursor)
+                                    result.update(columns=fetched.columns, rows=fetched.rows,
+                                                  truncated=fetched.truncated, rowcount=fetched.rowcount)
+                                    if savepoint:
+                                        cursor.execute("RELEASE SAVEPOINT stonebraker_stmt")
+                                    result["status"] = "ok"
+                                    if undo:
+                                        undo.after(conn, pending[result["index"]])
+                                except psycopg2.Error as e:
+                                    result["status"] = budget.outcome(e)
+                                    result["error"] = str(e).strip()
+                                    logger.error(f"Statement {result['index']} failed ({result['status']}): {result['error']}")
+                                    if savepoint:
+                                        cursor.execute("ROLLBACK TO SAVEPOINT stonebraker_stmt")
+                        except BudgetExceeded as e:
+                            result["status"] = e.outcome
+                            result["error"] = str(e)
+                            logger.error(f"Statement {result['index']} not started: {result['error']}")
+                        finally:
+                            result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                            if autocommit:
+                                conn.autocommit = False
+                                committed_upto = result["index"]
+                                if undo and result["status"] == "ok":
+                                    undo.commit([pending.pop(result["index"])])
+                        stmt.set(**{"db.rows": result["rowcount"], "db.status": result["status"]})
+
+                    stop = result["status"] != "ok" and (mode == "transaction" or budget.cancelled
+                                                         or budget.remaining_ms() == 0)
+                    if stop:
+                        if mode == "transaction":
+                            conn.rollback()
+                        for other in results:
+                            if other["status"] == "ok" and other["index"] > committed_upto and mode == "transaction":
+                                other["status"] = "rolled_back"
+                            elif other["status"] == "pending":
+                                other["status"] = "skipped"
+                        break
+        if undo:
+            # Only now are the transactional statements committed
+            undo.commit([pending[r["index"]] for r in results if r["status"] == "ok" and r["index"] in pending])
+        return results
+
+    def execute_online(self, results: List[Dict[str, Any]], max_rows: int, max_bytes: int,
+                       on_progress: Optional[Callable], lock_timeout_ms: int,
+                       budget: Budget, undo: Optional[UndoRecorder] = None) -> List[Dict[str, Any]]:
+        """
+        Run each statement in autocommit mode without blocking the tables it touches.
+
+        Index builds, drops and reindexes are rewritten to CONCURRENTLY, every
+        statement gives up on its lock after lock_timeout_ms and is retried with
+        backoff. on_progress(index, progress) receives pg_stat_progress_create_index
+        rows of a running build. A failed statement does not stop the rest.
+        """
+        def run(conn, statement):
+            return fetch_bounded(conn, statement, max_rows, max_bytes)
+
+        with self.get_connection() as conn, self.get_connection() as monitor:
+            # Keeps the budget's own settings from opening a transaction between statements
+            conn.autocommit = True
+            for result in results:
+                callback = (lambda progress, index=result["index"]: on_progress(index, progress)) if on_progress else None
+                start = time.perf_counter()
+                entry = undo.before(conn, result["statement"]) if undo else None
+                try:
+                    with budget.guard(conn), span("db.statement", "db", **{"db.statement": result["statement"],
+                                                                         "db.mode": "online"}) as stmt:
+                        outcome = run_online(conn, result["statement"], monitor=monitor, on_progress=callback,
+                                             run=run, lock_timeout_ms=lock_timeout_ms,
+                                             statement_timeout_ms=budget.effective_timeout_ms())
+                        stmt.set(**{"db.status": outcome["status"], "db.attempts": outcome["attempts"],
+                                    "db.rows": outcome["output"].rowcount if outcome["output"] is not None else None})
+                except BudgetExceeded as e:
+                    result.update(status=e.outcome, error=str(e))
+                    for other in results:
+                        if other["status"] == "pending":
+                            other["status"] = "skipped"
+                    break
+                result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                if outcome["sqlstate"] == QUERY_CANCELED:
+                    outcome["status"] = budget.outcome(errors.QueryCanceled())
+                result.update(status=outcome["status"], error=outcome["error"], attempts=outcome["attempts"],
+                              rewritten_from=outcome["rewritten_from"], cleaned_up=outcome["cleaned_up"])
+                if outcome["rewritten_from"]:
+                    result["statement"] = outcome["statement"]
+                if outcome["output"] is not None:
+                    fetched = outcome["output"]
+                    result.update(columns=fetched.columns, rows=fetched.rows,
+                                  truncated=fetched.truncated, rowcount=fetched.rowcount)
+                if result["status"] != "ok":
+                    logger.error(f"Statement {result['index']} failed ({result['status']}): {result['error']}")
+                elif undo:
+                    undo.after(conn, entry, result["statement"])
+                    undo.commit([entry])
+        return results
+
+    def execute_queries(self, queries: str, budget: Optional[Budget] = None,
+                        undo: Optional[UndoRecorder] = None) -> List[Dict[str, Any]]:
+        results = self.execute_script(queries, budget=budget, undo=undo)
+        failed = [r for r in results if r["status"] in ("error", "timeout", "cancelled")]
+        if failed:
+            raise RuntimeError(f"SQL Error in statement {failed[0]['index']}: {failed[0]['error']}")
+        return results
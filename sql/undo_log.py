@@ -0,0 +1,638 @@
+# undo_log.py
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import psycopg2
+from sql.pool import get_pool
+from sql.online_ddl import DEFAULT_LOCK_TIMEOUT_MS, index_table, run_online
+from utils.sql_utils import split_sql_statements
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_PATH = ".undo_journal.sqlite"
+
+# Entry status: APPLIED entries have an inverse that has not been replayed yet
+APPLIED = "applied"
+UNDONE = "undone"
+NOOP = "noop"
+IRREVERSIBLE = "irreversible"
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS undo_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session TEXT NOT NULL,
+        target TEXT NOT NULL,
+        source TEXT NOT NULL,
+        recorded_at REAL NOT NULL,
+        statement TEXT NOT NULL,
+        inverse TEXT,
+        search_path TEXT,
+        status TEXT NOT NULL,
+        note TEXT,
+        undone_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS undo_entries_session ON undo_entries (session, target, id);
+"""
+
+IDENT = r'(?:"(?:[^"]|"")+"|[\w$]+)'
+NAME = rf"{IDENT}(?:\s*\.\s*{IDENT})?"
+
+# Statements that leave nothing to undo: reads, session settings and maintenance
+NO_CHANGE = re.compile(
+    r"^(?:select|values|table|show|set|reset|explain|vacuum|analy[sz]e|reindex|cluster|checkpoint|discard|"
+    r"refresh\s+materialized\s+view|begin|start\s+transaction|commit|end|rollback|abort|lock|listen|notify|"
+    r"prepare|deallocate|load)\b",
+    re.IGNORECASE,
+)
+DATA_CHANGE = re.compile(r"\b(?:insert|update|delete|merge|truncate|copy)\b", re.IGNORECASE)
+CREATE_INDEX = re.compile(r"^create\s+(?:unique\s+)?index\b", re.IGNORECASE)
+CREATE_OBJECT = re.compile(
+    rf"^create\s+(?P<replace>or\s+replace\s+)?(?:(?:global|local)\s+)?(?:(?P<temp>temp|temporary)\s+|unlogged\s+)?"
+    rf"(?:recursive\s+)?(?P<kind>table|materialized\s+view|view|sequence|statistics|extension)\s+"
+    rf"(?P<if_not_exists>if\s+not\s+exists\s+)?(?P<name>{NAME})",
+    re.IGNORECASE,
+)
+DROP_OBJECT = re.compile(
+    r"^drop\s+(?P<kind>index|materialized\s+view|view|statistics)\s+(?:concurrently\s+)?(?:if\s+exists\s+)?"
+    r"(?P<names>.+?)(?:\s+(?P<behavior>cascade|restrict))?$",
+    re.IGNORECASE | re.DOTALL,
+)
+ALTER_RELATION = re.compile(
+    rf"^alter\s+(?P<kind>table|index)\s+(?:if\s+exists\s+)?(?:only\s+)?(?P<name>{NAME})\s*\*?\s+(?P<actions>.+)$",
+    re.IGNORECASE | re.DOTALL,
+)
+ALTER_SYSTEM = re.compile(r"^alter\s+system\s+(?:set\s+(?P<set>[\w.]+)\s*(?:=|to)\s*.+|reset\s+(?P<reset>[\w.]+))$",
+                          re.IGNORECASE | re.DOTALL)
+COMMENT_ON = re.compile(
+    rf"^comment\s+on\s+(?P<kind>table|index|view|materialized\s+view|column)\s+(?P<name>{NAME}(?:\s*\.\s*{IDENT})?)\s+is\s+",
+    re.IGNORECASE,
+)
+
+COLUMN_QUERY = """
+    SELECT a.attnotnull, format_type(a.atttypid, a.atttypmod), coalesce(a.attstattarget, -1)::int,
+           a.attstorage, a.attoptions, pg_get_expr(d.adbin, d.adrelid)
+    FROM pg_attribute a
+    LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+    WHERE a.attrelid = to_regclass(%s) AND a.attname = %s AND a.attnum > 0 AND NOT a.attisdropped
+"""
+
+RELATION_QUERY = """
+    SELECT c.reloptions, c.relpersistence,
+           (SELECT quote_ident(i.relname) FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+            WHERE x.indrelid = c.oid AND x.indisclustered)
+    FROM pg_class c
+    WHERE c.oid = to_regclass(%s)
+"""
+
+# Columns and constraints an ALTER TABLE ... ADD may create
+MEMBERS_QUERY = """
+    SELECT 'constraint', quote_ident(conname) FROM pg_constraint WHERE conrelid = to_regclass(%s)
+    UNION ALL
+    SELECT 'column', quote_ident(attname) FROM pg_attribute
+    WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+"""
+
+INDEX_OIDS_QUERY = "SELECT indexrelid::int8 FROM pg_index WHERE indrelid = to_regclass(%s)"
+
+NEW_INDEXES_QUERY = """
+    SELECT quote_ident(n.nspname) || '.' || quote_ident(c.relname)
+    FROM pg_index x
+    JOIN pg_class c ON c.oid = x.indexrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE x.indrelid = to_regclass(%s) AND NOT x.indexrelid::int8 = ANY(%s::int8[])
+"""
+
+STATISTICS_QUERY = """
+    SELECT pg_get_statisticsobjdef(s.oid)
+    FROM pg_statistic_ext s
+    JOIN pg_namespace n ON n.oid = s.stxnamespace
+    WHERE s.stxname = %s AND (n.nspname = %s OR (%s IS NULL AND pg_statistics_obj_is_visible(s.oid)))
+"""
+
+AUTO_CONF_QUERY = """
+    SELECT setting FROM pg_file_settings
+    WHERE name = %s AND sourcefile LIKE '%%postgresql.auto.conf'
+    ORDER BY seqno DESC LIMIT 1
+"""
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def target_of(db_config: Dict[str, Any]) -> str:
+    """Identity of the database a journal entry applies to."""
+    return f"{db_config.get('host')}:{db_config.get('port')}/{db_config.get('database')}"
+
+
+def _unquote(ident: str) -> str:
+    ident = ident.strip()
+    if ident.startswith('"'):
+        return ident[1:-1].replace('""', '"')
+    return ident.lower()
+
+
+def _parts(name: str) -> List[str]:
+    return [p.strip() for p in re.findall(IDENT, name)]
+
+
+def _split_top(text: str) -> List[str]:
+    """Split on commas outside parentheses and quotes."""
+    parts, depth, quote, current = [], 0, None, []
+    for ch in text:
+        if quote:
+            quote = None if ch == quote else quote
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    parts.append("".join(current).strip())
+    return [p for p in parts if p]
+
+
+def _normalize(statement: str) -> str:
+    statement = re.sub(r"^(?:\s*(?:--[^\n]*\n?|/\*.*?\*/))*", "", statement, flags=re.DOTALL)
+    return statement.strip().rstrip(";").strip()
+
+
+def _one(cursor, query: str, params: Tuple = ()) -> Optional[tuple]:
+    cursor.execute(query, params)
+    return cursor.fetchone()
+
+
+def _literal(cursor, value: Optional[str]) -> str:
+    return "NULL" if value is None else cursor.mogrify("%s", (value,)).decode()
+
+
+def _options(options: Optional[List[str]]) -> Dict[str, str]:
+    return dict(o.split("=", 1) for o in options or [])
+
+
+def _restore_options(prefix: str, keys: List[str], before: Dict[str, str]) -> List[str]:
+    """Statements putting the storage parameters keys back to their values in before."""
+    keep = [f"{k} = {before[k]}" for k in keys if k in before]
+    drop = [k for k in keys if k not in before]
+    statements = []
+    if keep:
+        statements.append(f"{prefix} SET ({', '.join(keep)})")
+    if drop:
+        statements.append(f"{prefix} RESET ({', '.join(drop)})")
+    return statements
+
+
+def _option_keys(params: str) -> List[str]:
+    return [p.split("=", 1)[0].strip().lower() for p in _split_top(params)]
+
+
+class Irreversible(RuntimeError):
+    """The statement changed something its inverse cannot restore."""
+
+
+@dataclass
+class UndoEntry:
+    statement: str
+    inverse: Optional[str] = None
+    search_path: str = ""
+    note: str = ""
+    # Completes the inverse once the statement has run, e.g. names of the indexes it created
+    finish: Optional[Callable[[Any], str]] = field(default=None, repr=False)
+
+    @property
+    def status(self) -> str:
+        if self.inverse is None:
+            return IRREVERSIBLE
+        return APPLIED if self.inverse else NOOP
+
+
+def _create_index(cursor, statement: str):
+    table = index_table(statement)
+    if not table:
+        raise Irreversible("index table not found")
+    cursor.execute(INDEX_OIDS_QUERY, (table,))
+    known = [row[0] for row in cursor.fetchall()]
+
+    def finish(cursor) -> str:
+        # Covers unnamed indexes and IF NOT EXISTS builds that found the index already there
+        cursor.execute(NEW_INDEXES_QUERY, (table, known))
+        return ";\n".join(f"DROP INDEX IF EXISTS {name}" for (name,) in cursor.fetchall())
+    return finish
+
+
+def _create_object(cursor, match) -> str:
+    kind = " ".join(match.group("kind").upper().split())
+    name = match.group("name")
+    if match.group("temp"):
+        return ""
+    if kind == "EXTENSION":
+        existed = _one(cursor, "SELECT 1 FROM pg_extension WHERE extname = %s", (_unquote(name),))
+    elif kind == "STATISTICS":
+        parts = [_unquote(p) for p in _parts(name)]
+        schema = parts[0] if len(parts) == 2 else None
+        existed = _one(cursor, STATISTICS_QUERY, (parts[-1], schema, schema))
+    else:
+        existed = _one(cursor, "SELECT to_regclass(%s)", (name,))[0] is not None
+    if not existed:
+        return f"DROP {kind} IF EXISTS {name}"
+    if match.group("replace") and kind == "VIEW":
+        definition = _one(cursor, "SELECT pg_get_viewdef(to_regclass(%s))", (name,))[0]
+        return f"CREATE OR REPLACE VIEW {name} AS {definition.strip().rstrip(';')}"
+    # IF NOT EXISTS leaves the existing object alone; without it the statement fails
+    return ""
+
+
+def _drop_object(cursor, match) -> str:
+    if match.group("behavior") and match.group("behavior").lower() == "cascade":
+        raise Irreversible("CASCADE may drop dependent objects")
+    kind = " ".join(match.group("kind").upper().split())
+    inverses = []
+    for name in _split_top(match.group("names")):
+        if kind == "INDEX":
+            row = _one(cursor, "SELECT pg_get_indexdef(to_regclass(%s))", (name,))
+            if row and row[0]:
+                inverses.append(row[0])
+        elif kind == "STATISTICS":
+            parts = [_unquote(p) for p in _parts(name)]
+            schema = parts[0] if len(parts) == 2 else None
+            row = _one(cursor, STATISTICS_QUERY, (parts[-1], schema, schema))
+            if row:
+                inverses.append(row[0])
+        else:
+            row = _one(cursor, "SELECT pg_get_viewdef(to_regclass(%s))", (name,))
+            if row and row[0]:
+                inverses.append(f"CREATE {kind} {name} AS {row[0].strip().rstrip(';')}")
+                if kind == "MATERIALIZED VIEW":
+                    cursor.execute("SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = to_regclass(%s)",
+                                   (name,))
+                    inverses += [definition for (definition,) in cursor.fetchall()]
+    return ";\n".join(inverses)
+
+
+def _column_action(cursor, prefix: str, table: str, column: str, rest: str) -> List[str]:
+    row = _one(cursor, COLUMN_QUERY, (table, _unquote(column)))
+    if row is None:
+        raise Irreversible(f"column {column} not found")
+    not_null, data_type, statistics, storage, options, default = row
+    alter = f"{prefix} ALTER COLUMN {column}"
+    if re.match(r"^(?:set\s+default\b|drop\s+default$)", rest, re.IGNORECASE):
+        return [f"{alter} SET DEFAULT {default}" if default is not None else f"{alter} DROP DEFAULT"]
+    if re.match(r"^(?:set|drop)\s+not\s+null$", rest, re.IGNORECASE):
+        return [f"{alter} {'SET' if not_null else 'DROP'} NOT NULL"]
+    if re.match(r"^(?:set\s+data\s+)?type\b", rest, re.IGNORECASE):
+        return [f"{alter} TYPE {data_type} USING {column}::{data_type}"]
+    if re.match(r"^set\s+statistics\b", rest, re.IGNORECASE):
+        return [f"{alter} SET STATISTICS {statistics}"]
+    if re.match(r"^set\s+storage\b", rest, re.IGNORECASE):
+        names = {"p": "PLAIN", "e": "EXTERNAL", "m": "MAIN", "x": "EXTENDED"}
+        return [f"{alter} SET STORAGE {names[storage]}"]
+    options_match = re.match(r"^(?:set|reset)\s*\((?P<params>.*)\)$", rest, re.IGNORECASE | re.DOTALL)
+    if options_match:
+        return _restore_options(alter, _option_keys(options_match.group("params")), _options(options))
+    raise Irreversible(f"unsupported column action: {rest[:40]}")
+
+
+def _alter_relation(cursor, match):
+    kind = match.group("kind").upper()
+    name = match.group("name")
+    prefix = f"ALTER {kind} {name}"
+    parts = _parts(name)
+    actions = _split_top(match.group("actions"))
+    inverses: List[Any] = []
+    diff = False
+    for action in actions:
+        rename = re.match(rf"^rename\s+to\s+(?P<new>{IDENT})$", action, re.IGNORECASE)
+        if rename:
+            renamed = ".".join(parts[:-1] + [rename.group("new")])
+            inverses.append([f"ALTER {kind} {renamed} RENAME TO {parts[-1]}"])
+            continue
+        rename = re.match(rf"^rename\s+(?P<what>column\s+|constraint\s+)?(?P<old>{IDENT})\s+to\s+(?P<new>{IDENT})$",
+                          action, re.IGNORECASE)
+        if rename and kind == "TABLE":
+            what = (rename.group("what") or "COLUMN ").upper()
+            inverses.append([f"{prefix} RENAME {what}{rename.group('new')} TO {rename.group('old')}"])
+            continue
+        options = re.match(r"^(?:set|reset)\s*\((?P<params>.*)\)$", action, re.IGNORECASE | re.DOTALL)
+        if options:
+            current = _options(_one(cursor, RELATION_QUERY, (name,))[0])
+            inverses.append(_restore_options(prefix, _option_keys(options.group("params")), current))
+            continue
+        if kind != "TABLE":
+            raise Irreversible(f"unsupported index action: {action[:40]}")
+        if re.match(r"^add\b", action, re.IGNORECASE):
+            if not diff:
+                inverses.append(None)
+                diff = True
+            continue
+        drop = re.match(rf"^drop\s+constraint\s+(?:if\s+exists\s+)?(?P<name>{IDENT})(?:\s+(?P<behavior>cascade|restrict))?$",
+                        action, re.IGNORECASE)
+        if drop:
+            if drop.group("behavior") and drop.group("behavior").lower() == "cascade":
+                raise Irreversible("CASCADE may drop dependent objects")
+            row = _one(cursor, "SELECT pg_get_constraintdef(oid) FROM pg_constraint "
+                               "WHERE conrelid = to_regclass(%s) AND conname = %s",
+                       (name, _unquote(drop.group("name"))))
+            inverses.append([f"{prefix} ADD CONSTRAINT {drop.group('name')} {row[0]}"] if row else [])
+            continue
+        column = re.match(rf"^alter\s+(?:column\s+)?(?P<column>{IDENT})\s+(?P<rest>.+)$", action,
+                          re.IGNORECASE | re.DOTALL)
+        if column:
+            inverses.append(_column_action(cursor, prefix, name, column.group("column"), column.group("rest").strip()))
+            continue
+        if re.match(rf"^cluster\s+on\s+{IDENT}$|^set\s+without\s+cluster$", action, re.IGNORECASE):
+            clustered = _one(cursor, RELATION_QUERY, (name,))[2]
+            inverses.append([f"{prefix} CLUSTER ON {clustered}" if clustered else f"{prefix} SET WITHOUT CLUSTER"])
+            continue
+        if re.match(r"^set\s+(?:logged|unlogged)$", action, re.IGNORECASE):
+            persistence = _one(cursor, RELATION_QUERY, (name,))[1]
+            inverses.append([f"{prefix} SET {'UNLOGGED' if persistence == 'u' else 'LOGGED'}"])
+            continue
+        if re.match(r"^drop\b", action, re.IGNORECASE):
+            raise Irreversible("DROP COLUMN discards the column's data")
+        # Triggers, ownership, inheritance, tablespaces...
+        raise Irreversible(f"unsupported action: {action[:40]}")
+
+    def assemble(added: List[str]) -> str:
+        statements = []
+        for inverse in reversed(inverses):
+            statements += added if inverse is None else inverse
+        return ";\n".join(statements)
+
+    if not diff:
+        return assemble([])
+    cursor.execute(MEMBERS_QUERY, (name, name))
+    known = set(cursor.fetchall())
+
+    def finish(cursor) -> str:
+        cursor.execute(MEMBERS_QUERY, (name, name))
+        added = [m for m in cursor.fetchall() if m not in known]
+        # Constraints first: dropping a column takes its constraints with it
+        added.sort(key=lambda m: m[0] != "constraint")
+        return assemble([f"{prefix} DROP {what.upper()} IF EXISTS {member}" for what, member in added])
+    return finish
+
+
+def _alter_system(cursor, match) -> str:
+    setting = match.group("set") or match.group("reset")
+    if setting.lower() == "all":
+        raise Irreversible("ALTER SYSTEM RESET ALL")
+    row = _one(cursor, AUTO_CONF_QUERY, (setting,))
+    if row is None:
+        return f"ALTER SYSTEM RESET {setting}"
+    return f"ALTER SYSTEM SET {setting} = {_literal(cursor, row[0])}"
+
+
+def _comment_on(cursor, match) -> str:
+    kind = " ".join(match.group("kind").upper().split())
+    name = match.group("name")
+    if kind == "COLUMN":
+        parts = _parts(name)
+        if len(parts) < 2:
+            raise Irreversible("column comment without a table")
+        table = ".".join(parts[:-1])
+        row = _one(cursor, "SELECT col_description(a.attrelid, a.attnum) FROM pg_attribute a "
+                           "WHERE a.attrelid = to_regclass(%s) AND a.attname = %s", (table, _unquote(parts[-1])))
+    else:
+        row = _one(cursor, "SELECT obj_description(to_regclass(%s), 'pg_class')", (name,))
+    return f"COMMENT ON {kind} {name} IS {_literal(cursor, row[0] if row else None)}"
+
+
+def plan_inverse(cursor, statement: str):
+    """The statement undoing statement, computed from the catalog before it runs.
+
+    Returns the inverse ("" when there is nothing to undo) or a callable that
+    completes it from the catalog after the statement ran. Raises Irreversible
+    for changes no statement can undo, such as dropped data.
+    """
+    statement = _normalize(statement)
+    head = statement.split(None, 1)[0].lower() if statement else ""
+    if head == "explain":
+        analyzed = re.match(r"^explain\s*(?:\([^)]*\banalyze\b|analy[sz]e\b)", statement, re.IGNORECASE)
+        if analyzed and DATA_CHANGE.search(statement):
+            raise Irreversible("EXPLAIN ANALYZE executed a data change")
+        return ""
+    if head == "with":
+        if DATA_CHANGE.search(statement):
+            raise Irreversible("data change")
+        return ""
+    if not statement or NO_CHANGE.match(statement):
+        return ""
+    if re.match(r"^(?:insert|update|delete|merge|truncate|copy)\b", statement, re.IGNORECASE):
+        raise Irreversible("data change")
+    if CREATE_INDEX.match(statement):
+        return _create_index(cursor, statement)
+    for pattern, planner in ((CREATE_OBJECT, _create_object), (DROP_OBJECT, _drop_object),
+                             (ALTER_RELATION, _alter_relation), (ALTER_SYSTEM, _alter_system),
+                             (COMMENT_ON, _comment_on)):
+        match = pattern.match(statement)
+        if match:
+            return planner(cursor, match)
+    raise Irreversible("no inverse known for this statement")
+
+
+class UndoJournal:
+    """Executed statements and their inverses, kept in a local SQLite file."""
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def record(self, session: str, target: str, source: str, entries: List[UndoEntry]) -> List[int]:
+        ids = []
+        with self._lock:
+            for entry in entries:
+                cursor = self._conn.execute(
+                    "INSERT INTO undo_entries (session, target, source, recorded_at, statement, inverse, "
+                    "search_path, status, note) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (session, target, source, time.time(), entry.statement, entry.inverse, entry.search_path,
+                     entry.status, entry.note or None),
+                )
+                ids.append(cursor.lastrowid)
+            self._conn.commit()
+        return ids
+
+    def entries(self, session: str, target: Optional[str] = None, after_id: int = 0,
+                since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Entries of session in execution order, optionally only those after after_id or since a time."""
+        query = "SELECT * FROM undo_entries WHERE session = ? AND id > ?"
+        params: List[Any] = [session, after_id]
+        if target is not None:
+            query += " AND target = ?"
+            params.append(target)
+        if since is not None:
+            query += " AND recorded_at >= ?"
+            params.append(since)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(query + " ORDER BY id", params)]
+
+    def mark(self, entry_id: int, status: str, note: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE undo_entries SET status = ?, note = coalesce(?, note), undone_at = ? WHERE id = ?",
+                (status, note, time.time() if status == UNDONE else None, entry_id),
+            )
+            self._conn.commit()
+
+
+def get_journal() -> UndoJournal:
+    """Process-wide journal; the file location can be set with UNDO_JOURNAL_DB."""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = UndoJournal(os.environ.get("UNDO_JOURNAL_DB", DEFAULT_JOURNAL_PATH))
+        return _journal
+
+
+class UndoRecorder:
+    """Computes the inverse of each statement run on a connection and journals
+    the statements that committed under session."""
+
+    def __init__(self, db_config: Dict[str, Any], session: str, source: str,
+                 journal: Optional[UndoJournal] = None):
+        self.db_config = db_config
+        self.session = session
+        self.source = source
+        self.journal = journal or get_journal()
+
+    @contextmanager
+    def _probe(self, conn):
+        # Catalog lookups must not abort the caller's transaction
+        with conn.cursor() as cursor:
+            if conn.autocommit:
+                yield cursor
+                return
+            cursor.execute("SAVEPOINT stonebraker_undo")
+            try:
+                yield cursor
+            except Exception:
+                cursor.execute("ROLLBACK TO SAVEPOINT stonebraker_undo")
+                raise
+            finally:
+                cursor.execute("RELEASE SAVEPOINT stonebraker_undo")
+
+    def before(self, conn, statement: str) -> UndoEntry:
+        """Plan the inverse of statement; call on the connection that will run it."""
+        entry = UndoEntry(statement=statement.strip().rstrip(";"))
+        try:
+            with self._probe(conn) as cursor:
+                cursor.execute("SHOW search_path")
+                entry.search_path = cursor.fetchone()[0]
+                plan = plan_inverse(cursor, statement)
+            if callable(plan):
+                entry.finish = plan
+            else:
+                entry.inverse = plan
+        except Irreversible as e:
+            entry.note = str(e)
+        except psycopg2.Error as e:
+            entry.note = f"inverse unavailable: {str(e).strip()}"
+            logger.warning(f"Could not compute the inverse of {entry.statement[:50]}...: {entry.note}")
+        return entry
+
+    def after(self, conn, entry: UndoEntry, statement: Optional[str] = None):
+        """Complete entry once its statement succeeded; statement is what actually ran."""
+        if statement:
+            entry.statement = statement.strip().rstrip(";")
+        if entry.finish is None:
+            return
+        try:
+            with self._probe(conn) as cursor:
+                entry.inverse = entry.finish(cursor)
+        except psycopg2.Error as e:
+            entry.note = f"inverse unavailable: {str(e).strip()}"
+            logger.warning(f"Could not complete the inverse of {entry.statement[:50]}...: {entry.note}")
+        finally:
+            entry.finish = None
+
+    def commit(self, entries: List[UndoEntry]) -> List[int]:
+        """Journal entries whose statements have committed."""
+        if not entries:
+            return []
+        ids = self.journal.record(self.session, target_of(self.db_config), self.source, entries)
+        irreversible = [e for e in entries if e.status == IRREVERSIBLE]
+        if irreversible:
+            logger.warning(f"{len(irreversible)} statements of session {self.session} cannot be undone: "
+                           f"{irreversible[0].statement[:50]}... ({irreversible[0].note})")
+        return ids
+
+
+def rollback(db_config: Dict[str, Any], session: str, to_id: int = 0, since: Optional[float] = None,
+             journal: Optional[UndoJournal] = None,
+             lock_timeout_ms: int = DEFAULT_LOCK_TIMEOUT_MS) -> List[Dict[str, Any]]:
+    """Replay the inverses of session's changes newest first, back to entry to_id
+    (or the first change recorded at or after since); the whole session by default.
+
+    Each inverse commits on its own and runs online, like sql_executor's online
+    mode. Replay stops at the first inverse that fails so the remaining entries
+    stay applied and can be retried. Irreversible changes are reported and skipped.
+    """
+    journal = journal or get_journal()
+    entries = [e for e in journal.entries(session, target_of(db_config), after_id=to_id, since=since)
+               if e["status"] in (APPLIED, IRREVERSIBLE)]
+    results = []
+    if not entries:
+        logger.info(f"Nothing to roll back for session {session}")
+        return results
+    with get_pool(db_config).connection() as conn:
+        conn.autocommit = True
+        failed = False
+        for entry in reversed(entries):
+            result = {"id": entry["id"], "statement": entry["statement"], "inverse": entry["inverse"],
+                      "status": "skipped", "error": None, "elapsed_ms": None}
+            results.append(result)
+            if failed:
+                continue
+            if entry["status"] == IRREVERSIBLE:
+                result.update(status=IRREVERSIBLE, error=entry["note"])
+                logger.warning(f"Cannot undo {entry['statement'][:50]}...: {entry['note']}")
+                continue
+            start = time.perf_counter()
+            if entry["search_path"]:
+                # Names in the inverse resolve as they did when the statement ran
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT set_config('search_path', %s, false)", (entry["search_path"],))
+            for statement in split_sql_statements(entry["inverse"]):
+                outcome = run_online(conn, statement, lock_timeout_ms=lock_timeout_ms)
+                if outcome["status"] != "ok":
+                    result.update(status="error", error=outcome["error"])
+                    break
+            result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            if result["status"] == "error":
+                failed = True
+                logger.error(f"Undo of entry {entry['id']} failed: {result['error']}")
+                journal.mark(entry["id"], APPLIED, note=f"undo failed: {result['error']}")
+            else:
+                result["status"] = UNDONE
+                journal.mark(entry["id"], UNDONE)
+        with conn.cursor() as cursor:
+            cursor.execute("RESET search_path")
+    undone = sum(r["status"] == UNDONE for r in results)
+    logger.info(f"Rolled back {undone} of {len(results)} changes of session {session}")
+    return results
+
+
+def format_rollback(results: List[Dict[str, Any]]) -> str:
+    if not results:
+        return "No changes recorded for this session; nothing to roll back"
+    lines = []
+    for r in results:
+        timing = f" in {r['elapsed_ms']} ms" if r["elapsed_ms"] is not None else ""
+        line = f"[{r['status']}] #{r['id']} {' '.join(r['statement'].split())[:80]}{timing}"
+        if r["error"]:
+            line += f" ({r['error']})"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,269 @@
+# validator.py
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import psycopg2
+from psycopg2.errorcodes import LOCK_NOT_AVAILABLE, QUERY_CANCELED
+from sql.pool import get_pool, pool_key
+from sql.introspection import catalog_fingerprint, get_fingerprint
+from utils.sql_utils import is_explainable, requires_autocommit, split_sql_statements
+
+logger = logging.getLogger(__name__)
+
+# Statements run for real inside the rolled-back transaction (DDL, ANALYZE, ...)
+# give up after this long; by then they have been parsed and their names resolved.
+VALIDATION_TIMEOUT_MS = 2000
+VALIDATION_LOCK_TIMEOUT_MS = 500
+# Cap on one validate_script call; statements left when it runs out are skipped
+VALIDATION_TOTAL_MS = 10000
+MAX_CACHE_ENTRIES = 5000
+
+# Outcomes; only ERROR means the statement would fail as written
+OK = "ok"
+ERROR = "error"
+TIMEOUT = "timeout"
+SKIPPED = "skipped"
+
+LEADING_COMMENTS = r"^(?:\s*(?:--[^\n]*\n?|/\*.*?\*/))*\s*"
+TRANSACTION_CONTROL = re.compile(
+    LEADING_COMMENTS + r"(?:begin|start\s+transaction|commit|end|rollback|abort|savepoint|release|prepare\s+transaction)\b",
+    re.IGNORECASE | re.DOTALL,
+)
+# Forms PostgreSQL refuses inside a transaction but validates the same way without CONCURRENTLY
+CONCURRENT_INDEX = re.compile(
+    LEADING_COMMENTS + r"(?:create\s+(?:unique\s+)?index|drop\s+index|reindex\s+\w+)\s+(?P<kw>concurrently\s+)",
+    re.IGNORECASE | re.DOTALL,
+)
+# Statements that lock or rewrite an existing table; they are rolled back to their
+# savepoint as soon as they are checked, which releases their locks right away
+LOCK_HEAVY = re.compile(
+    LEADING_COMMENTS + r"(?:alter\s+(?:table|index|materialized\s+view)|create\s+(?:unique\s+)?index|"
+    r"drop\s+(?:table|index|materialized\s+view)|truncate|cluster|reindex|refresh\s+materialized\s+view|lock)\b",
+    re.IGNORECASE | re.DOTALL,
+)
+# Errors a statement may get only because an earlier lock-heavy statement was undone
+DEPENDENT_ERRORS = {"42701", "42703", "42704", "42710", "42883", "42P01", "42P07"}
+QUOTED_NAME = re.compile(r'"([^"]+)"')
+TOKEN = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\$(?P<tag>\w*)\$.*?\$(?P=tag)\$|--[^\n]*|/\*.*?\*/|\s+|\w[\w$]*|.",
+    re.DOTALL,
+)
+
+_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def normalize_statement(statement: str) -> str:
+    """statement without comments, with canonical whitespace and unquoted words lowercased."""
+    tokens = []
+    for match in TOKEN.finditer(statement.strip().rstrip(";")):
+        token = match.group(0)
+        if token.isspace() or token.startswith("--") or token.startswith("/*"):
+            continue
+        tokens.append(token if token[0] in "'\"$" else token.lower())
+    out = []
+    for token in tokens:
+        # Spaces only separate two words; punctuation absorbs them
+        if out and (out[-1][-1].isalnum() or out[-1][-1] in "_'\"$") and (token[0].isalnum() or token[0] in "_'\"$"):
+            out.append(" ")
+        out.append(token)
+    return "".join(out)
+
+
+def statement_fingerprint(statement: str) -> str:
+    return hashlib.sha256(normalize_statement(statement).encode()).hexdigest()
+
+
+def _changes_state(statement: str) -> bool:
+    # Everything but EXPLAIN-able statements runs for real; later statements must see it
+    return not is_explainable(statement)
+
+
+def _keys(db_config: Dict[str, Any], version: str, statements: List[str]) -> List[str]:
+    """Cache key of each statement: the database, its schema version and the
+    statements before it that change what it sees."""
+    keys, context = [], hashlib.sha256(f"{pool_key(db_config)}|{version}".encode())
+    for statement in statements:
+        fingerprint = statement_fingerprint(statement)
+        key = context.copy()
+        key.update(fingerprint.encode())
+        keys.append(key.hexdigest())
+        if _changes_state(statement):
+            context.update(fingerprint.encode())
+    return keys
+
+
+def _cached(key: str) -> Optional[Dict[str, Any]]:
+    with _cache_lock:
+        outcome = _cache.get(key)
+        if outcome is not None:
+            _cache.move_to_end(key)
+        return outcome
+
+
+def _store(key: str, outcome: Dict[str, Any]):
+    with _cache_lock:
+        _cache[key] = outcome
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _check(cursor, statement: str, keep: bool = True) -> Dict[str, Any]:
+    """Validate one statement on cursor's open transaction; DDL stays in effect on success if keep."""
+    statement = statement.strip().rstrip(";")
+    shift, removed_at, removed = 0, None, 0
+    if TRANSACTION_CONTROL.match(statement):
+        return {"status": SKIPPED, "error": "transaction control is not validated", "sqlstate": None, "position": None}
+    if is_explainable(statement):
+        sent, shift = f"EXPLAIN {statement}", -len("EXPLAIN ")
+    elif requires_autocommit(statement):
+        concurrent = CONCURRENT_INDEX.match(statement)
+        if not concurrent:
+            return {"status": SKIPPED, "error": "runs outside a transaction block and is not validated",
+                    "sqlstate": None, "position": None}
+        sent = statement[:concurrent.start("kw")] + statement[concurrent.end("kw"):]
+        removed_at, removed = concurrent.start("kw"), concurrent.end("kw") - concurrent.start("kw")
+    else:
+        sent = statement
+
+    cursor.execute("SAVEPOINT stonebraker_validate")
+    try:
+        cursor.execute(sent)
+        if not keep:
+            cursor.execute("ROLLBACK TO SAVEPOINT stonebraker_validate")
+        cursor.execute("RELEASE SAVEPOINT stonebraker_validate")
+        return {"status": OK, "error": None, "sqlstate": None, "position": None}
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT stonebraker_validate")
+        cursor.execute("RELEASE SAVEPOINT stonebraker_validate")
+        if e.pgcode in (QUERY_CANCELED, LOCK_NOT_AVAILABLE):
+            reason = "lock not available" if e.pgcode == LOCK_NOT_AVAILABLE else "did not finish"
+            return {"status": TIMEOUT, "error": f"Parsed and resolved, {reason} within the validation budget",
+                    "sqlstate": e.pgcode, "position": None}
+        position = e.diag.statement_position
+        position = int(position) + shift if position else None
+        if position and removed_at is not None and position > removed_at:
+            position += removed
+        return {"status": ERROR, "error": (e.diag.message_primary or str(e)).strip(), "sqlstate": e.pgcode,
+                "position": position}
+
+
+def _depends_on(outcome: Dict[str, Any], undone: List[str]) -> bool:
+    """Whether outcome's error names an object one of the undone statements touches."""
+    if outcome["status"] != ERROR or outcome["sqlstate"] not in DEPENDENT_ERRORS:
+        return False
+    names = [name.lower().split(".")[-1] for name in QUOTED_NAME.findall(outcome["error"] or "")]
+    return any(re.search(rf"\b{re.escape(name)}\b", statement) for name in names for statement in undone)
+
+
+def _locate(script: str, statements: List[str]) -> List[Optional[int]]:
+    offsets, start = [], 0
+    for statement in statements:
+        offset = script.find(statement, start)
+        offsets.append(offset if offset >= 0 else None)
+        if offset >= 0:
+            start = offset + len(statement)
+    return offsets
+
+
+def _result(index: int, statement: str, offset: Optional[int], script: str, outcome: Dict[str, Any],
+            cached: bool) -> Dict[str, Any]:
+    result = {"index": index, "statement": statement, "status": outcome["status"], "error": outcome["error"],
+              "sqlstate": outcome["sqlstate"], "position": outcome["position"], "line": None, "column": None,
+              "cached": cached}
+    if offset is not None:
+        # position is 1-based within the statement; line/column are within the script
+        at = offset + (outcome["position"] - 1 if outcome["position"] else 0)
+        result["line"] = script.count("\n", 0, at) + 1
+        result["column"] = at - (script.rfind("\n", 0, at) + 1) + 1
+    return result
+
+
+def validate_script(db_config: Dict[str, Any], script: str) -> List[Dict[str, Any]]:
+    """Check every statement of script, e.g. extract_sql_queries output, over one connection.
+
+    Queries are EXPLAINed; DDL and other commands run inside one transaction
+    that is rolled back at the end, so later statements see the objects earlier
+    ones create. Statements that lock or rewrite existing tables are undone as
+    soon as they are checked so their locks do not outlive them; later
+    statements that fail only for lack of their effect are reported skipped.
+    The whole run stops after VALIDATION_TOTAL_MS. Outcomes are cached by normalized statement and catalog
+    fingerprint: an unchanged script against an unchanged schema is answered
+    without touching the database beyond the fingerprint check.
+    """
+    statements = [s.strip().rstrip(";") for s in split_sql_statements(script or "")]
+    if not statements:
+        return []
+    offsets = _locate(script, statements)
+    keys = _keys(db_config, get_fingerprint(db_config), statements)
+    outcomes = [_cached(key) for key in keys]
+    hits = [o is not None for o in outcomes]
+
+    if not all(hits):
+        with get_pool(db_config).connection() as conn:
+            version = catalog_fingerprint(conn)
+            keys = _keys(db_config, version, statements)
+            outcomes = [_cached(key) for key in keys]
+            hits = [o is not None for o in outcomes]
+            last_miss = max((i for i, hit in enumerate(hits) if not hit), default=-1)
+            deadline = time.monotonic() + VALIDATION_TOTAL_MS / 1000
+            undone: List[str] = []
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"SET LOCAL statement_timeout = {int(VALIDATION_TIMEOUT_MS)}")
+                    cursor.execute(f"SET LOCAL lock_timeout = {int(VALIDATION_LOCK_TIMEOUT_MS)}")
+                    for i, statement in enumerate(statements[:last_miss + 1]):
+                        heavy = bool(LOCK_HEAVY.match(statement))
+                        if hits[i]:
+                            if heavy and outcomes[i]["status"] == OK:
+                                undone.append(normalize_statement(statement))
+                            if heavy or not _changes_state(statement):
+                                continue
+                        if time.monotonic() > deadline:
+                            for j in range(i, last_miss + 1):
+                                if not hits[j]:
+                                    outcomes[j] = {"status": SKIPPED, "error": "validation time budget exhausted",
+                                                   "sqlstate": None, "position": None}
+                            break
+                        outcome = _check(cursor, statement, keep=not heavy)
+                        if _depends_on(outcome, undone):
+                            outcome = {"status": SKIPPED, "error": "depends on an earlier statement that locks or "
+                                       f"rewrites a table, which is validated on its own ({outcome['error']})",
+                                       "sqlstate": outcome["sqlstate"], "position": outcome["position"]}
+                        if heavy and outcome["status"] == OK:
+                            undone.append(normalize_statement(statement))
+                        if not hits[i]:
+                            outcomes[i] = outcome
+                            _store(keys[i], outcome)
+            finally:
+                conn.rollback()
+
+    results = [_result(i, statement, offset, script, outcome, hit)
+               for i, (statement, offset, outcome, hit) in enumerate(zip(statements, offsets, outcomes, hits), 1)]
+    errors = sum(r["status"] == ERROR for r in results)
+    logger.info(f"Validated {len(results)} statements ({sum(hits)} cached): {errors} invalid")
+    return results
+
+
+def invalid(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [r for r in results if r["status"] == ERROR]
+
+
+def format_validation(results: List[Dict[str, Any]]) -> str:
+    lines = []
+    for r in results:
+        if r["status"] == OK:
+            continue
+        where = f" (line {r['line']}, column {r['column']})" if r["line"] else ""
+        lines.append(f"Statement {r['index']}{where} {r['status']}: {r['error']}")
+    return "\n".join(lines) or f"All {len(results)} statements are valid"
@@ -0,0 +1,172 @@
+# whatif.py
+import json
+import logging
+import re
+import time
+from typing import Dict, Any, List, Optional
+import psycopg2
+from sql.pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+NOT_EVALUATED = "hypopg is not installed; building real indexes to compare plans would block writes"
+NO_TARGETS = "none of the target queries could be planned"
+
+INDEX_DDL = re.compile(
+    r"^\s*create\s+(?:unique\s+)?index\s+(?:concurrently\s+)?(?:if\s+not\s+exists\s+)?(?P<name>(?!on\b)[\w\"$.]+)?\s*\bon\b",
+    re.IGNORECASE,
+)
+
+
+def is_index_ddl(statement: str) -> bool:
+    return bool(INDEX_DDL.match(statement))
+
+
+def index_name(statement: str) -> Optional[str]:
+    match = INDEX_DDL.match(statement)
+    if not match or not match.group("name"):
+        return None
+    return match.group("name").split(".")[-1].strip('"')
+
+
+def _explain(cursor, query: str) -> Dict[str, Any]:
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {query}")
+    result = cursor.fetchone()[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]["Plan"]
+
+
+def plan_shape(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a plan tree into its node types and the indexes it uses."""
+    nodes, indexes = [], []
+
+    def walk(node):
+        label = node["Node Type"]
+        if node.get("Index Name"):
+            label += f"({node['Index Name']})"
+            indexes.append(node["Index Name"])
+        nodes.append(label)
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan)
+    return {"nodes": nodes, "indexes": indexes, "summary": " > ".join(nodes)}
+
+
+def _has_hypopg(cursor) -> bool:
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'hypopg')")
+    return cursor.fetchone()[0]
+
+
+def _explain_targets(cursor, target_queries: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """Plan of each target query; None for a query that cannot be planned, e.g.
+    one using a table created earlier in the same script."""
+    plans = []
+    for query in target_queries:
+        cursor.execute("SAVEPOINT stonebraker_whatif")
+        try:
+            plan = _explain(cursor, query)
+            plans.append({"cost": plan["Total Cost"], "shape": plan_shape(plan)})
+            cursor.execute("RELEASE SAVEPOINT stonebraker_whatif")
+        except psycopg2.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT stonebraker_whatif")
+            logger.warning(f"Skipping target query that cannot be planned: {query[:50]}...: {str(e).strip()}")
+            plans.append(None)
+    return plans
+
+
+def evaluate_index_candidates(db_config: Dict[str, Any], candidates: List[str],
+                              target_queries: List[str]) -> List[Dict[str, Any]]:
+    """Estimate the planner benefit of each candidate index without building it.
+
+    Candidates are created as hypothetical indexes with the hypopg extension;
+    without it they are reported as not evaluated. Results are ranked by total
+    planner cost saved across the target queries.
+    """
+    candidates = [c.strip().rstrip(";") for c in candidates if is_index_ddl(c)]
+    target_queries = [q.strip().rstrip(";") for q in target_queries if q.strip()]
+    if not candidates or not target_queries:
+        return []
+
+    results = []
+    with get_pool(db_config).connection() as conn:
+        with conn.cursor() as cursor:
+            if not _has_hypopg(cursor):
+                conn.rollback()
+                logger.warning("hypopg is not installed, candidate indexes are not evaluated")
+                return [{"ddl": ddl, "method": None, "error": NOT_EVALUATED} for ddl in candidates]
+            try:
+                baseline = _explain_targets(cursor, target_queries)
+            finally:
+                conn.rollback()
+            target_queries = [q for q, plan in zip(target_queries, baseline) if plan is not None]
+            baseline = [plan for plan in baseline if plan is not None]
+            if not target_queries:
+                logger.warning("None of the target queries could be planned")
+                return [{"ddl": ddl, "method": "hypopg", "error": NO_TARGETS} for ddl in candidates]
+
+            for ddl in candidates:
+                result = {"ddl": ddl, "method": "hypopg", "error": None}
+                start = time.perf_counter()
+                try:
+                    cursor.execute("SELECT indexname FROM hypopg_create_index(%s)", (ddl,))
+                    name = cursor.fetchone()[0]
+                    plans = _explain_targets(cursor, target_queries)
+                except psycopg2.Error as e:
+                    result["error"] = str(e).strip()
+                    logger.warning(f"What-if evaluation failed for {ddl[:50]}...: {result['error']}")
+                    results.append(result)
+                    continue
+                finally:
+                    conn.rollback()
+                    try:
+                        cursor.execute("SELECT hypopg_reset()")
+                    except psycopg2.Error:
+                        pass
+                    conn.rollback()
+
+                queries = []
+                for query, before, after in zip(target_queries, baseline, plans):
+                    if after is None:
+                        continue
+                    queries.append({
+                        "query": query,
+                        "cost_before": before["cost"],
+                        "cost_after": after["cost"],
+                        # Only the candidate differs between the two plans, so any newly used
+                        # index is the candidate (hypopg and unnamed indexes get generated names).
+                        "uses_index": bool(set(after["shape"]["indexes"]) - set(before["shape"]["indexes"])),
+                        "plan_before": before["shape"]["summary"],
+                        "plan_after": after["shape"]["summary"],
+                    })
+                cost_before = sum(q["cost_before"] for q in queries)
+                cost_after = sum(q["cost_after"] for q in queries)
+                result.update({
+                    "index_name": name,
+                    "cost_before": round(cost_before, 2),
+                    "cost_after": round(cost_after, 2),
+                    "cost_delta": round(cost_after - cost_before, 2),
+                    "improvement_pct": round((cost_before - cost_after) / cost_before * 100, 1) if cost_before else 0.0,
+                    "used_by": sum(1 for q in queries if q["uses_index"]),
+                    "queries": queries,
+                    "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+                })
+                results.append(result)
+
+    ranked = sorted(results, key=lambda r: (r["error"] is not None, r.get("cost_delta", 0)))
+    logger.info(f"Evaluated {len(candidates)} candidate indexes against {len(target_queries)} queries")
+    return ranked
+
+
+def format_evaluation(results: List[Dict[str, Any]]) -> str:
+    lines = []
+    for i, r in enumerate(results, 1):
+        if r["error"]:
+            lines.append(f"{i}. {r['ddl']} -- could not be evaluated: {r['error'].splitlines()[0]}")
+            continue
+        lines.append(
+            f"{i}. {r['ddl']} -- planner cost {r['cost_before']} -> {r['cost_after']} "
+            f"({r['improvement_pct']}% better), used by {r['used_by']}/{len(r['queries'])} queries"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,214 @@
+# workload.py
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Dict, Any, List, Optional
+import psycopg2
+from sql.pool import get_pool
+from sql.whatif import plan_shape
+from utils.sql_utils import is_explainable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_N = 10
+DEFAULT_SAMPLES = 20
+DEFAULT_SAMPLE_INTERVAL = 0.25
+EXPLAIN_TIMEOUT_MS = 5000
+
+RANKINGS = {
+    "total_time": lambda e: e["total_ms"],
+    "calls": lambda e: e["calls"],
+    "io": lambda e: e["shared_blks_read"] + e["temp_blks_read"] + e["temp_blks_written"],
+}
+
+# Session and transaction control statements are never optimization targets
+UTILITY = re.compile(r"^\s*(begin|commit|rollback|end|set|show|reset|deallocate|discard|listen|unlisten|savepoint|release)\b",
+                     re.IGNORECASE)
+
+STATEMENTS_QUERY = """
+    WITH stmts AS (
+        SELECT s.queryid, s.query, s.calls, s.{total} AS total_ms, s.{mean} AS mean_ms, s.rows,
+               s.shared_blks_hit, s.shared_blks_read, s.temp_blks_read, s.temp_blks_written
+        FROM pg_stat_statements s
+        JOIN pg_database d ON d.oid = s.dbid
+        WHERE d.datname = current_database()
+    )
+    (SELECT * FROM stmts ORDER BY total_ms DESC LIMIT %(limit)s)
+    UNION
+    (SELECT * FROM stmts ORDER BY calls DESC LIMIT %(limit)s)
+    UNION
+    (SELECT * FROM stmts ORDER BY shared_blks_read + temp_blks_read + temp_blks_written DESC LIMIT %(limit)s)
+"""
+
+ACTIVITY_QUERY = """
+    SELECT query, wait_event_type
+    FROM pg_stat_activity
+    WHERE datname = current_database()
+      AND state = 'active'
+      AND backend_type = 'client backend'
+      AND pid <> pg_backend_pid()
+"""
+
+
+def normalize_query(query: str) -> str:
+    """Reduce a statement to its shape: literals and parameters become '?', whitespace and case are folded."""
+    text = re.sub(r"--[^\n]*", " ", query)
+    text = re.sub(r"/\*.*?\*/", " ", text, flags=re.DOTALL)
+    text = re.sub(r"(?i)(?:\bE)?'(?:[^']|'')*'", "?", text)
+    text = re.sub(r"\$\d+", "?", text)
+    text = re.sub(r"(?<![\w$])\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", "?", text, flags=re.IGNORECASE)
+    text = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?, ...)", text)
+    text = " ".join(text.split()).rstrip(";").strip()
+    return text.lower()
+
+
+def fingerprint(query: str) -> str:
+    return hashlib.md5(normalize_query(query).encode()).hexdigest()[:16]
+
+
+def _server_version(cursor) -> int:
+    cursor.execute("SHOW server_version_num")
+    return int(cursor.fetchone()[0])
+
+
+def _has_pg_stat_statements(cursor) -> bool:
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements')")
+    return cursor.fetchone()[0]
+
+
+def _from_statements(conn, version: int, limit: int) -> List[Dict[str, Any]]:
+    total, mean = ("total_exec_time", "mean_exec_time") if version >= 130000 else ("total_time", "mean_time")
+    entries = {}
+    with conn.cursor() as cursor:
+        cursor.execute(STATEMENTS_QUERY.format(total=total, mean=mean), {"limit": limit})
+        for (queryid, query, calls, total_ms, mean_ms, rows, hit, read, temp_read, temp_written) in cursor.fetchall():
+            if UTILITY.match(query):
+                continue
+            fp = fingerprint(query)
+            entry = entries.setdefault(fp, {
+                "fingerprint": fp, "query": query, "normalized": normalize_query(query), "example": None,
+                "source": "pg_stat_statements", "calls": 0, "total_ms": 0.0, "rows": 0,
+                "shared_blks_hit": 0, "shared_blks_read": 0, "temp_blks_read": 0, "temp_blks_written": 0,
+            })
+            # Distinct queryids can normalize to the same shape (e.g. different IN-list lengths)
+            entry["calls"] += calls
+            entry["total_ms"] += total_ms
+            entry["rows"] += rows
+            entry["shared_blks_hit"] += hit
+            entry["shared_blks_read"] += read
+            entry["temp_blks_read"] += temp_read
+            entry["temp_blks_written"] += temp_written
+    for entry in entries.values():
+        entry["total_ms"] = round(entry["total_ms"], 3)
+        entry["mean_ms"] = round(entry["total_ms"] / entry["calls"], 3) if entry["calls"] else 0.0
+    return list(entries.values())
+
+
+def _from_activity(conn, samples: int, interval: float) -> List[Dict[str, Any]]:
+    entries = {}
+    with conn.cursor() as cursor:
+        for i in range(samples):
+            cursor.execute(ACTIVITY_QUERY)
+            for query, wait_event_type in cursor.fetchall():
+                if not query or UTILITY.match(query):
+                    continue
+                fp = fingerprint(query)
+                entry = entries.setdefault(fp, {
+                    "fingerprint": fp, "query": query, "normalized": normalize_query(query), "example": query,
+                    "source": "pg_stat_activity", "calls": 0, "total_ms": 0.0, "rows": 0,
+                    "shared_blks_hit": 0, "shared_blks_read": 0, "temp_blks_read": 0, "temp_blks_written": 0,
+                    "lock_waits": 0,
+                })
+                # Each sample a statement is seen running approximates interval seconds of its time
+                entry["calls"] += 1
+                entry["total_ms"] += interval * 1000
+                if wait_event_type == "Lock":
+                    entry["lock_waits"] += 1
+            conn.rollback()
+            if i < samples - 1:
+                time.sleep(interval)
+    for entry in entries.values():
+        entry["mean_ms"] = round(entry["total_ms"] / entry["calls"], 3)
+    return list(entries.values())
+
+
+def _explain(cursor, entry: Dict[str, Any], version: int) -> Optional[Dict[str, Any]]:
+    query = entry["example"] or entry["query"]
+    if not is_explainable(query):
+        return None
+    options = "FORMAT JSON"
+    if entry["example"] is None and re.search(r"\$\d+", query):
+        if version < 160000:
+            return None
+        options = "GENERIC_PLAN, FORMAT JSON"
+    try:
+        cursor.execute(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+        cursor.execute(f"EXPLAIN ({options}) {query}")
+        result = cursor.fetchone()[0]
+        plan = (json.loads(result) if isinstance(result, str) else result)[0]["Plan"]
+        return {"total_cost": plan["Total Cost"], "plan_rows": plan["Plan Rows"], **plan_shape(plan)}
+    except psycopg2.Error as e:
+        logger.debug(f"Could not explain {query[:50]}...: {str(e).strip()}")
+        return None
+    finally:
+        cursor.connection.rollback()
+
+
+def collect_workload(db_config: Dict[str, Any], top_n: int = DEFAULT_TOP_N, rank_by: str = "total_time",
+                     samples: int = DEFAULT_SAMPLES, interval: float = DEFAULT_SAMPLE_INTERVAL,
+                     explain: bool = True) -> List[Dict[str, Any]]:
+    """Return the top_n statements of the database's workload with their plans.
+
+    Reads pg_stat_statements when the extension is installed and falls back to
+    sampling pg_stat_activity otherwise.
+    """
+    if rank_by not in RANKINGS:
+        raise ValueError(f"Unknown ranking: {rank_by}")
+    with get_pool(db_config).connection() as conn:
+        with conn.cursor() as cursor:
+            version = _server_version(cursor)
+            use_statements = _has_pg_stat_statements(cursor)
+        entries = None
+        if use_statements:
+            try:
+                entries = _from_statements(conn, version, top_n * 2)
+            except psycopg2.Error as e:
+                logger.warning(f"pg_stat_statements unavailable, sampling pg_stat_activity: {str(e).strip()}")
+                conn.rollback()
+        if entries is None:
+            entries = _from_activity(conn, samples, interval)
+
+        entries = sorted(entries, key=lambda e: (-RANKINGS[rank_by](e), e["fingerprint"]))[:top_n]
+        if explain:
+            with conn.cursor() as cursor:
+                for entry in entries:
+                    entry["plan"] = _explain(cursor, entry, version)
+    logger.info(f"Collected {len(entries)} workload statements ranked by {rank_by}")
+    return entries
+
+
+def workload_targets(workload: List[Dict[str, Any]]) -> List[str]:
+    """Statements from the workload that can be re-planned as-is (no bind parameters)."""
+    targets = []
+    for entry in workload:
+        query = entry.get("example") or entry["query"]
+        if is_explainable(query) and not re.search(r"\$\d+", query):
+            targets.append(query)
+    return targets
+
+
+def format_workload(workload: List[Dict[str, Any]], max_query_chars: int = 300) -> str:
+    lines = []
+    for i, entry in enumerate(workload, 1):
+        query = " ".join(entry["query"].split())[:max_query_chars]
+        lines.append(
+            f"W{i} [{entry['source']}] calls={entry['calls']} total={entry['total_ms']:.1f}ms "
+            f"mean={entry['mean_ms']:.2f}ms shared_read={entry['shared_blks_read']} "
+            f"temp={entry['temp_blks_read'] + entry['temp_blks_written']}: {query}"
+        )
+        plan = entry.get("plan")
+        if plan:
+            lines.append(f"    plan (cost {plan['total_cost']}): {plan['summary']}")
+    return "\n".join(lines)
@@ -0,0 +1,177 @@
+# benchmark.py
+import json
+import logging
+import statistics
+import time
+from typing import Dict, Any, List, Optional
+import psycopg2
+from sql.budget import Budget, BudgetExceeded
+from sql.pool import get_pool
+from utils.sql_utils import is_explainable
+from utils.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WARMUP = 2
+DEFAULT_REPETITIONS = 10
+
+BUFFER_KEYS = {
+    "shared_hit": "Shared Hit Blocks",
+    "shared_read": "Shared Read Blocks",
+    "local_hit": "Local Hit Blocks",
+    "local_read": "Local Read Blocks",
+}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Linear-interpolated percentile of values (pct in 0-100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"min": None, "median": None, "p95": None, "p99": None, "mean": None}
+    return {
+        "min": round(min(values), 3),
+        "median": round(statistics.median(values), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(statistics.fmean(values), 3),
+    }
+
+
+def _explain(cursor, query: str) -> Dict[str, Any]:
+    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}")
+    result = cursor.fetchone()[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]
+
+
+def benchmark_query(conn, query: str, warmup: int = DEFAULT_WARMUP,
+                    repetitions: int = DEFAULT_REPETITIONS, budget: Optional[Budget] = None) -> Dict[str, Any]:
+    """Run one query warmup + repetitions times under EXPLAIN ANALYZE.
+
+    Every run is rolled back, so data-modifying statements leave nothing behind.
+    """
+    budget = budget or Budget()
+    latencies, wall_times = [], []
+    buffers = {key: [] for key in BUFFER_KEYS}
+    plan = None
+    with conn.cursor() as cursor:
+        for run in range(warmup + repetitions):
+            start = time.perf_counter()
+            try:
+                with budget.guard(conn):
+                    explained = _explain(cursor, query)
+            finally:
+                conn.rollback()
+            if run < warmup:
+                continue
+            wall_times.append((time.perf_counter() - start) * 1000)
+            latencies.append(explained.get("Planning Time", 0.0) + explained.get("Execution Time", 0.0))
+            for key, field in BUFFER_KEYS.items():
+                buffers[key].append(explained["Plan"].get(field, 0))
+            plan = explained
+    return {
+        "query": query,
+        "runs": repetitions,
+        "latency_ms": summarize(latencies),
+        "wall_ms": summarize(wall_times),
+        "buffers": {key: int(statistics.median(values)) if values else 0 for key, values in buffers.items()},
+        "plan": plan,
+        "status": "ok",
+        "error": None,
+    }
+
+
+def run_benchmark(db_config: Dict[str, Any], queries: List[str], warmup: int = DEFAULT_WARMUP,
+                  repetitions: int = DEFAULT_REPETITIONS, budget: Optional[Budget] = None) -> Dict[str, Any]:
+    """Benchmark a fixed query set over a single pooled connection.
+
+    Queries that exceed their share of budget are reported with status
+    "timeout"; once the run is cancelled or the phase is out of time the
+    remaining queries are not started.
+    """
+    budget = budget or Budget()
+    results = []
+    with get_pool(db_config).connection() as conn:
+        for query in queries:
+            query = query.strip().rstrip(";")
+            if not is_explainable(query):
+                logger.info(f"Skipping non-explainable statement: {query[:50]}...")
+                continue
+            try:
+                with span("db.benchmark", "db", **{"db.statement": query, "db.runs": warmup + repetitions}):
+                    results.append(benchmark_query(conn, query, warmup, repetitions, budget))
+                logger.debug(f"Benchmarked: {query[:50]}...")
+            except BudgetExceeded as e:
+                logger.warning(f"Benchmark stopped before {query[:50]}...: {str(e)}")
+                results.append({"query": query, "runs": 0, "status": e.outcome, "error": str(e)})
+                break
+            except psycopg2.Error as e:
+                logger.warning(f"Benchmark failed for {query[:50]}...: {str(e)}")
+                conn.rollback()
+                results.append({"query": query, "runs": 0, "status": budget.outcome(e), "error": str(e).strip()})
+    return {"warmup": warmup, "repetitions": repetitions, "queries": results}
+
+
+def compare_benchmarks(before: Dict[str, Any], after: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Pair up before/after results by query text and compute relative changes."""
+    after_by_query = {r["query"]: r for r in (after or {}).get("queries", [])}
+    comparison = []
+    for b in (before or {}).get("queries", []):
+        a = after_by_query.get(b["query"])
+        row = {"query": b["query"], "before": None, "after": None, "change_pct": None,
+               "before_status": b.get("status", "ok"), "after_status": a.get("status", "ok") if a else None}
+        if not b.get("error"):
+            row["before"] = {**b["latency_ms"], **b["buffers"]}
+        if a and not a.get("error"):
+            row["after"] = {**a["latency_ms"], **a["buffers"]}
+        if row["before"] and row["after"] and row["before"]["median"]:
+            row["change_pct"] = round(
+                (row["after"]["median"] - row["before"]["median"]) / row["before"]["median"] * 100, 1
+            )
+        comparison.append(row)
+    return comparison
+
+
+def format_benchmark(results: Dict[str, Any]) -> str:
+    lines = []
+    for i, r in enumerate(results.get("queries", []), 1):
+        if r.get("error"):
+            lines.append(f"Q{i}: {r.get('status', 'error').upper()} {r['error']} -- {r['query'][:80]}")
+            continue
+        lat, buf = r["latency_ms"], r["buffers"]
+        lines.append(
+            f"Q{i}: min={lat['min']}ms median={lat['median']}ms p95={lat['p95']}ms p99={lat['p99']}ms "
+            f"shared_hit={buf['shared_hit']} shared_read={buf['shared_read']} "
+            f"local_hit={buf['local_hit']} local_read={buf['local_read']} -- {r['query'][:80]}"
+        )
+    return "\n".join(lines)
+
+
+def _missing(status: Optional[str]) -> str:
+    # Timeouts and cancellations are outcomes of their own, not just missing numbers
+    return status if status in ("timeout", "cancelled") else "n/a"
+
+
+def format_comparison(comparison: List[Dict[str, Any]]) -> str:
+    lines = ["| # | Query | Before median (ms) | After median (ms) | Change | p95 before/after (ms) | Shared reads before/after |",
+             "|---|-------|-----|-----|-----|-----|-----|"]
+    for i, row in enumerate(comparison, 1):
+        b, a = row["before"] or {}, row["after"] or {}
+        change = f"{row['change_pct']:+.1f}%" if row["change_pct"] is not None else "n/a"
+        query = row["query"][:60].replace("|", "\\|").replace("\n", " ")
+        lines.append(
+            f"| {i} | `{query}` | {b.get('median', _missing(row.get('before_status')))} | "
+            f"{a.get('median', _missing(row.get('after_status')))} | {change} | "
+            f"{b.get('p95', 'n/a')}/{a.get('p95', 'n/a')} | {b.get('shared_read', 'n/a')}/{a.get('shared_read', 'n/a')} |"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,181 @@
+# plan_diff.py
+import logging
+from collections import defaultdict
+from typing import Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+JOIN_NODES = ("Nested Loop", "Hash Join", "Merge Join")
+METRICS = ("total_ms", "self_ms", "rows", "loops", "shared_hit", "shared_read")
+
+
+def _label(node: Dict[str, Any]) -> str:
+    label = node["Node Type"]
+    if node.get("Join Type") and node["Node Type"] in JOIN_NODES and node["Join Type"] != "Inner":
+        label = f"{node['Join Type']} {label}"
+    if node.get("Index Name"):
+        label += f" using {node['Index Name']}"
+    if node.get("Relation Name"):
+        alias = node.get("Alias")
+        label += f" on {node['Relation Name']}" + (f" {alias}" if alias and alias != node["Relation Name"] else "")
+    return label
+
+
+def flatten(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Depth-first list of plan nodes with inclusive/exclusive timings and the
+    relations each subtree reads, for an EXPLAIN (ANALYZE, FORMAT JSON) plan."""
+    nodes = []
+
+    def walk(node, depth, parent_relation):
+        relation = node.get("Alias") or node.get("Relation Name")
+        loops = node.get("Actual Loops", 1) or 1
+        record = {
+            "node_type": node["Node Type"],
+            "label": _label(node),
+            "depth": depth,
+            "relation": relation or (parent_relation if node["Node Type"] == "Bitmap Index Scan" else None),
+            "total_ms": round(node.get("Actual Total Time", 0.0) * loops, 3),
+            "rows": node.get("Actual Rows", 0) * loops,
+            "plan_rows": node.get("Plan Rows", 0) * loops,
+            "loops": loops,
+            "shared_hit": node.get("Shared Hit Blocks", 0),
+            "shared_read": node.get("Shared Read Blocks", 0),
+        }
+        nodes.append(record)
+        children = [walk(child, depth + 1, relation) for child in node.get("Plans", [])]
+        # Inclusive time and buffers of a node contain its children
+        record["self_ms"] = round(max(record["total_ms"] - sum(c["total_ms"] for c in children), 0.0), 3)
+        relations = set(filter(None, [record["relation"]]))
+        for child in children:
+            relations |= child["relations"]
+        record["relations"] = frozenset(relations)
+        return record
+
+    walk(plan, 0, None)
+    return nodes
+
+
+def misestimate(node: Dict[str, Any]) -> float:
+    """How far the planner's row estimate was off, as a factor >= 1."""
+    actual, planned = max(node["rows"], 1), max(node["plan_rows"], 1)
+    return round(max(actual, planned) / min(actual, planned), 2)
+
+
+def _align_key(node: Dict[str, Any]) -> Tuple:
+    if node["node_type"] == "Bitmap Index Scan":
+        return ("bitmap index", node["relation"])
+    if node["relation"] and node["node_type"].endswith("Scan"):
+        return ("scan", node["relation"])
+    if node["node_type"] in JOIN_NODES:
+        return ("join", node["relations"])
+    return (node["node_type"], node["relations"])
+
+
+def align(before: List[Dict[str, Any]], after: List[Dict[str, Any]]) -> Tuple[List[Tuple[Dict, Dict]], List[Dict], List[Dict]]:
+    """Pair nodes of two plans reading the same relations in the same role.
+
+    Scans pair by relation alias and joins by the set of relations they
+    combine, so Seq Scan -> Index Scan and Hash Join -> Merge Join show up as
+    changes of one node. Remaining nodes pair by type and subtree.
+    """
+    pending = defaultdict(list)
+    for node in after:
+        pending[_align_key(node)].append(node)
+    pairs, removed = [], []
+    for node in before:
+        candidates = pending.get(_align_key(node))
+        if candidates:
+            pairs.append((node, candidates.pop(0)))
+        else:
+            removed.append(node)
+    added = [node for nodes in pending.values() for node in nodes]
+    return pairs, removed, sorted(added, key=lambda n: after.index(n))
+
+
+def _delta(before: float, after: float) -> Dict[str, Any]:
+    change = round(after - before, 3)
+    return {"before": before, "after": after, "delta": change,
+            "pct": round(change / before * 100, 1) if before else None}
+
+
+def diff_plans(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """Structural diff of two EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) results.
+
+    Accepts the top-level objects ({"Plan", "Planning Time", "Execution Time"})
+    or bare plan trees.
+    """
+    before_plan, after_plan = before.get("Plan", before), after.get("Plan", after)
+    before_nodes, after_nodes = flatten(before_plan), flatten(after_plan)
+    pairs, removed, added = align(before_nodes, after_nodes)
+
+    nodes, changes = [], []
+    for b, a in pairs:
+        if b["label"] != a["label"]:
+            changes.append({"from": b["label"], "to": a["label"]})
+        nodes.append({
+            "before": b["label"],
+            "after": a["label"],
+            "changed": b["label"] != a["label"],
+            **{metric: _delta(b[metric], a[metric]) for metric in METRICS},
+            "misestimate_before": misestimate(b),
+            "misestimate_after": misestimate(a),
+        })
+    nodes.sort(key=lambda n: -abs(n["self_ms"]["delta"]))
+
+    summary = {
+        "execution_ms": _delta(before.get("Execution Time", before_nodes[0]["total_ms"]),
+                               after.get("Execution Time", after_nodes[0]["total_ms"])),
+        "planning_ms": _delta(before.get("Planning Time", 0.0), after.get("Planning Time", 0.0)),
+        "changes": changes,
+        "removed": [{"label": n["label"], "self_ms": n["self_ms"]} for n in removed],
+        "added": [{"label": n["label"], "self_ms": n["self_ms"], "misestimate": misestimate(n)} for n in added],
+        "nodes": nodes,
+        "worst_misestimate_after": max((misestimate(n) for n in after_nodes), default=1.0),
+    }
+    return summary
+
+
+def diff_benchmarks(before: Dict[str, Any], after: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Plan diffs for every query benchmarked both before and after."""
+    after_by_query = {r["query"]: r for r in (after or {}).get("queries", [])}
+    diffs = []
+    for b in (before or {}).get("queries", []):
+        a = after_by_query.get(b["query"])
+        if not a or not b.get("plan") or not a.get("plan"):
+            continue
+        try:
+            diffs.append({"query": b["query"], **diff_plans(b["plan"], a["plan"])})
+        except (KeyError, TypeError) as e:
+            logger.warning(f"Plan diff failed for {b['query'][:50]}...: {str(e)}")
+    return diffs
+
+
+def format_plan_diff(diff: Dict[str, Any], max_nodes: int = 5) -> str:
+    exec_ms = diff["execution_ms"]
+    pct = f" ({exec_ms['pct']:+.1f}%)" if exec_ms["pct"] is not None else ""
+    lines = [f"execution {exec_ms['before']} -> {exec_ms['after']} ms{pct}"]
+    for change in diff["changes"]:
+        lines.append(f"  changed: {change['from']} -> {change['to']}")
+    for node in diff["removed"]:
+        lines.append(f"  removed: {node['label']} (self {node['self_ms']} ms)")
+    for node in diff["added"]:
+        lines.append(f"  added: {node['label']} (self {node['self_ms']} ms, misestimate x{node['misestimate']})")
+    for node in diff["nodes"][:max_nodes]:
+        if not node["self_ms"]["delta"] and not node["changed"]:
+            continue
+        lines.append(
+            f"  {node['after']}: self {node['self_ms']['before']} -> {node['self_ms']['after']} ms, "
+            f"rows {node['rows']['before']} -> {node['rows']['after']}, "
+            f"buffers {node['shared_hit']['before'] + node['shared_read']['before']} -> "
+            f"{node['shared_hit']['after'] + node['shared_read']['after']}, "
+            f"misestimate x{node['misestimate_before']} -> x{node['misestimate_after']}"
+        )
+    return "\n".join(lines)
+
+
+def format_plan_diffs(diffs: List[Dict[str, Any]], max_nodes: int = 5) -> str:
+    sections = []
+    for i, diff in enumerate(diffs, 1):
+        query = " ".join(diff["query"].split())[:80]
+        sections.append(f"Q{i}: {query}\n{format_plan_diff(diff, max_nodes)}")
+    return "\n".join(sections)
@@ -0,0 +1,301 @@
+# replay.py
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+import psycopg2
+from psycopg2.errorcodes import QUERY_CANCELED
+from sql.budget import CancelToken
+from sql.pool import ConnectionPool, close_pool, get_pool
+from sql.result_set import is_read_only_query
+from tester.benchmark import summarize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLIENTS = 4
+DEFAULT_DURATION = 10.0
+DEFAULT_STATEMENT_TIMEOUT_MS = 30000
+LOCK_SAMPLE_INTERVAL = 0.2
+FETCH_SIZE = 1000
+# Gives the replay clients a pool of their own, kept apart from the shared one
+REPLAY_APPLICATION = "stonebraker_replay"
+
+LOCK_QUERY = """
+    SELECT count(*) FILTER (WHERE wait_event_type = 'Lock'),
+           count(*) FILTER (WHERE wait_event_type = 'LWLock')
+    FROM pg_stat_activity
+    WHERE pid = ANY(%s)
+"""
+
+
+def weighted_queries(queries: List[Any]) -> List[Dict[str, Any]]:
+    """Normalize a replay workload to [{"query", "weight"}].
+
+    Accepts plain query strings (weight 1), {"query", "weight"} dicts and
+    collected workload entries, which are weighted by their call counts.
+    Parameterized statements cannot be replayed and are dropped.
+    """
+    weighted = []
+    for item in queries:
+        if isinstance(item, str):
+            query, weight = item, 1
+        else:
+            query = item.get("example") or item["query"]
+            weight = item.get("weight") or item.get("calls") or 1
+        query = query.strip().rstrip(";")
+        if re.search(r"\$\d+", query):
+            # Normalized pg_stat_statements text has no values to bind
+            logger.info(f"Skipping parameterized statement: {query[:50]}...")
+            continue
+        if query and weight > 0:
+            weighted.append({"query": query, "weight": float(weight)})
+    return weighted
+
+
+class _Client(threading.Thread):
+    def __init__(self, pool: ConnectionPool, workload: List[Dict[str, Any]], deadline: float,
+                 seed: Optional[int], commit: bool, statement_timeout_ms: int, token: CancelToken):
+        super().__init__(daemon=True)
+        self.pool = pool
+        self.workload = workload
+        self.deadline = deadline
+        self.random = random.Random(seed)
+        self.commit = commit
+        self.statement_timeout_ms = statement_timeout_ms
+        self.token = token
+        self.pid = None
+        self.ready = threading.Event()
+        self.latencies = {i: [] for i in range(len(workload))}
+        self.errors = {i: 0 for i in range(len(workload))}
+        self.timeouts = {i: 0 for i in range(len(workload))}
+        self.last_error = {}
+        self.failure = None
+
+    @staticmethod
+    def _run(conn, cursor, query: str):
+        # Rows are read the way a client would, a batch at a time, and dropped
+        if is_read_only_query(query):
+            with conn.cursor(name=f"stonebraker_replay_{uuid.uuid4().hex[:12]}") as named:
+                named.execute(query)
+                while named.fetchmany(FETCH_SIZE):
+                    pass
+            return
+        cursor.execute(query)
+        if cursor.description:
+            while cursor.fetchmany(FETCH_SIZE):
+                pass
+
+    def run(self):
+        weights = [q["weight"] for q in self.workload]
+        try:
+            conn = self.pool.getconn()
+        except Exception as e:
+            self.failure = str(e)
+            self.ready.set()
+            return
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                self.pid = cursor.fetchone()[0]
+                cursor.execute(f"SET statement_timeout = {int(self.statement_timeout_ms)}")
+            conn.commit()
+            self.ready.set()
+            self.token.register(conn)
+            with conn.cursor() as cursor:
+                while time.monotonic() < self.deadline and not self.token.cancelled:
+                    i = self.random.choices(range(len(self.workload)), weights)[0]
+                    start = time.perf_counter()
+                    try:
+                        self._run(conn, cursor, self.workload[i]["query"])
+                        if self.commit:
+                            conn.commit()
+                        else:
+                            conn.rollback()
+                        self.latencies[i].append((time.perf_counter() - start) * 1000)
+                    except psycopg2.Error as e:
+                        conn.rollback()
+                        if self.token.cancelled:
+                            break
+                        self.errors[i] += 1
+                        if e.pgcode == QUERY_CANCELED:
+                            self.timeouts[i] += 1
+                        self.last_error[i] = str(e).strip()
+        except psycopg2.Error as e:
+            self.failure = str(e).strip()
+        finally:
+            self.ready.set()
+            self.token.unregister(conn)
+            try:
+                conn.rollback()
+                with conn.cursor() as cursor:
+                    cursor.execute("RESET statement_timeout")
+                conn.commit()
+                self.pool.putconn(conn)
+            except psycopg2.Error:
+                self.pool.putconn(conn, discard=True)
+
+
+def _sample_locks(pool: ConnectionPool, pids: List[int], stop: threading.Event) -> Dict[str, Any]:
+    samples = lock_samples = lwlock_samples = max_waiting = waiting_total = 0
+    with pool.connection() as conn:
+        with conn.cursor() as cursor:
+            while not stop.wait(LOCK_SAMPLE_INTERVAL):
+                cursor.execute(LOCK_QUERY, (pids,))
+                locks, lwlocks = cursor.fetchone()
+                conn.rollback()
+                samples += 1
+                lock_samples += 1 if locks else 0
+                lwlock_samples += 1 if lwlocks else 0
+                waiting_total += locks
+                max_waiting = max(max_waiting, locks)
+    return {
+        "samples": samples,
+        "lock_wait_pct": round(lock_samples / samples * 100, 1) if samples else 0.0,
+        "lwlock_wait_pct": round(lwlock_samples / samples * 100, 1) if samples else 0.0,
+        "avg_waiting": round(waiting_total / samples, 2) if samples else 0.0,
+        "max_waiting": max_waiting,
+    }
+
+
+def run_replay(db_config: Dict[str, Any], queries: List[Any], clients: int = DEFAULT_CLIENTS,
+               duration: float = DEFAULT_DURATION, seed: Optional[int] = None, commit: bool = False,
+               statement_timeout_ms: int = DEFAULT_STATEMENT_TIMEOUT_MS,
+               token: Optional[CancelToken] = None) -> Dict[str, Any]:
+    """Drive a weighted query mix with concurrent clients for a fixed duration.
+
+    Each client picks statements at random in proportion to their weight and
+    runs each in its own transaction, rolled back unless commit is set, so
+    locks are taken as under the real workload without changing the data.
+    Lock waits are sampled from pg_stat_activity while the clients run.
+    Cancelling token stops the clients and interrupts their running statements.
+    """
+    token = token or CancelToken()
+    workload = weighted_queries(queries)
+    if not workload:
+        return {"clients": clients, "duration_s": duration, "transactions": 0, "queries": [], "error": "No queries to replay"}
+
+    # A pool of their own keeps the replay clients from starving the shared one
+    replay_config = dict(db_config, application_name=REPLAY_APPLICATION)
+    close_pool(replay_config)
+    pool = get_pool(replay_config, max_connections=clients + 1)
+    try:
+        deadline = time.monotonic() + duration
+        started = time.monotonic()
+        workers = [
+            _Client(pool, workload, deadline, None if seed is None else seed + n, commit, statement_timeout_ms, token)
+            for n in range(clients)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.ready.wait()
+
+        stop = threading.Event()
+        locks = {}
+        sampler = threading.Thread(
+            target=lambda: locks.update(_sample_locks(pool, [w.pid for w in workers if w.pid], stop)),
+            daemon=True,
+        )
+        sampler.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+        stop.set()
+        sampler.join()
+    finally:
+        close_pool(replay_config)
+
+    failures = [w.failure for w in workers if w.failure]
+    per_query, all_latencies, total_errors, total_timeouts = [], [], 0, 0
+    for i, item in enumerate(workload):
+        latencies = [ms for w in workers for ms in w.latencies[i]]
+        errors = sum(w.errors[i] for w in workers)
+        timeouts = sum(w.timeouts[i] for w in workers)
+        last_error = next((w.last_error[i] for w in workers if i in w.last_error), None)
+        all_latencies.extend(latencies)
+        total_errors += errors
+        total_timeouts += timeouts
+        per_query.append({
+            "query": item["query"],
+            "weight": item["weight"],
+            "count": len(latencies),
+            "errors": errors,
+            "timeouts": timeouts,
+            "last_error": last_error,
+            "latency_ms": summarize(latencies),
+        })
+
+    transactions = len(all_latencies)
+    attempts = transactions + total_errors
+    results = {
+        "clients": clients,
+        "duration_s": round(elapsed, 3),
+        "transactions": transactions,
+        "errors": total_errors,
+        "timeouts": total_timeouts,
+        "cancelled": token.cancelled,
+        "error_rate": round(total_errors / attempts, 4) if attempts else 0.0,
+        "tps": round(transactions / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize(all_latencies),
+        "locks": locks,
+        "queries": per_query,
+        "error": "; ".join(failures) if failures else None,
+    }
+    logger.info(f"Replayed {transactions} transactions with {clients} clients in {elapsed:.1f}s "
+                f"({results['tps']} tps, {total_errors} errors)")
+    return results
+
+
+def compare_replays(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """Relative change of the headline replay metrics."""
+    def change(b, a):
+        if b is None or a is None or not b:
+            return None
+        return round((a - b) / b * 100, 1)
+
+    before, after = before or {}, after or {}
+    b_lat, a_lat = before.get("latency_ms") or {}, after.get("latency_ms") or {}
+    return {
+        "tps": (before.get("tps"), after.get("tps"), change(before.get("tps"), after.get("tps"))),
+        "p50": (b_lat.get("median"), a_lat.get("median"), change(b_lat.get("median"), a_lat.get("median"))),
+        "p95": (b_lat.get("p95"), a_lat.get("p95"), change(b_lat.get("p95"), a_lat.get("p95"))),
+        "p99": (b_lat.get("p99"), a_lat.get("p99"), change(b_lat.get("p99"), a_lat.get("p99"))),
+        "error_rate": (before.get("error_rate"), after.get("error_rate"), None),
+        "lock_wait_pct": ((before.get("locks") or {}).get("lock_wait_pct"),
+                          (after.get("locks") or {}).get("lock_wait_pct"), None),
+    }
+
+
+def format_replay(results: Dict[str, Any]) -> str:
+    if not results.get("transactions") and results.get("error"):
+        return f"Replay failed: {results['error']}"
+    lat, locks = results["latency_ms"], results.get("locks") or {}
+    lines = [
+        f"{results['clients']} clients, {results['duration_s']}s: {results['transactions']} transactions, "
+        f"{results['tps']} tps, p50={lat['median']}ms p95={lat['p95']}ms p99={lat['p99']}ms, "
+        f"error rate {results['error_rate'] * 100:.2f}% ({results.get('timeouts', 0)} timeouts), lock waits in {locks.get('lock_wait_pct', 0)}% of samples "
+        f"(max {locks.get('max_waiting', 0)} waiting)"
+    ]
+    if results.get("cancelled"):
+        lines[0] += ", cancelled"
+    for i, q in enumerate(results["queries"], 1):
+        error = f" last error: {q['last_error'].splitlines()[0]}" if q["last_error"] else ""
+        latency = f" p50={q['latency_ms']['median']}ms p95={q['latency_ms']['p95']}ms" if q["count"] else ""
+        lines.append(f"  R{i} weight={q['weight']:g} count={q['count']} errors={q['errors']} timeouts={q.get('timeouts', 0)}"
+                     f"{latency}{error} -- {q['query'][:80]}")
+    return "\n".join(lines)
+
+
+def format_replay_comparison(comparison: Dict[str, Any]) -> str:
+    labels = {"tps": "Throughput (tps)", "p50": "p50 latency (ms)", "p95": "p95 latency (ms)",
+              "p99": "p99 latency (ms)", "error_rate": "Error rate", "lock_wait_pct": "Lock wait samples (%)"}
+    lines = ["| Metric | Before | After | Change |", "|--------|-----|-----|-----|"]
+    for key, label in labels.items():
+        before, after, change = comparison[key]
+        change = f"{change:+.1f}%" if change is not None else "n/a"
+        lines.append(f"| {label} | {before if before is not None else 'n/a'} | "
+                     f"{after if after is not None else 'n/a'} | {change} |")
+    return "\n".join(lines)
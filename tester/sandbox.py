@@ -0,0 +1,435 @@
+# sandbox.py
+import logging
+import re
+import time
+import uuid
+from typing import Dict, Any, Iterable, List, Optional, Set
+import psycopg2
+from psycopg2 import errors
+from sql.budget import Budget
+from sql.datagen import DEFAULT_WORKERS, generate_data
+from sql.pool import close_pool, get_pool
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = "schema"
+TEMPLATE = "template"
+OFF = "off"
+STRATEGIES = (SCHEMA, TEMPLATE, OFF)
+
+DEFAULT_SAMPLE_FRACTION = 0.1
+# Tables smaller than this are copied whole; sampling them saves little and loses rows
+DEFAULT_FULL_COPY_BYTES = 64 * 1024 * 1024
+# SYSTEM reads only the sampled pages; BERNOULLI picks rows independently but reads every page
+DEFAULT_SAMPLE_METHOD = "SYSTEM"
+MAINTENANCE_DB = "postgres"
+SANDBOX_PREFIX = "sandbox_"
+SANDBOX_COMMENT = "stonebraker sandbox created at"
+# Sandboxes left behind by crashed runs are dropped once they are this old
+STALE_AFTER_S = 6 * 3600
+
+TABLES_QUERY = """
+    SELECT c.oid, n.nspname, quote_ident(n.nspname) || '.' || quote_ident(c.relname),
+           quote_ident(c.relname),
+           coalesce((SELECT sum(pg_relation_size(t.relid)) FROM pg_partition_tree(c.oid) t),
+                    pg_relation_size(c.oid))::bigint
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.relkind IN ('r', 'p') AND NOT c.relispartition
+      AND n.nspname <> 'information_schema' AND n.nspname NOT LIKE 'pg\\_%'
+      AND n.nspname NOT LIKE 'sandbox\\_%'
+      AND has_table_privilege(c.oid, 'SELECT')
+      AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.objid = c.oid AND d.deptype = 'e')
+    ORDER BY n.nspname, c.relname
+"""
+
+FOREIGN_KEY_EDGES_QUERY = """
+    SELECT conrelid, confrelid FROM pg_constraint WHERE contype = 'f' AND conrelid = ANY(%s::oid[])
+"""
+
+IDENTIFIER = re.compile(r'"((?:[^"]|"")+)"|([A-Za-z_][\w$]*)')
+
+COLUMNS_QUERY = """
+    SELECT attrelid, string_agg(quote_ident(attname), ', ' ORDER BY attnum),
+           bool_or(attidentity = 'a'), array_agg(attname::text) FILTER (WHERE attidentity <> '')
+    FROM pg_attribute
+    WHERE attrelid = ANY(%s::oid[]) AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+    GROUP BY attrelid
+"""
+
+CONSTRAINTS_QUERY = """
+    SELECT con.conrelid, quote_ident(con.conname), con.contype, pg_get_constraintdef(con.oid), con.confrelid,
+           ARRAY(SELECT quote_ident(a.attname) FROM unnest(con.conkey) WITH ORDINALITY k(attnum, i)
+                 JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum ORDER BY k.i),
+           ARRAY(SELECT quote_ident(a.attname) FROM unnest(con.confkey) WITH ORDINALITY k(attnum, i)
+                 JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum ORDER BY k.i)
+    FROM pg_constraint con
+    WHERE con.conrelid = ANY(%s::oid[]) AND con.contype IN ('p', 'u', 'x', 'f')
+    ORDER BY position(con.contype IN 'puxf'), con.conname
+"""
+
+INDEXES_QUERY = """
+    SELECT i.indrelid, pg_get_indexdef(i.indexrelid)
+    FROM pg_index i
+    WHERE i.indrelid = ANY(%s::oid[])
+      AND NOT EXISTS (SELECT 1 FROM pg_constraint c
+                      WHERE c.conindid = i.indexrelid AND c.contype IN ('p', 'u', 'x'))
+"""
+
+# Column defaults drawing from a sequence, e.g. serial columns
+SEQUENCE_DEFAULTS_QUERY = """
+    SELECT d.adrelid, quote_ident(a.attname), pg_get_expr(d.adbin, d.adrelid), n.nspname,
+           quote_ident(n.nspname) || '.' || quote_ident(s.relname), quote_ident(s.relname)
+    FROM pg_attrdef d
+    JOIN pg_attribute a ON a.attrelid = d.adrelid AND a.attnum = d.adnum
+    JOIN pg_depend dep ON dep.classid = 'pg_attrdef'::regclass AND dep.objid = d.oid
+                      AND dep.refclassid = 'pg_class'::regclass
+    JOIN pg_class s ON s.oid = dep.refobjid AND s.relkind = 'S'
+    JOIN pg_namespace n ON n.oid = s.relnamespace
+    WHERE d.adrelid = ANY(%s::oid[])
+"""
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _unquote(ident: str) -> str:
+    return ident[1:-1].replace('""', '"') if ident.startswith('"') else ident
+
+
+def referenced_names(statements: Iterable[str]) -> Set[str]:
+    """Every identifier in statements as PostgreSQL folds it; a superset of the relations they use."""
+    names = set()
+    for statement in statements:
+        for quoted, plain in IDENTIFIER.findall(statement or ""):
+            names.add(quoted.replace('""', '"') if quoted else plain.lower())
+    return names
+
+
+def _comment() -> str:
+    return f"{SANDBOX_COMMENT} {int(time.time())}"
+
+
+def _is_stale(comment: Optional[str], max_age_s: float) -> bool:
+    match = re.fullmatch(rf"{SANDBOX_COMMENT} (\d+)", comment or "")
+    return bool(match) and time.time() - int(match.group(1)) > max_age_s
+
+
+def drop_stale_sandboxes(db_config: Dict[str, Any], max_age_s: float = STALE_AFTER_S) -> List[str]:
+    """Drop sandbox schemas and databases older than max_age_s left by runs that never dropped them."""
+    dropped = []
+    with get_pool(db_config).connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT nspname, obj_description(oid, 'pg_namespace') FROM pg_namespace "
+                           "WHERE nspname LIKE 'sandbox\\_%'")
+            for name, comment in cursor.fetchall():
+                if _is_stale(comment, max_age_s):
+                    cursor.execute(f"DROP SCHEMA IF EXISTS {_quote(name)} CASCADE")
+                    dropped.append(name)
+    with get_pool(dict(db_config, database=MAINTENANCE_DB)).connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT datname, shobj_description(oid, 'pg_database') FROM pg_database "
+                           "WHERE datname LIKE 'sandbox\\_%'")
+            for name, comment in cursor.fetchall():
+                if _is_stale(comment, max_age_s):
+                    cursor.execute(f"DROP DATABASE IF EXISTS {_quote(name)} WITH (FORCE)")
+                    dropped.append(name)
+    if dropped:
+        logger.info(f"Dropped {len(dropped)} stale sandboxes: {', '.join(dropped)}")
+    return dropped
+
+
+class Sandbox:
+    """Disposable copy of a database for running tests against.
+
+    The schema strategy copies the tables statements refer to, plus the
+    tables their foreign keys reference, into sandbox_<id>_<schema> schemas
+    of the same database (every table when statements is None). Tables
+    larger than full_copy_bytes are copied as a TABLESAMPLE of fraction of
+    their pages, then every row their foreign keys reference is pulled in as
+    well, so all constraints hold on the sample. Each table is loaded in its
+    own transaction. Indexes and constraints are built after loading, the
+    copy is analyzed, and sandbox tables are unlogged. The sandbox db_config
+    puts the sandbox schemas first on the search_path; tables that were not
+    copied, views, functions and triggers still resolve to the source schemas.
+
+    The template strategy clones a whole database with CREATE DATABASE ...
+    TEMPLATE. It needs a template nobody is connected to: either an idle
+    source or a pre-sampled copy kept for testing. fraction does not apply.
+
+    Source tables are only ever read.
+    """
+
+    def __init__(self, db_config: Dict[str, Any], strategy: str = SCHEMA,
+                 fraction: float = DEFAULT_SAMPLE_FRACTION, full_copy_bytes: int = DEFAULT_FULL_COPY_BYTES,
+                 method: str = DEFAULT_SAMPLE_METHOD, template: Optional[str] = None, seed: Optional[int] = None,
+                 statements: Optional[List[str]] = None):
+        if strategy not in (SCHEMA, TEMPLATE):
+            raise ValueError(f"Unknown sandbox strategy: {strategy}")
+        if not 0 < fraction <= 1:
+            raise ValueError(f"Sample fraction must be in (0, 1], got {fraction}")
+        self.source = db_config
+        self.strategy = strategy
+        self.fraction = fraction
+        self.full_copy_bytes = full_copy_bytes
+        self.method = method
+        self.template = template or db_config["database"]
+        self.seed = seed
+        self.referenced = None if statements is None else referenced_names(statements)
+        self.name = f"{SANDBOX_PREFIX}{uuid.uuid4().hex[:8]}"
+        self.db_config: Optional[Dict[str, Any]] = None
+        self.schemas: Dict[str, str] = {}
+        self.report: Dict[str, Any] = {"strategy": strategy, "name": self.name}
+
+    def __enter__(self) -> "Sandbox":
+        return self
+
+    def __exit__(self, *exc):
+        self.drop()
+
+    def create(self, budget: Optional[Budget] = None) -> "Sandbox":
+        started = time.monotonic()
+        try:
+            drop_stale_sandboxes(self.source)
+        except psycopg2.Error as e:
+            logger.warning(f"Stale sandbox cleanup failed: {str(e)}")
+        try:
+            if self.strategy == TEMPLATE:
+                self._clone_database()
+            else:
+                self._copy_schemas(budget or Budget(statement_timeout_ms=0, phase_timeout_s=0))
+        except psycopg2.Error as e:
+            self.drop()
+            raise RuntimeError(f"Could not create sandbox {self.name}: {str(e).strip()}") from e
+        except Exception:
+            self.drop()
+            raise
+        self.report["elapsed_s"] = round(time.monotonic() - started, 2)
+        logger.info(f"Created sandbox {self.name} in {self.report['elapsed_s']}s")
+        return self
+
+    def drop(self):
+        if self.db_config is not None:
+            close_pool(self.db_config)
+        try:
+            if self.strategy == TEMPLATE:
+                with get_pool(dict(self.source, database=MAINTENANCE_DB)).connection() as conn:
+                    conn.autocommit = True
+                    with conn.cursor() as cursor:
+                        cursor.execute(f"DROP DATABASE IF EXISTS {_quote(self.name)} WITH (FORCE)")
+            elif self.schemas:
+                with get_pool(self.source).connection() as conn:
+                    with conn.cursor() as cursor:
+                        for schema in self.schemas.values():
+                            cursor.execute(f"DROP SCHEMA IF EXISTS {_quote(schema)} CASCADE")
+            logger.info(f"Dropped sandbox {self.name}")
+        except psycopg2.Error as e:
+            logger.error(f"Could not drop sandbox {self.name}: {str(e)}")
+        self.db_config = None
+
+    def grow(self, scale: float, workers: int = DEFAULT_WORKERS) -> Dict[str, Dict[str, Any]]:
+        """Add synthetic rows until each sandbox table is scale times its current size."""
+        report = generate_data(self.db_config, scale=scale, schemas=list(self.schemas.values()) or None,
+                               workers=workers)
+        self.report.update(scale=scale, generated_rows=sum(r["inserted"] for r in report.values()))
+        return report
+
+    def rewrite(self, statement: str) -> str:
+        """Point references qualified with a copied schema at its sandbox schema."""
+        for source, target in self.schemas.items():
+            names = [re.escape(_quote(source))]
+            if re.fullmatch(r"[a-z_][a-z0-9_$]*", source):
+                names.append(rf"(?i:{re.escape(source)})")
+            statement = re.sub(rf"(?<![\w$.\"])(?:{'|'.join(names)})(?=\s*\.)", _quote(target), statement)
+        return statement
+
+    def rewrite_workload(self, queries: List[Any]) -> List[Any]:
+        rewritten = []
+        for item in queries:
+            if isinstance(item, str):
+                rewritten.append(self.rewrite(item))
+            else:
+                item = dict(item)
+                for key in ("query", "example"):
+                    if item.get(key):
+                        item[key] = self.rewrite(item[key])
+                rewritten.append(item)
+        return rewritten
+
+    def _clone_database(self):
+        if self.template == self.source["database"]:
+            # Our own idle pooled sessions would make the template "in use"
+            close_pool(self.source)
+        with get_pool(dict(self.source, database=MAINTENANCE_DB)).connection() as conn:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                try:
+                    cursor.execute(f"CREATE DATABASE {_quote(self.name)} TEMPLATE {_quote(self.template)}")
+                except errors.ObjectInUse as e:
+                    raise RuntimeError(
+                        f"Template database {self.template} has other sessions; use the schema "
+                        f"strategy or a dedicated template database"
+                    ) from e
+                cursor.execute(f"COMMENT ON DATABASE {_quote(self.name)} IS %s", (_comment(),))
+        self.db_config = dict(self.source, database=self.name)
+        self.report.update(template=self.template, fraction=1.0)
+
+    def _copy_schemas(self, budget: Budget):
+        with get_pool(self.source).connection() as conn, budget.guard(conn):
+            with conn.cursor() as cursor:
+                # Deparsed definitions come out fully qualified; kept for the session
+                # because every table is loaded in a transaction of its own
+                cursor.execute("SELECT current_schemas(false)")
+                search_path = cursor.fetchone()[0]
+                cursor.execute("SET search_path = pg_catalog")
+                try:
+                    tables, sampled, rows, closure_rows = self._copy_tables(conn, cursor, budget)
+                finally:
+                    conn.rollback()
+                    cursor.execute("RESET search_path")
+
+        path = [self.schemas[s] for s in search_path if s in self.schemas] + list(search_path)
+        self.db_config = dict(self.source, search_path=",".join(_quote(s) for s in path))
+        self.report.update(fraction=self.fraction, tables=len(tables), sampled=sampled,
+                           rows=rows + closure_rows, closure_rows=closure_rows,
+                           schemas=dict(self.schemas))
+
+    def _select_tables(self, cursor, tables: Dict[int, Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """The tables the statements refer to and, transitively, the tables their foreign keys reference."""
+        if self.referenced is None:
+            return tables
+        selected = {oid for oid, t in tables.items() if t["name"] in self.referenced}
+        cursor.execute(FOREIGN_KEY_EDGES_QUERY, (list(tables),))
+        parents = {}
+        for child, parent in cursor.fetchall():
+            parents.setdefault(child, set()).add(parent)
+        pending = list(selected)
+        while pending:
+            for parent in parents.get(pending.pop(), ()):
+                if parent in tables and parent not in selected:
+                    selected.add(parent)
+                    pending.append(parent)
+        return {oid: t for oid, t in tables.items() if oid in selected}
+
+    def _copy_tables(self, conn, cursor, budget: Budget):
+        cursor.execute(TABLES_QUERY)
+        tables = {oid: {"schema": schema, "source": name, "relname": relname, "bytes": size or 0,
+                        "name": _unquote(relname)}
+                  for oid, schema, name, relname, size in cursor.fetchall()}
+        tables = self._select_tables(cursor, tables)
+        if not tables:
+            raise RuntimeError("None of the tested statements refer to a table to copy into the sandbox")
+
+        for schema in sorted({t["schema"] for t in tables.values()}):
+            self.schemas[schema] = f"{self.name}_{schema}"[:63]
+            cursor.execute(f"CREATE SCHEMA {_quote(self.schemas[schema])}")
+            cursor.execute(f"COMMENT ON SCHEMA {_quote(self.schemas[schema])} IS %s", (_comment(),))
+        for table in tables.values():
+            table["target"] = f"{_quote(self.schemas[table['schema']])}.{table['relname']}"
+
+        oids = list(tables)
+        self._create_tables(cursor, tables, oids)
+        conn.commit()
+        sampled, rows = self._load(conn, cursor, tables, budget)
+        cursor.execute(CONSTRAINTS_QUERY, (oids,))
+        constraints = [c for c in cursor.fetchall() if c[2] != "f" or c[4] in tables]
+        foreign_keys = [c for c in constraints if c[2] == "f"]
+        closure_rows = self._close_foreign_keys(conn, cursor, tables, foreign_keys, budget)
+        self._build_constraints(conn, cursor, tables, constraints, oids)
+        for table in tables.values():
+            budget.check()
+            cursor.execute(f"ANALYZE {table['target']}")
+            conn.commit()
+        return tables, sampled, rows, closure_rows
+
+    def _create_tables(self, cursor, tables: Dict[int, Dict[str, Any]], oids: List[int]):
+        # Unlogged: loading the copy ships no WAL to the source's standbys
+        for table in tables.values():
+            cursor.execute(f"CREATE UNLOGGED TABLE {table['target']} (LIKE {table['source']} INCLUDING ALL EXCLUDING INDEXES)")
+        cursor.execute(COLUMNS_QUERY, (oids,))
+        for oid, columns, always_identity, identity in cursor.fetchall():
+            tables[oid].update(columns=columns, always_identity=always_identity, identity=identity or [])
+
+        # LIKE keeps nextval() on the source's sequences; give the sandbox its own
+        cursor.execute(SEQUENCE_DEFAULTS_QUERY, (oids,))
+        created = set()
+        for oid, column, default, schema, sequence, relname in cursor.fetchall():
+            if schema not in self.schemas:
+                continue
+            target = f"{_quote(self.schemas[schema])}.{relname}"
+            if target not in created:
+                cursor.execute(f"CREATE SEQUENCE {target}")
+                cursor.execute(f"SELECT setval(%s::regclass, last_value, is_called) FROM {sequence}", (target,))
+                created.add(target)
+            default = default.replace(f"'{sequence}'::regclass", f"'{target}'::regclass")
+            cursor.execute(f"ALTER TABLE {tables[oid]['target']} ALTER COLUMN {column} SET DEFAULT {default}")
+
+    def _insert(self, table: Dict[str, Any]) -> str:
+        overriding = " OVERRIDING SYSTEM VALUE" if table["always_identity"] else ""
+        return f"INSERT INTO {table['target']} ({table['columns']}){overriding} SELECT {table['columns']}"
+
+    def _load(self, conn, cursor, tables: Dict[int, Dict[str, Any]], budget: Budget):
+        sampled, rows = [], 0
+        repeatable = f" REPEATABLE ({int(self.seed)})" if self.seed is not None else ""
+        for table in tables.values():
+            budget.check()
+            source = table["source"]
+            if self.fraction < 1 and table["bytes"] > self.full_copy_bytes:
+                source += f" TABLESAMPLE {self.method} ({self.fraction * 100}){repeatable}"
+                sampled.append(table["source"])
+            cursor.execute(f"{self._insert(table)} FROM {source}")
+            conn.commit()
+            rows += max(cursor.rowcount, 0)
+            logger.debug(f"Copied {cursor.rowcount} rows of {table['source']}")
+        return sampled, rows
+
+    def _close_foreign_keys(self, conn, cursor, tables: Dict[int, Dict[str, Any]], foreign_keys: List[tuple],
+                            budget: Budget) -> int:
+        """Copy the referenced rows sampled children point at until every foreign key holds."""
+        total, added = 0, None
+        while added != 0:
+            added = 0
+            for child_oid, _, _, _, parent_oid, columns, referenced in foreign_keys:
+                budget.check()
+                child, parent = tables[child_oid], tables[parent_oid]
+                source_key = ", ".join(f"s.{c}" for c in referenced)
+                not_null = " AND ".join(f"{c} IS NOT NULL" for c in columns)
+                cursor.execute(
+                    f"{self._insert(parent)} FROM {parent['source']} s "
+                    f"WHERE ({source_key}) IN (SELECT {', '.join(columns)} FROM {child['target']} WHERE {not_null}) "
+                    f"AND NOT EXISTS (SELECT 1 FROM {parent['target']} d "
+                    f"WHERE ({', '.join(f'd.{c}' for c in referenced)}) = ({source_key}))"
+                )
+                added += max(cursor.rowcount, 0)
+                conn.commit()
+            total += added
+        if total:
+            logger.info(f"Copied {total} referenced rows to keep foreign keys intact")
+        return total
+
+    def _build_constraints(self, conn, cursor, tables: Dict[int, Dict[str, Any]], constraints: List[tuple],
+                           oids: List[int]):
+        for oid, name, kind, definition, parent_oid, _, _ in constraints:
+            table = tables[oid]
+            if kind == "f":
+                parent = tables[parent_oid]
+                definition = definition.replace(f"REFERENCES {parent['source']}(", f"REFERENCES {parent['target']}(")
+            cursor.execute(f"ALTER TABLE {table['target']} ADD CONSTRAINT {name} {definition}")
+            conn.commit()
+
+        cursor.execute(INDEXES_QUERY, (oids,))
+        for oid, definition in cursor.fetchall():
+            table = tables[oid]
+            definition = re.sub(rf" ON (?:ONLY )?{re.escape(table['source'])} ", f" ON {table['target']} ", definition, count=1)
+            cursor.execute(definition)
+            conn.commit()
+
+        for table in tables.values():
+            for column in table["identity"]:
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence(%s, %s), max({_quote(column)})) "
+                    f"FROM {table['target']} HAVING max({_quote(column)}) IS NOT NULL",
+                    (table["target"], column),
+                )
@@ -1,15 +1,36 @@
 from langgraph.graph import StateGraph, END, START
-from langgraph.checkpoint.memory import MemorySaver
 from agentstate.agent_state import AgentState, TestingState
 from langchain_core.messages import SystemMessage, HumanMessage
 from llm.llm import llm
-from utils.sql_utils import extract_sql_queries
+from utils.sql_utils import extract_sql_queries, is_explainable, split_sql_statements
 from sql.sql_agent import SQLAgent
+from sql.budget import DEFAULT_PHASE_TIMEOUT_S, Budget, cancel_token
+from tester.benchmark import (
+    DEFAULT_REPETITIONS, DEFAULT_WARMUP, compare_benchmarks, format_benchmark,
+    format_comparison, run_benchmark,
+)
+from tester.plan_diff import diff_benchmarks, format_plan_diffs
+from tester.replay import (
+    DEFAULT_CLIENTS, compare_replays, format_replay,
+    format_replay_comparison, run_replay, weighted_queries,
+)
+from tester.sandbox import DEFAULT_SAMPLE_FRACTION, OFF, SCHEMA, Sandbox
+from utils.schema_context import DEFAULT_TOKEN_BUDGET, load_schema_context
+from typing import Any, List
+from sql.pool import pool_key
+from sql.undo_log import UndoRecorder, format_rollback, rollback
+from utils.checkpointer import get_checkpointer
+from utils.telemetry import traced_node
 import logging
+import threading
+import uuid
 
 logger = logging.getLogger(__name__)
 
-def create_tester_graph():
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+def create_tester_graph(db_config: dict = None, checkpointer=None):
     logger.info("Creating tester graph...")
     builder = StateGraph(TestingState)
 
@@ -17,54 +38,131 @@ def create_tester_graph():
         logger.debug("Starting testing agent...")
 
         try:
-            before_results = run_test("before_exec", state["schema"], "")
-            state["before_exec"] = before_results["before_exec"]
-            
-            if state["execute_query"]:
-                after_results = run_test("after_exec", state["schema"], state["execute_query"])
-                state["after_exec"] = after_results["after_exec"]
-            
+            queries = state.get("benchmark_queries") or generate_test_queries(schema_prompt(state))
+            state["benchmark_queries"] = queries
+            if not queries:
+                state["before_exec"] = "Error in testing the schema: Could not generate valid SQL queries"
+                return state
+
+            try:
+                sandbox = create_sandbox(state, queries + workload_statements(state.get("replay_workload") or [])
+                                         + [state.get("execute_query") or ""])
+            except Exception as e:
+                logger.error(f"Sandbox creation failed: {str(e)}")
+                state["before_exec"] = f"Error in testing the schema: {str(e)}"
+                state["cancelled"] = cancelled(state)
+                return state
+
+            try:
+                config = state.get("db_config") or db_config
+                # Parameterized pg_stat_statements entries cannot be replayed
+                workload = weighted_queries(state.get("replay_workload") or []) or queries
+                execute_query = state["execute_query"]
+                if sandbox:
+                    state["sandbox"] = sandbox.report
+                    config = sandbox.db_config
+                    queries = [sandbox.rewrite(q) for q in queries]
+                    workload = sandbox.rewrite_workload(workload)
+                    execute_query = sandbox.rewrite(execute_query or "")
+
+                before_results = run_test("before_exec", state, config, queries)
+                state.update(before_results)
+                state.update(run_load_test("before_replay", state, config, workload))
+
+                if execute_query and not cancelled(state):
+                    sql_agent = SQLAgent(db_config=config)
+                    undo = None
+                    if not sandbox:
+                        # Changes to the real database are journaled so windup can undo them
+                        session = state.get("undo_session") or state.get("run_id") or f"test_{uuid.uuid4().hex[:12]}"
+                        state["undo_session"] = session
+                        undo = UndoRecorder(config, session, source="tester")
+                    sql_agent.execute_queries(execute_query, budget=Budget.from_state(state), undo=undo)
+                    after_results = run_test("after_exec", state, config, queries)
+                    state.update(after_results)
+                    state.update(run_load_test("after_replay", state, config, workload))
+            finally:
+                if sandbox:
+                    sandbox.drop()
+
+            state["cancelled"] = cancelled(state)
             return state
             
         except Exception as e:
             logger.error(f"Testing failed: {str(e)}")
+            state["cancelled"] = cancelled(state)
             return state
 
-    def run_test(type: str, schema: str, execute_query: str):
+    def cancelled(state: TestingState) -> bool:
+        return cancel_token(state.get("run_id")).cancelled
+
+    def workload_statements(workload: List[Any]) -> List[str]:
+        statements = []
+        for item in workload:
+            if isinstance(item, str):
+                statements.append(item)
+            else:
+                statements += [item[key] for key in ("query", "example") if item.get(key)]
+        return statements
+
+    def create_sandbox(state: TestingState, statements: List[str]):
+        """Sandbox the test runs in, or None when sandbox_strategy is "off".
+
+        Only the tables statements refer to, and those their foreign keys
+        reference, are copied.
+        """
+        strategy = state.get("sandbox_strategy") or SCHEMA
+        if strategy == OFF:
+            return None
+        sandbox = Sandbox(
+            state.get("db_config") or db_config,
+            strategy=strategy,
+            fraction=state.get("sandbox_fraction") or DEFAULT_SAMPLE_FRACTION,
+            template=state.get("sandbox_template"),
+            statements=statements,
+        )
+        # Copying is bounded by the phase budget only; one large table may take a while
+        budget = Budget(statement_timeout_ms=0, phase_timeout_s=state.get("phase_timeout_s") or DEFAULT_PHASE_TIMEOUT_S,
+                        token=cancel_token(state.get("run_id")))
+        sandbox.create(budget)
+        scale = state.get("sandbox_scale") or 1
+        if scale > 1:
+            try:
+                sandbox.grow(scale)
+            except Exception:
+                sandbox.drop()
+                raise
+        return sandbox
+
+    def schema_prompt(state: TestingState) -> str:
+        try:
+            context = load_schema_context(
+                state.get("db_config") or db_config,
+                state.get("execute_query", ""),
+                state.get("schema_token_budget") or DEFAULT_TOKEN_BUDGET,
+            )
+            logger.info(f"Schema context: {context.tokens} tokens, {context.tokens_saved} tokens saved")
+            return context.text
+        except Exception as e:
+            logger.warning(f"Schema context unavailable, sending full schema: {str(e)}")
+            return state["schema"]
+
+    def generate_test_queries(schema: str) -> List[str]:
         max_retries = 3
         current_try = 0
         
         while current_try < max_retries:
             try:
-                if type == "before_exec":
-                    system_prompt = SystemMessage(
-                        content=f"""
-                        You are an expert in PostgreSQL database optimization and query analysis.  
-                        Given the following database schema, generate valid SQL queries to test its functionality.  
-                        Return **only** valid SQL queries, with no additional explanations.  
-
-                        **Schema:**  
-                        {schema}
-                        """
-                    )
-                    state_to_return = "before_exec"
-                else:
-                    system_prompt = SystemMessage(
-                        content=f"""
-                        You are an expert in PostgreSQL database optimization and query analysis.  
-                        Below is the database schema and a set of optimized queries provided for performance improvement.  
-                        Generate valid SQL queries to test the schema, incorporating these optimizations where applicable.  
-                        Return **only** valid SQL queries, with no additional explanations.  
-
-                        **Schema:**  
-                        {schema}  
-
-                        **Optimized Queries:**  
-                        {execute_query}
-                        """
-                    )
-                    state_to_return = "after_exec"
+                system_prompt = SystemMessage(
+                    content=f"""
+                    You are an expert in PostgreSQL database optimization and query analysis.  
+                    Given the following database schema, generate valid read-only SQL queries that exercise its typical access paths.  
+                    Return **only** valid SQL queries, with no additional explanations.  
 
+                    **Schema:**  
+                    {schema}
+                    """
+                )
                 user_message = HumanMessage(
                     content="Provide specific postgres queries to test the performance of my database."
                 )
@@ -73,11 +171,10 @@ def create_tester_graph():
                 
                 if response.content:
                     sql_queries = extract_sql_queries(response.content)
-                    if sql_queries:
-                        sql_agent = SQLAgent()
-                        results = sql_agent.execute_queries(sql_queries)
-                        logger.info(f"Successfully tested the schema for {type}")
-                        return {state_to_return: results}
+                    queries = [q for q in split_sql_statements(sql_queries) if is_explainable(q)]
+                    if queries:
+                        logger.info(f"Generated {len(queries)} benchmark queries")
+                        return queries
                 
                 logger.warning(f"Attempt {current_try + 1}: Invalid SQL response, retrying...")
                 current_try += 1
@@ -86,13 +183,64 @@ def create_tester_graph():
                 logger.error(f"Attempt {current_try + 1} failed: {str(e)}")
                 current_try += 1
                 
-        return {state_to_return: f"Error in testing the schema for {type}: Could not generate valid SQL queries"}
+        return []
+
+    def run_test(type: str, state: TestingState, config: dict, queries: List[str]):
+        metrics_key = "before_metrics" if type == "before_exec" else "after_metrics"
+        try:
+            results = run_benchmark(
+                config,
+                queries,
+                warmup=state.get("warmup") or DEFAULT_WARMUP,
+                repetitions=state.get("repetitions") or DEFAULT_REPETITIONS,
+                budget=Budget.from_state(state),
+            )
+            logger.info(f"Successfully benchmarked the schema for {type}")
+            return {type: format_benchmark(results), metrics_key: results}
+        except Exception as e:
+            logger.error(f"Benchmark for {type} failed: {str(e)}")
+            return {type: f"Error in testing the schema for {type}: {str(e)}", metrics_key: {}}
+
+    def run_load_test(type: str, state: TestingState, config: dict, queries: List[Any]):
+        # Opt-in: the replay's rolled-back writes still take row locks on the target
+        duration = state.get("replay_duration") or 0
+        if not duration or cancelled(state):
+            return {}
+        try:
+            results = run_replay(
+                config,
+                queries,
+                clients=state.get("replay_clients") or DEFAULT_CLIENTS,
+                duration=duration,
+                token=cancel_token(state.get("run_id")),
+            )
+            logger.info(f"Replay for {type}: {format_replay(results).splitlines()[0]}")
+            return {type: results}
+        except Exception as e:
+            logger.error(f"Replay for {type} failed: {str(e)}")
+            return {type: {}}
 
     def analyze_test(state: TestingState):
+        comparison = compare_benchmarks(state.get("before_metrics"), state.get("after_metrics"))
+        table = format_comparison(comparison)
+        plan_diffs = diff_benchmarks(state.get("before_metrics"), state.get("after_metrics"))
+        state["plan_diffs"] = plan_diffs
+        if plan_diffs:
+            table += f"\n\nPlan changes (node-level, self time excludes children):\n```\n{format_plan_diffs(plan_diffs)}\n```"
+        if state.get("before_replay"):
+            replay = compare_replays(state.get("before_replay"), state.get("after_replay"))
+            table += (f"\n\nConcurrent replay ({state['before_replay']['clients']} clients, "
+                      f"{state['before_replay']['duration_s']}s):\n{format_replay_comparison(replay)}")
+
         system_prompt = SystemMessage(content=f"""
-        You are a postgreSQL database performance expert. Analyze these results:
-        Before Optimization: {state['before_exec']}
-        After Optimization: {state.get('after_exec', 'No optimization performed')}
+        You are a postgreSQL database performance expert. Analyze these benchmark results.
+        Latencies are EXPLAIN ANALYZE planning + execution times in milliseconds over {state.get('repetitions') or DEFAULT_REPETITIONS} runs,
+        buffer counts are per-run medians. Plan changes are computed from the EXPLAIN trees and are exact;
+        explain them rather than re-deriving them. The concurrent replay measures throughput, latency percentiles,
+        error rate and lock waits of the same queries under load; weigh regressions there against single-query gains.
+        {table}
+
+        Optimization Applied: {state.get('execute_query') or 'No optimization performed'}
         
         Compare the performance and provide detailed analysis on improvements or issues.
         """)
@@ -101,14 +249,18 @@ def create_tester_graph():
             content="Analyze the performance results and provide detailed insights."
         )
 
+        if state.get("cancelled"):
+            state["results"] = f"{table}\n\nTest cancelled before completion"
+            return state
+
         try:
             response = llm.invoke([system_prompt, user_prompt])
             logger.info("Successfully generated analysis")
-            state["results"] = response.content
+            state["results"] = f"{table}\n\n{response.content}"
             return state
         except Exception as e:
             logger.error(f"Analysis failed: {str(e)}")
-            state["results"] = "Error in analysis generation"
+            state["results"] = f"{table}\n\nError in analysis generation"
             return state
 
     def human_in_loop(state: TestingState):
@@ -120,48 +272,28 @@ def create_tester_graph():
             logger.info("Cleanup not authorized, skipping...")
             return state
 
-        logger.debug("Starting cleanup process...")
-        max_retries = 3
-        current_try = 0
-        
-        while current_try < max_retries:
-            try:
-                system_prompt = SystemMessage(content=f"""
-                You are a postgreSQL database expert. Generate cleanup queries for:
-                Schema: {state['schema']}
-                Executed Queries: {state['execute_query']}
-                Return only valid SQL cleanup queries.
-                """)
-
-                user_prompt = HumanMessage(
-                    content="Generate cleanup queries for the optimization changes."
-                )
-
-                response = llm.invoke([system_prompt, user_prompt])
-                
-                if response.content:
-                    sql_queries = extract_sql_queries(response.content)
-                    if sql_queries:
-                        sql_agent = SQLAgent()
-                        results = sql_agent.execute_queries(sql_queries)
-                        logger.info("Successfully executed cleanup")
-                        state["wind_up"] = results
-                        return state
-                
-                current_try += 1
-                logger.warning(f"Attempt {current_try}: Invalid cleanup queries")
+        if state.get("sandbox"):
+            state["wind_up"] = f"Changes were tested in sandbox {state['sandbox']['name']}, which has been dropped; nothing to clean up"
+            return state
 
-            except Exception as e:
-                logger.error(f"Cleanup attempt {current_try + 1} failed: {str(e)}")
-                current_try += 1
+        if not state.get("undo_session"):
+            state["wind_up"] = "No changes were applied to the database; nothing to clean up"
+            return state
 
-        state["wind_up"] = "Error in cleanup: Could not generate valid SQL queries"
+        logger.debug("Starting cleanup process...")
+        try:
+            results = rollback(state.get("db_config") or db_config, state["undo_session"])
+            state["wind_up"] = format_rollback(results)
+            logger.info(f"Cleanup replayed the undo journal of {state['undo_session']}")
+        except Exception as e:
+            logger.error(f"Cleanup failed: {str(e)}")
+            state["wind_up"] = f"Error in cleanup: {str(e)}"
         return state
 
-    builder.add_node("testing_agent", testing_agent)
-    builder.add_node("analyze_test", analyze_test)
-    builder.add_node("human_in_loop", human_in_loop)
-    builder.add_node("windup", windup)
+    builder.add_node("testing_agent", traced_node("tester", "testing_agent", testing_agent))
+    builder.add_node("analyze_test", traced_node("tester", "analyze_test", analyze_test))
+    builder.add_node("human_in_loop", traced_node("tester", "human_in_loop", human_in_loop))
+    builder.add_node("windup", traced_node("tester", "windup", windup))
 
     builder.add_edge(START, "testing_agent")
     builder.add_edge("testing_agent", "analyze_test")
@@ -175,5 +307,14 @@ def create_tester_graph():
 
     return builder.compile(
         interrupt_before=['human_in_loop'],
-        checkpointer=MemorySaver()
-    )
\ No newline at end of file
+        checkpointer=checkpointer or get_checkpointer()
+    )
+
+
+def get_tester_graph(db_config: dict = None):
+    """Compiled tester graph for db_config, built once per process."""
+    key = pool_key(db_config or {})
+    with _graphs_lock:
+        if key not in _graphs:
+            _graphs[key] = create_tester_graph(db_config)
+        return _graphs[key]
@@ -0,0 +1,27 @@
+from utils import analysis_memory
+from utils.analysis_memory import add_round, render_summary
+
+
+def test_render_summary_empty():
+    assert render_summary([]) == ""
+
+
+def test_render_summary_lists_feedback_and_only_the_latest_decisions():
+    rounds = add_round([], "", "## Decision summary\n- add index on orders(customer_id)")
+    rounds = add_round(rounds, "Avoid new indexes on orders", "## Decision summary\n- rewrite the report query")
+    assert render_summary(rounds) == (
+        "Feedback given so far:\n"
+        "2. Avoid new indexes on orders\n"
+        "\n"
+        "Current recommendations (round 2):\n"
+        "- rewrite the report query"
+    )
+
+
+def test_render_summary_drops_the_oldest_feedback_first(monkeypatch):
+    monkeypatch.setattr(analysis_memory, "MAX_SUMMARY_CHARS", 90)
+    rounds = [{"feedback": f"feedback number {i}", "decisions": "- keep"} for i in range(1, 6)]
+    summary = render_summary(rounds)
+    assert summary.startswith("Feedback given so far (3 earlier rounds omitted):\n4. feedback number 4\n")
+    assert "3. feedback number 3" not in summary
+    assert summary.endswith("Current recommendations (round 5):\n- keep")
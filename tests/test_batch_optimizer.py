@@ -0,0 +1,83 @@
+import json
+import pytest
+from batch_optimizer import _thread_id, format_summary, load_manifest, summarize, write_job_report
+
+
+def _manifest(tmp_path, manifest):
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps(manifest))
+    return str(path)
+
+
+def test_load_manifest_expands_one_job_per_request(tmp_path, monkeypatch):
+    monkeypatch.setenv("SHOP_PASSWORD", "secret")
+    path = _manifest(tmp_path, {
+        "defaults": {"test": False, "max_concurrency": 2},
+        "databases": [
+            {"name": "shop", "db_config": {"host": "h", "database": "shop", "password_env": "SHOP_PASSWORD"},
+             "requests": ["first", "second"], "max_concurrency": 1, "ignored": True},
+            {"db_config": {"host": "h2", "database": "crm"}, "requests": ["third"]},
+        ],
+    })
+    jobs = load_manifest(path)
+    assert [(j["database"], j["request"]) for j in jobs] == [("shop", "first"), ("shop", "second"), ("h2/crm", "third")]
+    assert jobs[0]["db_config"] == {"host": "h", "database": "shop", "password": "secret"}
+    assert [j["max_concurrency"] for j in jobs] == [1, 1, 2]
+    assert all(j["test"] is False and j["execute"] is False for j in jobs)
+    assert "ignored" not in jobs[0]
+
+
+def test_load_manifest_rejects_a_missing_password_variable(tmp_path, monkeypatch):
+    monkeypatch.delenv("MISSING_PASSWORD", raising=False)
+    path = _manifest(tmp_path, {"databases": [
+        {"db_config": {"database": "shop", "password_env": "MISSING_PASSWORD"}, "requests": ["r"]},
+    ]})
+    with pytest.raises(ValueError, match="MISSING_PASSWORD"):
+        load_manifest(path)
+
+
+def test_thread_id_is_stable_and_ignores_the_password():
+    job = {"db_config": {"host": "h", "database": "shop", "password": "a"}, "request": "r"}
+    same = {"db_config": {"database": "shop", "host": "h", "password": "b"}, "request": "r"}
+    other = {"db_config": {"host": "h", "database": "shop"}, "request": "other"}
+    assert _thread_id(job) == _thread_id(same)
+    assert _thread_id(job) != _thread_id(other)
+    assert _thread_id(job).startswith("batch_")
+
+
+REPORTS = [
+    {"database": "shop", "request": "a", "status": "ok", "error": None, "elapsed_s": 20.0},
+    {"database": "shop", "request": "b", "status": "failed", "error": "boom | bad\ntrace", "elapsed_s": 10.0},
+    {"database": "crm", "request": "c", "status": "ok", "error": None, "elapsed_s": 30.0},
+]
+
+
+def test_summarize_counts_jobs_per_database():
+    summary = summarize(REPORTS, 60.0)
+    assert (summary["jobs"], summary["ok"], summary["failed"], summary["jobs_per_min"]) == (3, 2, 1, 3.0)
+    assert summary["databases"]["shop"] == {"jobs": 2, "ok": 1, "failed": 1, "busy_s": 30.0,
+                                            "errors": ["boom | bad\ntrace"]}
+    assert summarize([], 0)["jobs_per_min"] == 0.0
+
+
+def test_format_summary_escapes_the_first_error_line():
+    text = format_summary(summarize(REPORTS, 60.0))
+    assert "3 jobs (2 ok, 1 failed) in 60.0s, 3.0 jobs/min" in text
+    assert "| crm | 1 | 1 | 0 | 30.0 | 2.0 |  |" in text
+    assert "| shop | 2 | 1 | 1 | 30.0 | 4.0 | boom \\| bad |" in text
+    assert text.index("| crm") < text.index("| shop")
+
+
+def test_write_job_report_writes_json_and_markdown(tmp_path):
+    report = dict(REPORTS[1], database="db/1", request="Why is the orders report slow?",
+                  execution_mode="online",
+                  execution_results=[{"index": 1, "status": "failed", "elapsed_ms": 5,
+                                      "statement": "CREATE INDEX ix ON t (a)", "error": "locked\nmore"}])
+    write_job_report(report, str(tmp_path), 7)
+    base = tmp_path / "db_1"
+    assert json.loads((base / "007_Why_is_the_orders_report_slow.json").read_text())["status"] == "failed"
+    markdown = (base / "007_Why_is_the_orders_report_slow.md").read_text()
+    assert markdown.startswith("# db/1: Why is the orders report slow?\n")
+    assert "Error: `boom | bad\ntrace`" in markdown
+    assert "Executed in online mode" in markdown
+    assert "- Statement 1 failed in 5 ms: `CREATE INDEX ix ON t (a)` (locked)" in markdown
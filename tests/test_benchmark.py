@@ -0,0 +1,38 @@
+from tester.benchmark import compare_benchmarks, percentile, summarize
+
+BUFFERS = {"shared_hit": 10, "shared_read": 2, "local_hit": 0, "local_read": 0}
+
+
+def test_percentile_interpolates_between_ranks():
+    assert percentile([4.0, 1.0, 3.0, 2.0], 50) == 2.5
+    assert percentile([1.0, 2.0, 3.0, 4.0, 5.0], 95) == 4.8
+    assert percentile([7.0], 99) == 7.0
+    assert percentile([], 50) is None
+
+
+def test_summarize():
+    assert summarize([1.0, 2.0, 3.0, 4.0]) == {"min": 1.0, "median": 2.5, "p95": 3.85, "p99": 3.97, "mean": 2.5}
+    assert summarize([])["median"] is None
+
+
+def _result(query, median=None, status="ok", error=None):
+    if error:
+        return {"query": query, "runs": 0, "status": status, "error": error}
+    return {"query": query, "runs": 10, "latency_ms": {"min": median, "median": median, "p95": median,
+                                                        "p99": median, "mean": median}, "buffers": BUFFERS}
+
+
+def test_compare_benchmarks_pairs_queries_by_text():
+    before = {"queries": [_result("SELECT 1", 10.0), _result("SELECT 2", 4.0), _result("SELECT 3", 1.0)]}
+    after = {"queries": [_result("SELECT 2", 5.0), _result("SELECT 1", 2.5),
+                         _result("SELECT 3", status="timeout", error="canceling statement due to statement timeout")]}
+    rows = {r["query"]: r for r in compare_benchmarks(before, after)}
+    assert rows["SELECT 1"]["change_pct"] == -75.0
+    assert rows["SELECT 2"]["change_pct"] == 25.0
+    assert rows["SELECT 3"]["after"] is None and rows["SELECT 3"]["after_status"] == "timeout"
+    assert rows["SELECT 3"]["change_pct"] is None
+
+
+def test_compare_benchmarks_without_an_after_run():
+    rows = compare_benchmarks({"queries": [_result("SELECT 1", 10.0)]}, None)
+    assert rows[0]["after"] is None and rows[0]["after_status"] is None
@@ -0,0 +1,21 @@
+from sql.budget import Budget
+
+
+def test_effective_timeout_is_the_statement_cap_without_a_phase_deadline():
+    assert Budget(statement_timeout_ms=500, phase_timeout_s=0).effective_timeout_ms() == 500
+
+
+def test_effective_timeout_is_the_closer_limit():
+    assert Budget(statement_timeout_ms=500, phase_timeout_s=60).effective_timeout_ms() == 500
+    assert Budget(statement_timeout_ms=0, phase_timeout_s=60).effective_timeout_ms() <= 60000
+    assert Budget(statement_timeout_ms=600000, phase_timeout_s=1).effective_timeout_ms() <= 1000
+
+
+def test_effective_timeout_without_limits_is_zero():
+    assert Budget(statement_timeout_ms=0, phase_timeout_s=0).effective_timeout_ms() == 0
+
+
+def test_effective_timeout_never_reaches_zero_once_the_phase_ran_out():
+    budget = Budget(statement_timeout_ms=500, phase_timeout_s=60)
+    budget.deadline -= 120
+    assert budget.effective_timeout_ms() == 1
@@ -0,0 +1,62 @@
+import sqlite3
+from typing import TypedDict
+from langgraph.graph import END, START, StateGraph
+from utils import checkpointer as checkpointer_module
+from utils.checkpointer import SQLiteCheckpointer, _redacted
+
+
+class State(TypedDict):
+    db_config: dict
+    count: int
+
+
+def _graph(saver):
+    builder = StateGraph(State)
+    builder.add_node("step", lambda state: {"count": state["count"] + 1})
+    builder.add_edge(START, "step")
+    builder.add_edge("step", END)
+    return builder.compile(checkpointer=saver)
+
+
+DB = {"host": "localhost", "database": "shop", "user": "app", "password": "s3cret-pw"}
+
+
+def test_redacted_drops_passwords_of_nested_db_configs():
+    value = {"db_config": DB, "runs": [{"config": DB}], "note": {"password": "kept, not a db_config"}}
+    assert _redacted(value) == {"db_config": {"host": "localhost", "database": "shop", "user": "app"},
+                                "runs": [{"config": {"host": "localhost", "database": "shop", "user": "app"}}],
+                                "note": {"password": "kept, not a db_config"}}
+
+
+def test_state_survives_a_restart_without_storing_the_password(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    saver = SQLiteCheckpointer(path, flush_interval=0.01)
+    config = {"configurable": {"thread_id": "t1"}}
+    _graph(saver).invoke({"db_config": DB, "count": 0}, config)
+    saver.flush()
+
+    with sqlite3.connect(path) as conn:
+        stored = b"".join(bytes(v) for table, column in (("blobs", "value"), ("writes", "value"),
+                                                         ("checkpoints", "checkpoint"))
+                          for (v,) in conn.execute(f"SELECT {column} FROM {table}"))
+    assert b"s3cret-pw" not in stored
+
+    state = _graph(SQLiteCheckpointer(path)).get_state(config)
+    assert state.values["count"] == 1
+    assert state.values["db_config"] == {"host": "localhost", "database": "shop", "user": "app"}
+
+
+def test_only_the_latest_checkpoints_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpointer_module, "KEEP_CHECKPOINTS", 3)
+    path = str(tmp_path / "checkpoints.sqlite")
+    saver = SQLiteCheckpointer(path, flush_interval=0.01)
+    graph, config = _graph(saver), {"configurable": {"thread_id": "t1"}}
+    for _ in range(5):
+        graph.invoke({"db_config": DB, "count": 0}, config)
+    saver.flush()
+    kept = len(saver.storage["t1"][""])
+    assert 3 <= kept < 6
+    with sqlite3.connect(path) as conn:
+        on_disk = conn.execute("SELECT count(*) FROM checkpoints WHERE thread_id = 't1'").fetchone()[0]
+    assert on_disk == kept
+    assert len(list(SQLiteCheckpointer(path).list(config))) == kept
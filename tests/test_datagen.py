@@ -0,0 +1,58 @@
+import csv
+import io
+import random
+from sql.datagen import _CsvStream, _stats_generator
+
+
+def _rows(stream: _CsvStream):
+    return list(csv.reader(io.StringIO(stream.read().decode())))
+
+
+def test_csv_stream_writes_none_as_unquoted_empty_field():
+    stream = _CsvStream([lambda n: [[None, "2"][:n]], lambda n: [["", None][:n]]], 2)
+    assert stream.read() == b',""\n"2",\n'
+
+
+def test_csv_stream_quotes_values_with_separators():
+    stream = _CsvStream([lambda n: [['a"b,c'] * n]], 1)
+    assert _rows(stream) == [['a"b,c']]
+
+
+def test_csv_stream_reads_in_chunks_across_batches():
+    stream = _CsvStream([lambda n: [[str(i) for i in range(n)]]], 5)
+    chunks = []
+    while True:
+        chunk = stream.read(3)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    assert b"".join(chunks) == b'"0"\n"1"\n"2"\n"3"\n"4"\n'
+
+
+def _spec(**overrides):
+    spec = {"category": "integer", "bounds": [], "distinct": 0, "mcv": [], "mcv_freqs": [], "null_frac": 0.0,
+            "scale": None, "max_length": None}
+    spec.update(overrides)
+    return spec
+
+
+def test_stats_generator_draws_integers_within_the_histogram():
+    generate = _stats_generator(_spec(bounds=["10", "20", "30"]), random.Random(1))
+    values = [int(v) for v in generate(500)]
+    assert min(values) >= 10 and max(values) <= 30
+
+
+def test_stats_generator_follows_null_frac_and_most_common_values():
+    generate = _stats_generator(_spec(category="text", mcv=["a", "b"], mcv_freqs=[0.5, 0.3], null_frac=0.2),
+                                random.Random(2))
+    values = generate(5000)
+    assert set(values) == {None, "a", "b"}
+    assert abs(values.count(None) / 5000 - 0.2) < 0.03
+    assert abs(values.count("a") / 5000 - 0.5) < 0.03
+
+
+def test_stats_generator_is_reproducible_with_a_seed():
+    spec = _spec(category="numeric", bounds=["0", "1.5", "3"], scale=2)
+    first = _stats_generator(spec, random.Random(7))(50)
+    assert first == _stats_generator(spec, random.Random(7))(50)
+    assert all(len(v.split(".")[1]) == 2 for v in first)
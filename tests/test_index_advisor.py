@@ -0,0 +1,74 @@
+from sql.index_advisor import (MAX_IDENTIFIER, _covered, _index_name, _missing_from_queries, _surplus_indexes,
+                               extract_predicates, selectivity)
+
+
+def _index(name, columns, scans=10, unique=False, primary=False, constraint=False, signature=None,
+           method="btree", size=8192):
+    return {"name": name, "schema": "public", "method": method, "columns": columns, "expression": False,
+            "unique": unique, "primary": primary, "valid": True, "constraint": constraint, "scans": scans,
+            "bytes": size, "signature": signature or f"public.orders USING {method} ({', '.join(columns)})"}
+
+
+def _stats(indexes, rows=1000000, columns=None):
+    return {
+        "tables": {"public.orders": {"seq_scan": 500, "seq_tup_read": 10 ** 9, "idx_scan": 10, "rows": rows,
+                                     "writes": 1000, "bytes": 10 ** 9}},
+        "indexes": {"public.orders": indexes},
+        "columns": columns or {("public.orders", c): {"n_distinct": 50000, "correlation": 0.1, "null_frac": 0.0}
+                               for c in ("customer_id", "status", "created_at")},
+        "foreign_keys": [], "stats_age_days": 30.0, "quoted": {},
+    }
+
+
+def test_extract_predicates_resolves_aliases_and_keeps_equality_over_range():
+    catalog = {"public.orders": {"customer_id", "created_at", "status"}, "public.customers": {"id", "region"}}
+    query = ("SELECT * FROM orders o JOIN customers c ON c.id = o.customer_id "
+             "WHERE o.created_at >= now() - interval '1 day' AND c.region = 'EU' AND status IN ('new')")
+    assert extract_predicates(query, catalog) == {
+        "public.customers": {"id": "eq", "region": "eq"},
+        "public.orders": {"created_at": "range", "status": "eq"},
+    }
+
+
+def test_selectivity_from_pg_stats():
+    assert selectivity({"n_distinct": 100, "null_frac": 0.0}, 1000) == 0.01
+    # A negative n_distinct is a fraction of the row count
+    assert selectivity({"n_distinct": -0.5, "null_frac": 0.5}, 1000) == 0.001
+    assert selectivity(None, 1000) == 0.1
+
+
+def test_index_name_stays_unique_past_the_identifier_limit():
+    short = _index_name("sales.Order Lines", ["Customer Id"])
+    first = _index_name("public.orders", ["a_rather_long_column_name_number_one", "and_a_second_long_column_name"])
+    second = _index_name("public.orders", ["a_rather_long_column_name_number_one", "and_a_second_long_column_other"])
+    assert short == "idx_order_lines_customer_id"
+    assert len(first) == len(second) == MAX_IDENTIFIER and first != second
+
+
+def test_covered_allows_any_order_only_among_equality_columns():
+    indexes = [_index("i", ["created_at", "customer_id"])]
+    assert _covered(["customer_id", "created_at"], indexes)
+    assert not _covered(["customer_id", "created_at"], indexes, equalities=1)
+    assert _covered(["created_at", "customer_id"], indexes, equalities=1)
+
+
+def test_missing_index_with_a_range_column_is_not_hidden_by_a_reordered_index():
+    query = "SELECT * FROM orders WHERE customer_id = 7 AND created_at > now() - interval '1 day'"
+    proposals = _missing_from_queries(_stats([_index("i", ["created_at", "customer_id"])]), [query])
+    assert [p["columns"] for p in proposals] == [["customer_id", "created_at"]]
+    assert _missing_from_queries(_stats([_index("i", ["customer_id", "created_at"])]), [query]) == []
+
+
+def test_surplus_indexes_flags_duplicates_redundant_and_unused():
+    indexes = [
+        _index("orders_pkey", ["id"], primary=True, unique=True, constraint=True),
+        _index("orders_customer", ["customer_id"], scans=5, signature="dup"),
+        _index("orders_customer_copy", ["customer_id"], scans=1, signature="dup"),
+        _index("orders_status", ["status"], scans=3),
+        _index("orders_status_created", ["status", "created_at"], scans=9),
+        _index("orders_note", ["note"], scans=0),
+        _index("orders_unused_unique", ["ref"], scans=0, unique=True),
+    ]
+    found = {(p["kind"], p["index"]) for p in _surplus_indexes(_stats(indexes))}
+    assert found == {("duplicate", "orders_customer_copy"), ("redundant", "orders_status"),
+                     ("unused", "orders_note")}
@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+import pytest
+from sql import introspection
+from sql.introspection import column_summary, get_catalog, merge_stats
+
+DB = {"host": "localhost", "database": "shop", "user": "app"}
+
+CATALOG = {
+    "public.orders": {"schema": "public", "name": "orders", "kind": "table",
+                      "columns": [{"name": "id", "type": "integer"}, {"name": "total", "type": "numeric"}],
+                      "indexes": [{"name": "orders_pkey", "definition": "...", "unique": True}],
+                      "constraints": []},
+    "sales.leads": {"schema": "sales", "name": "leads", "kind": "view",
+                    "columns": [{"name": "id", "type": "integer"}], "indexes": [], "constraints": []},
+}
+STATS = {"public.orders": {"row_estimate": 1000, "total_bytes": 65536, "seq_scan": 4, "idx_scan": 9,
+                           "n_live_tup": 990, "indexes": {"orders_pkey": {"bytes": 16384, "scans": 9}}}}
+
+
+def test_merge_stats_fills_in_table_and_index_statistics():
+    merged = merge_stats(CATALOG, STATS)
+    assert merged["public.orders"]["row_estimate"] == 1000
+    assert merged["public.orders"]["indexes"][0] == {"name": "orders_pkey", "definition": "...", "unique": True,
+                                                     "bytes": 16384, "scans": 9}
+    assert merged["sales.leads"]["seq_scan"] is None
+    assert "bytes" not in CATALOG["public.orders"]["indexes"][0]
+
+
+def test_column_summary():
+    assert column_summary(CATALOG) == {"orders": ["id (integer)", "total (numeric)"], "sales.leads": ["id (integer)"]}
+    assert column_summary(CATALOG, with_types=False)["sales.leads"] == ["id"]
+
+
+class FakePool:
+    @contextmanager
+    def connection(self):
+        yield None
+
+
+@pytest.fixture
+def server(monkeypatch):
+    state = {"fingerprint": "v1", "now": 100.0, "catalog_reads": 0, "stats_reads": 0}
+
+    def fetch_catalog(conn):
+        state["catalog_reads"] += 1
+        return dict(CATALOG)
+
+    def fetch_stats(conn):
+        state["stats_reads"] += 1
+        return STATS
+
+    monkeypatch.setattr(introspection, "get_pool", lambda db_config: FakePool())
+    monkeypatch.setattr(introspection, "catalog_fingerprint", lambda conn: state["fingerprint"])
+    monkeypatch.setattr(introspection, "fetch_catalog", fetch_catalog)
+    monkeypatch.setattr(introspection, "fetch_stats", fetch_stats)
+    monkeypatch.setattr(introspection.time, "monotonic", lambda: state["now"])
+    introspection.invalidate()
+    yield state
+    introspection.invalidate()
+
+
+def test_get_catalog_refetches_structure_only_when_the_fingerprint_changes(server):
+    first = get_catalog(DB)
+    server["now"] += introspection.REVALIDATE_AFTER + 1
+    assert get_catalog(DB) is first
+    assert (server["catalog_reads"], server["stats_reads"]) == (1, 1)
+    server["fingerprint"] = "v2"
+    server["now"] += introspection.REVALIDATE_AFTER + 1
+    get_catalog(DB)
+    assert (server["catalog_reads"], server["stats_reads"]) == (2, 2)
+
+
+def test_get_catalog_refreshes_statistics_after_their_ttl(server):
+    get_catalog(DB)
+    server["now"] += introspection.STATS_TTL + 1
+    get_catalog(DB)
+    assert (server["catalog_reads"], server["stats_reads"]) == (1, 2)
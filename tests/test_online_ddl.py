@@ -0,0 +1,18 @@
+from sql.online_ddl import to_concurrent
+
+
+def test_to_concurrent_index_build_keeps_keyword_case():
+    assert to_concurrent("CREATE INDEX idx ON t (a);") == "CREATE INDEX CONCURRENTLY idx ON t (a)"
+    assert to_concurrent("create unique index idx on t (a)") == "create unique index concurrently idx on t (a)"
+
+
+def test_to_concurrent_drop_and_reindex():
+    assert to_concurrent("DROP INDEX idx") == "DROP INDEX CONCURRENTLY idx"
+    assert to_concurrent("REINDEX TABLE t") == "REINDEX TABLE CONCURRENTLY t"
+
+
+def test_to_concurrent_not_applicable():
+    assert to_concurrent("CREATE INDEX CONCURRENTLY idx ON t (a)") is None
+    assert to_concurrent("DROP INDEX a, b") is None
+    assert to_concurrent("DROP INDEX idx CASCADE") is None
+    assert to_concurrent("ALTER TABLE t ADD COLUMN c int") is None
@@ -0,0 +1,34 @@
+from tester.plan_diff import diff_plans
+
+
+def _scan(node_type, rows, time, **extra):
+    return {"Node Type": node_type, "Relation Name": "orders", "Alias": "orders", "Actual Rows": rows,
+            "Plan Rows": rows, "Actual Loops": 1, "Actual Total Time": time, **extra}
+
+
+def _plan(scan, execution_ms):
+    return {"Plan": {"Node Type": "Aggregate", "Actual Rows": 1, "Plan Rows": 1, "Actual Loops": 1,
+                     "Actual Total Time": execution_ms, "Plans": [scan]},
+            "Planning Time": 0.5, "Execution Time": execution_ms}
+
+
+def test_diff_plans_pairs_a_seq_scan_with_the_index_scan_replacing_it():
+    before = _plan(_scan("Seq Scan", 100, 80.0), 90.0)
+    after = _plan(_scan("Index Scan", 100, 2.0, **{"Index Name": "orders_customer_idx"}), 3.0)
+    diff = diff_plans(before, after)
+    assert diff["changes"] == [{"from": "Seq Scan on orders", "to": "Index Scan using orders_customer_idx on orders"}]
+    assert diff["removed"] == [] and diff["added"] == []
+    assert diff["execution_ms"] == {"before": 90.0, "after": 3.0, "delta": -87.0, "pct": -96.7}
+    assert diff["nodes"][0]["changed"] and diff["nodes"][0]["self_ms"]["delta"] == -78.0
+
+
+def test_diff_plans_reports_added_nodes_and_misestimates():
+    before = {"Node Type": "Seq Scan", "Relation Name": "orders", "Actual Rows": 10, "Plan Rows": 10,
+              "Actual Loops": 1, "Actual Total Time": 5.0}
+    after = {"Node Type": "Sort", "Actual Rows": 10, "Plan Rows": 1000, "Actual Loops": 1,
+             "Actual Total Time": 6.0, "Plans": [dict(before)]}
+    diff = diff_plans(before, after)
+    assert diff["changes"] == []
+    assert diff["added"] == [{"label": "Sort", "self_ms": 1.0, "misestimate": 100.0}]
+    assert diff["worst_misestimate_after"] == 100.0
+    assert diff["planning_ms"]["delta"] == 0.0
@@ -0,0 +1,94 @@
+import pytest
+from psycopg2 import extensions
+from sql import pool as pool_module
+from sql.pool import ConnectionPool, PoolExhaustedError, pool_key, redact, split_db_config, with_password
+
+
+class FakeInfo:
+    transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection:
+    def __init__(self, **params):
+        self.params = params
+        self.closed = 0
+        self.autocommit = False
+        self.info = FakeInfo()
+        self.rollbacks = 0
+        self.commits = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    opened = []
+
+    def fake_connect(**params):
+        opened.append(FakeConnection(**params))
+        return opened[-1]
+
+    monkeypatch.setattr(pool_module.psycopg2, "connect", fake_connect)
+    return opened
+
+
+def test_split_db_config_separates_session_settings():
+    params, settings = split_db_config({"host": "h", "database": "d", "port": None, "search_path": "app,public",
+                                        "statement_timeout": 5000})
+    assert params == {"host": "h", "database": "d"}
+    assert settings == {"search_path": "app,public", "statement_timeout": 5000}
+
+
+def test_session_settings_become_startup_options(connect):
+    ConnectionPool({"database": "d", "search_path": "app, public", "lock_timeout": 100}).getconn()
+    assert connect[0].params == {"database": "d", "options": "-c search_path=app,\\ public -c lock_timeout=100"}
+
+
+def test_redacted_configs_share_the_pool_key_and_get_their_password_back(monkeypatch):
+    monkeypatch.setattr(pool_module, "_passwords", {})
+    config = {"host": "h", "port": 5432, "user": "u", "database": "d", "password": "secret"}
+    stored = redact(config)
+    assert "password" not in stored
+    assert pool_key(stored) == pool_key(config)
+    assert with_password(stored)["password"] == "secret"
+
+
+def test_connections_are_reused_and_rolled_back(connect):
+    pool = ConnectionPool({"database": "d"})
+    with pool.connection() as conn:
+        conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    with pool.connection() as again:
+        pass
+    assert again is conn and len(connect) == 1
+    assert conn.commits == 2
+    assert pool.stats() == {"idle": 1, "in_use": 0, "max": pool_module.DEFAULT_MAX_CONNECTIONS}
+
+
+def test_a_failed_block_rolls_back(connect):
+    pool = ConnectionPool({"database": "d"})
+    with pytest.raises(RuntimeError):
+        with pool.connection():
+            raise RuntimeError("boom")
+    assert connect[0].rollbacks >= 1 and connect[0].commits == 0
+
+
+def test_checkout_gives_up_when_the_pool_is_exhausted(connect):
+    pool = ConnectionPool({"database": "d"}, max_connections=1, checkout_timeout=0.05)
+    pool.getconn()
+    with pytest.raises(PoolExhaustedError):
+        pool.getconn()
+
+
+def test_idle_connections_expire(connect):
+    pool = ConnectionPool({"database": "d"}, idle_timeout=-1)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is not conn and conn.closed
@@ -0,0 +1,56 @@
+import pytest
+from llm import registry
+from llm.registry import LazyChatModel, get_llm, register_provider, role_model
+
+
+class FakeModel:
+    def __init__(self, model=None, **params):
+        self.model = model
+        self.params = params
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    values = {}
+    monkeypatch.setattr(registry, "_dotenv", lambda: values)
+    monkeypatch.setattr(registry, "_clients", {})
+    monkeypatch.setattr(registry, "_providers", dict(registry._providers))
+    monkeypatch.setattr(registry, "_role_settings", dict(registry._role_settings))
+    for name in ("LLM_PROVIDER", "ANALYZING_MODEL", "FAKE_ANALYZING_MODEL"):
+        monkeypatch.delenv(name, raising=False)
+    register_provider("fake", lambda model, **params: FakeModel(model, **params))
+    return values
+
+
+def test_get_llm_creates_each_client_once(settings):
+    first = get_llm("fake", "m1", temperature=0)
+    assert get_llm("fake", "m1", temperature=0) is first
+    assert get_llm("fake", "m2", temperature=0) is not first
+    assert first.model.params == {"temperature": 0}
+
+
+def test_get_llm_rejects_unknown_providers(settings):
+    with pytest.raises(ValueError):
+        get_llm("nope")
+
+
+def test_get_llm_loads_providers_by_import_path(settings):
+    client = get_llm("types:SimpleNamespace", "m1", temperature=0)
+    assert vars(client.model) == {"model": "m1", "temperature": 0}
+
+
+def test_role_model_is_read_per_provider(settings):
+    settings.update(ANALYZING_MODEL="groq-model", FAKE_ANALYZING_MODEL="fake-model")
+    assert role_model("groq", "analyzing") == "groq-model"
+    assert role_model("fake", "analyzing") == "fake-model"
+    assert role_model("ollama", "analyzing") is None
+
+
+def test_lazy_model_resolves_its_role_under_the_selected_provider(settings, monkeypatch):
+    settings.update(ANALYZING_MODEL="groq-model")
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    lazy = LazyChatModel(role="analyzing")
+    assert lazy._model is None
+    assert lazy.resolve().model.model is None
+    settings["FAKE_ANALYZING_MODEL"] = "fake-model"
+    assert LazyChatModel(role="analyzing").resolve().model.model == "fake-model"
@@ -0,0 +1,54 @@
+from tester.replay import _Client, weighted_queries
+
+
+def test_weighted_queries_weights_workload_entries_by_calls():
+    assert weighted_queries(["SELECT 1;", {"query": "SELECT 2", "weight": 3},
+                             {"query": "SELECT * FROM t WHERE id = $1", "example": "SELECT * FROM t WHERE id = 7",
+                              "calls": 40}]) == [
+        {"query": "SELECT 1", "weight": 1.0},
+        {"query": "SELECT 2", "weight": 3.0},
+        {"query": "SELECT * FROM t WHERE id = 7", "weight": 40.0},
+    ]
+
+
+def test_weighted_queries_drops_parameterized_statements_without_an_example():
+    assert weighted_queries([{"query": "SELECT * FROM t WHERE id = $1", "calls": 100}]) == []
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.fetched = []
+        self.description = [("n",)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query):
+        pass
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        self.fetched.append(len(batch))
+        return batch
+
+    def fetchall(self):
+        raise AssertionError("unbounded fetch")
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.named = FakeCursor(rows)
+
+    def cursor(self, name=None):
+        assert name is not None
+        return self.named
+
+
+def test_client_reads_query_results_in_batches():
+    conn = FakeConnection([(i,) for i in range(2500)])
+    _Client._run(conn, FakeCursor([]), "SELECT n FROM t")
+    assert conn.named.fetched == [1000, 1000, 500, 0]
@@ -0,0 +1,66 @@
+from sql.result_set import fetch_bounded, is_read_only_query
+
+
+class FakeNamedCursor:
+    def __init__(self, conn, rows):
+        self.conn = conn
+        self.rows = rows
+        self.description = None
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query):
+        # A named cursor only exists inside a transaction
+        assert not self.conn.autocommit
+        self.description = [("n",)]
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+class FakeConnection:
+    def __init__(self, rows, autocommit=False):
+        self.rows = rows
+        self.autocommit = autocommit
+        self.names = []
+        self.commits = 0
+
+    def cursor(self, name=None):
+        # A client cursor would pull the whole result before fetchmany
+        assert name is not None, "read-only query ran on a client cursor"
+        self.names.append(name)
+        return FakeNamedCursor(self, self.rows)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def test_is_read_only_query_skips_leading_comments():
+    assert is_read_only_query("-- top customers\nSELECT * FROM customers")
+    assert is_read_only_query("/* report */ (SELECT 1)")
+    assert is_read_only_query("/* a */ -- b\n WITH x AS (SELECT 1) SELECT * FROM x")
+    assert not is_read_only_query("-- cleanup\nDELETE FROM customers")
+    assert not is_read_only_query("/* copy */ SELECT * INTO backup FROM customers")
+
+
+def test_fetch_bounded_streams_commented_queries_server_side():
+    conn = FakeConnection([(i,) for i in range(10)])
+    result = fetch_bounded(conn, "-- sample\nSELECT n FROM t", max_rows=3)
+    assert result.rows == [(0,), (1,), (2,)] and result.truncated
+    assert len(conn.names) == 1
+
+
+def test_fetch_bounded_on_autocommit_connection_uses_a_short_transaction():
+    conn = FakeConnection([(i,) for i in range(10)], autocommit=True)
+    result = fetch_bounded(conn, "SELECT n FROM t", max_rows=20)
+    assert result.rows == [(i,) for i in range(10)] and not result.truncated
+    assert conn.commits == 1 and conn.autocommit
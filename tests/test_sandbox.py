@@ -0,0 +1,24 @@
+from tester.sandbox import Sandbox
+
+
+def _sandbox(schemas):
+    sandbox = Sandbox({"database": "shop"})
+    sandbox.schemas = schemas
+    return sandbox
+
+
+def test_rewrite_points_qualified_names_at_the_sandbox_schema():
+    sandbox = _sandbox({"public": "sandbox_1_public"})
+    assert sandbox.rewrite("SELECT * FROM public.orders o JOIN PUBLIC . items i USING (id)") == \
+        'SELECT * FROM "sandbox_1_public".orders o JOIN "sandbox_1_public" . items i USING (id)'
+
+
+def test_rewrite_leaves_columns_literals_and_unqualified_names_alone():
+    sandbox = _sandbox({"public": "sandbox_1_public"})
+    statement = "SELECT o.public, 'public' FROM orders o WHERE x.public.y = 1"
+    assert sandbox.rewrite(statement) == statement
+
+
+def test_rewrite_matches_quoted_schema_names_exactly():
+    sandbox = _sandbox({"Sales Ops": "sandbox_1_sales"})
+    assert sandbox.rewrite('SELECT * FROM "Sales Ops"."Order"') == 'SELECT * FROM "sandbox_1_sales"."Order"'
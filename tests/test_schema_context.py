@@ -0,0 +1,48 @@
+from utils.schema_context import build_schema_context, encode_table, estimate_tokens, rank_tables
+
+
+def _table(name, columns=("id",), rows=1000, seq_scan=10, references=None):
+    constraints = [{"type": "p", "definition": "PRIMARY KEY (id)"}]
+    if references:
+        constraints.append({"type": "f", "references": f"public.{references}",
+                            "definition": f"FOREIGN KEY ({references[:-1]}_id) REFERENCES {references}(id)"})
+    return {"schema": "public", "name": name, "kind": "table",
+            "columns": [{"name": c, "type": "integer", "not_null": True} for c in columns],
+            "indexes": [], "constraints": constraints, "row_estimate": rows, "total_bytes": rows * 100,
+            "seq_scan": seq_scan, "idx_scan": 0}
+
+
+def _catalog(count=40):
+    catalog = {f"public.table_{i:02d}": _table(f"table_{i:02d}", ("id", "payload", "created_at")) for i in range(count)}
+    catalog["public.orders"] = _table("orders", ("id", "customer_id", "total"), references="customers")
+    catalog["public.customers"] = _table("customers", ("id", "email"))
+    return catalog
+
+
+def test_encode_table_rounds_statistics_so_it_is_stable():
+    table = _table("orders", ("id", "total"), rows=12345)
+    assert encode_table(table) == "orders(id int PK, total int NN) [10k+ rows, 1MB+]"
+    assert encode_table(dict(table, row_estimate=19999, seq_scan=999)) == encode_table(table)
+
+
+def test_rank_tables_puts_named_tables_and_their_neighbours_first():
+    ranked = rank_tables(_catalog(), "Why is the orders report slow?")
+    assert ranked[:2] == ["public.orders", "public.customers"]
+
+
+def test_build_schema_context_stays_within_the_budget_including_the_omitted_line():
+    catalog = _catalog()
+    assert build_schema_context(catalog, "orders", 5).tokens <= 5
+    for budget in (60, 120, 250):
+        context = build_schema_context(catalog, "orders", budget)
+        assert context.tokens <= budget
+        assert context.tables_included[:2] == ["public.orders", "public.customers"]
+        assert context.tables_omitted and "more tables" in context.text.splitlines()[-1]
+        assert len(context.tables_included) + len(context.tables_omitted) == len(catalog)
+
+
+def test_build_schema_context_includes_everything_that_fits():
+    catalog = {"public.orders": _table("orders")}
+    context = build_schema_context(catalog, "orders", 1000)
+    assert context.text == encode_table(catalog["public.orders"])
+    assert context.tables_omitted == [] and context.tokens == estimate_tokens(context.text)
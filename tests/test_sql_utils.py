@@ -0,0 +1,29 @@
+from utils.sql_utils import requires_autocommit, split_sql_statements
+
+
+def test_split_on_top_level_semicolons():
+    assert split_sql_statements("SELECT 1; SELECT 2;\n") == ["SELECT 1", "SELECT 2"]
+
+
+def test_split_ignores_semicolons_in_literals_identifiers_and_comments():
+    script = "SELECT 'a;b', E'c\\';d', \"x;y\" FROM t; -- no; split\nSELECT 2 /* ; */"
+    assert split_sql_statements(script) == ["SELECT 'a;b', E'c\\';d', \"x;y\" FROM t",
+                                            "-- no; split\nSELECT 2 /* ; */"]
+
+
+def test_split_keeps_dollar_quoted_and_atomic_bodies_whole():
+    function = "CREATE FUNCTION f() RETURNS int AS $body$ BEGIN RETURN 1; END $body$ LANGUAGE plpgsql"
+    atomic = "CREATE FUNCTION g() RETURNS int BEGIN ATOMIC SELECT 1; SELECT CASE WHEN true THEN 2 END; END"
+    assert split_sql_statements(f"{function}; {atomic}; SELECT 3") == [function, atomic, "SELECT 3"]
+
+
+def test_split_drops_comment_only_fragments():
+    assert split_sql_statements("-- header\n; SELECT 1; /* trailer */") == ["SELECT 1"]
+
+
+def test_requires_autocommit():
+    assert requires_autocommit("CREATE INDEX CONCURRENTLY i ON t (a)")
+    assert requires_autocommit("-- comment\nvacuum analyze t")
+    assert requires_autocommit("REINDEX INDEX CONCURRENTLY i")
+    assert not requires_autocommit("CREATE INDEX i ON t (a)")
+    assert not requires_autocommit("SELECT 'vacuum'")
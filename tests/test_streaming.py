@@ -0,0 +1,45 @@
+from typing import TypedDict
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langgraph.graph import END, START, StateGraph
+from llm.cache import CachedChatModel, LLMCache
+from utils.sql_utils import extract_streaming_sql
+
+
+def test_extract_streaming_sql_separates_finished_and_open_blocks():
+    content = "Add an index:\n```sql\nCREATE INDEX i ON t (a);\n```\nThen:\n```sql\nSELECT * FROM t WHERE"
+    assert extract_streaming_sql(content) == (["CREATE INDEX i ON t (a);"], "SELECT * FROM t WHERE")
+
+
+def test_extract_streaming_sql_drops_a_partial_closing_fence():
+    assert extract_streaming_sql("```sql\nSELECT 1;\n``") == ([], "SELECT 1;")
+    assert extract_streaming_sql("No SQL yet") == ([], "")
+
+
+class State(TypedDict):
+    analysis: str
+
+
+def _graph(model):
+    def analyze(state: State):
+        return {"analysis": model.invoke("Suggest an index").content}
+
+    builder = StateGraph(State)
+    builder.add_node("analyze", analyze)
+    builder.add_edge(START, "analyze")
+    builder.add_edge("analyze", END)
+    return builder.compile()
+
+
+def _streamed(graph):
+    messages = list(graph.stream({"analysis": ""}, stream_mode="messages"))
+    assert {meta["langgraph_node"] for _, meta in messages} == {"analyze"}
+    return "".join(chunk.content for chunk, _ in messages)
+
+
+def test_cache_hit_still_streams_to_the_graph(tmp_path):
+    model = CachedChatModel(FakeListChatModel(responses=["CREATE INDEX ON t (a)"]),
+                            LLMCache(str(tmp_path / "cache.sqlite")))
+    graph = _graph(model)
+    assert _streamed(graph) == "CREATE INDEX ON t (a)"
+    assert _streamed(graph) == "CREATE INDEX ON t (a)"
+    assert model.cache.stats()["hits"] == 1
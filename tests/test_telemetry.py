@@ -0,0 +1,109 @@
+import json
+import pytest
+from utils import telemetry
+from utils.telemetry import Span, Telemetry, run_breakdown, span, to_otlp, trace_run, traced_node
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    collector = Telemetry(path="")
+    monkeypatch.setattr(telemetry, "_telemetry", collector)
+    return collector
+
+
+def _finished(name, kind, parent=None, ms=10.0, **attributes):
+    s = Span(name, kind, parent, attributes)
+    s.end_ns = s.start_ns + int(ms * 1e6)
+    return s
+
+
+def test_run_breakdown_splits_node_time_into_llm_and_db(collector):
+    def plan(state):
+        with span("llm.chat", "llm", **{"llm.model": "m", "llm.prompt_tokens": 100, "llm.completion_tokens": 20,
+                                        "llm.cache_hit": True}):
+            pass
+        with span("db.connection", "db", **{"db.connect_ms": 1.5}):
+            with span("db.statement", "db", **{"db.rows": 3}):
+                pass
+            with span("db.query", "db", **{"db.rows": -1}):
+                pass
+        return state
+
+    with trace_run("analysis") as run:
+        traced_node("performer", "plan", plan)({})
+        with pytest.raises(ValueError):
+            traced_node("performer", "fail", lambda state: (_ for _ in ()).throw(ValueError("bad")))({})
+
+    breakdown = run_breakdown(run.trace_id)
+    assert breakdown["name"] == "analysis"
+    assert (breakdown["llm_calls"], breakdown["cache_hits"], breakdown["prompt_tokens"],
+            breakdown["completion_tokens"]) == (1, 1, 100, 20)
+    assert (breakdown["statements"], breakdown["rows"], breakdown["connect_ms"], breakdown["errors"]) == (2, 3, 1.5, 1)
+    nodes = {n["node"]: n for n in breakdown["nodes"]}
+    assert set(nodes) == {"plan", "fail"}
+    assert nodes["plan"]["runs"] == 1
+    # Statements inside the connection span are not counted twice
+    connection = next(s for s in collector.spans(run.trace_id) if s.name == "db.connection")
+    assert breakdown["db_ms"] == round(connection.duration_ms, 1)
+    assert run_breakdown("unknown")["total_ms"] == 0
+
+
+def test_lone_spans_are_measured_but_not_kept_as_runs(collector):
+    with span("db.statement", "db") as lone:
+        pass
+    assert collector.spans(lone.trace_id) == []
+    assert 'kind="db",name="db.statement"' in collector.prometheus()
+
+
+def test_recent_runs_are_bounded(collector, monkeypatch):
+    monkeypatch.setattr(telemetry, "MAX_RUNS", 2)
+    runs = [_finished("run", "run") for _ in range(3)]
+    for run in runs:
+        collector.record(run)
+    assert collector.spans(runs[0].trace_id) == []
+    assert [s.trace_id for s in collector.spans(runs[2].trace_id)] == [runs[2].trace_id]
+
+
+def test_prometheus_exposition(collector):
+    run = _finished("run", "run", ms=2000)
+    collector.record(run)
+    collector.record(_finished("llm.chat", "llm", run, ms=30, **{"llm.model": 'gpt "x"', "llm.cache_hit": True,
+                                                                   "llm.prompt_tokens": 7}))
+    failed = _finished("db.statement", "db", run, ms=0.5, **{"db.rows": 4})
+    failed.error = "QueryCanceled: timeout"
+    collector.record(failed)
+    text = collector.prometheus()
+    lines = text.splitlines()
+
+    assert text.endswith("\n")
+    assert 'stonebraker_span_duration_seconds_bucket{kind="run",name="run",le="1.0"} 0' in lines
+    assert 'stonebraker_span_duration_seconds_bucket{kind="run",name="run",le="2.5"} 1' in lines
+    assert 'stonebraker_span_duration_seconds_bucket{kind="run",name="run",le="+Inf"} 1' in lines
+    assert 'stonebraker_span_duration_seconds_sum{kind="run",name="run"} 2.000000' in lines
+    assert 'stonebraker_llm_requests_total{model="gpt \\"x\\""} 1' in lines
+    assert 'stonebraker_llm_cache_hits_total{model="gpt \\"x\\""} 1' in lines
+    assert 'stonebraker_llm_tokens_total{model="gpt \\"x\\"",type="prompt"} 7' in lines
+    assert 'stonebraker_span_errors_total{kind="db",name="db.statement"} 1' in lines
+    assert "stonebraker_db_rows_total 4" in lines
+    # Each metric family is declared once, ahead of its samples
+    assert lines.count("# TYPE stonebraker_llm_requests_total counter") == 1
+    assert lines.index("# TYPE stonebraker_db_rows_total counter") < lines.index("stonebraker_db_rows_total 4")
+
+
+def test_spans_are_exported_as_otlp_json_lines(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    collector = Telemetry(path=str(path))
+    parent = _finished("run", "run")
+    child = _finished("db.statement", "db", parent, **{"db.rows": 2, "ok": True, "db.skipped": None})
+    collector.record(parent)
+    collector.record(child)
+    collector.flush(timeout=5)
+
+    spans = [s for line in path.read_text().splitlines()
+             for s in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+    assert [s["spanId"] for s in spans] == [parent.span_id, child.span_id]
+    assert spans[1] == to_otlp(child)
+    assert spans[1]["parentSpanId"] == parent.span_id and spans[1]["kind"] == 3
+    assert {"key": "db.rows", "value": {"intValue": "2"}} in spans[1]["attributes"]
+    assert {"key": "ok", "value": {"boolValue": True}} in spans[1]["attributes"]
+    assert all(a["key"] != "db.skipped" for a in spans[1]["attributes"])
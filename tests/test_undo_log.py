@@ -0,0 +1,48 @@
+import pytest
+from sql.undo_log import Irreversible, plan_inverse
+
+
+class FakeCursor:
+    """Answers every catalog lookup with the same row."""
+
+    def __init__(self, row=None):
+        self.row = row
+        self.queries = []
+
+    def execute(self, query, params=()):
+        self.queries.append((query, params))
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return [self.row] if self.row else []
+
+
+def test_plan_inverse_of_read_only_statements_is_empty():
+    cursor = FakeCursor()
+    assert plan_inverse(cursor, "SELECT * FROM orders") == ""
+    assert plan_inverse(cursor, "-- plan only\nEXPLAIN SELECT 1") == ""
+    assert plan_inverse(cursor, "WITH x AS (SELECT 1) SELECT * FROM x") == ""
+    assert cursor.queries == []
+
+
+def test_plan_inverse_rejects_data_changes():
+    for statement in ("DELETE FROM orders", "EXPLAIN ANALYZE UPDATE orders SET total = 0",
+                      "WITH d AS (DELETE FROM orders RETURNING *) SELECT 1"):
+        with pytest.raises(Irreversible):
+            plan_inverse(FakeCursor(), statement)
+
+
+def test_plan_inverse_drops_a_new_table():
+    assert plan_inverse(FakeCursor((None,)), "CREATE TABLE audit (id int)") == "DROP TABLE IF EXISTS audit"
+
+
+def test_plan_inverse_recreates_a_dropped_index():
+    definition = "CREATE INDEX orders_idx ON public.orders USING btree (customer_id)"
+    assert plan_inverse(FakeCursor((definition,)), "DROP INDEX orders_idx;") == definition
+
+
+def test_plan_inverse_refuses_cascade():
+    with pytest.raises(Irreversible):
+        plan_inverse(FakeCursor(), "DROP INDEX orders_idx CASCADE")
@@ -0,0 +1,32 @@
+from sql.validator import _keys, normalize_statement, statement_fingerprint
+
+DB = {"host": "localhost", "database": "shop", "user": "app"}
+
+
+def test_normalize_statement_drops_comments_and_folds_unquoted_words():
+    assert normalize_statement("SELECT  a,\n b -- why\nFROM /* x */ T WHERE c = 'MiXed';") == \
+        "select a,b from t where c='MiXed'"
+
+
+def test_normalize_statement_keeps_quoted_identifiers_and_dollar_bodies():
+    assert normalize_statement('SELECT "Col" FROM "T"') == 'select "Col" from "T"'
+    assert normalize_statement("SELECT $q$ A  B $q$") == "select $q$ A  B $q$"
+
+
+def test_fingerprint_ignores_formatting():
+    assert statement_fingerprint("select 1") == statement_fingerprint("SELECT   1;")
+
+
+def test_keys_depend_on_earlier_state_changing_statements_only():
+    base = _keys(DB, "v1", ["SELECT 1", "SELECT 2"])
+    after_query = _keys(DB, "v1", ["SELECT 3", "SELECT 2"])
+    after_ddl = _keys(DB, "v1", ["CREATE TABLE t (a int)", "SELECT 2"])
+    assert after_query[1] == base[1]
+    assert after_ddl[1] != base[1]
+
+
+def test_keys_depend_on_database_and_schema_version():
+    key = _keys(DB, "v1", ["SELECT 1"])
+    assert _keys(DB, "v2", ["SELECT 1"]) != key
+    assert _keys(dict(DB, database="other"), "v1", ["SELECT 1"]) != key
+    assert _keys(DB, "v1", ["select 1;"]) == key
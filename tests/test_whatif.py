@@ -0,0 +1,33 @@
+import psycopg2
+from sql.whatif import _explain_targets, is_index_ddl
+
+
+class FakeCursor:
+    """EXPLAINs every query but those mentioning a missing table."""
+
+    def __init__(self):
+        self.statements = []
+        self.result = None
+
+    def execute(self, statement, params=None):
+        self.statements.append(statement)
+        if statement.startswith("EXPLAIN"):
+            if "missing" in statement:
+                raise psycopg2.ProgrammingError('relation "missing" does not exist')
+            self.result = [[{"Plan": {"Node Type": "Seq Scan", "Total Cost": 12.5}}]]
+
+    def fetchone(self):
+        return self.result
+
+
+def test_explain_targets_skips_queries_that_cannot_be_planned():
+    cursor = FakeCursor()
+    plans = _explain_targets(cursor, ["SELECT * FROM orders", "SELECT * FROM missing", "SELECT 1"])
+    assert [p and p["cost"] for p in plans] == [12.5, None, 12.5]
+    assert "ROLLBACK TO SAVEPOINT stonebraker_whatif" in cursor.statements
+
+
+def test_is_index_ddl():
+    assert is_index_ddl("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS i ON t (a)")
+    assert is_index_ddl("create index on t (a)")
+    assert not is_index_ddl("CREATE TABLE index_log (a int)")
@@ -0,0 +1,21 @@
+from sql.workload import fingerprint, normalize_query
+
+
+def test_normalize_query_replaces_literals_and_parameters():
+    assert normalize_query("SELECT * FROM t WHERE a = 42 AND b = 'x''y' AND c = $1") == \
+        "select * from t where a = ? and b = ? and c = ?"
+
+
+def test_normalize_query_folds_in_lists_comments_and_whitespace():
+    assert normalize_query("select id /* hint */ from t -- note\n where id in (1, 2,  3);") == \
+        "select id from t where id in (?, ...)"
+
+
+def test_normalize_query_keeps_digits_inside_identifiers():
+    assert normalize_query("SELECT col1 FROM t2 WHERE x = 1.5e3") == "select col1 from t2 where x = ?"
+
+
+def test_fingerprint_is_shared_by_statements_of_the_same_shape():
+    assert fingerprint("SELECT * FROM t WHERE id = 1") == fingerprint("select *  from t where id = 99;")
+    assert fingerprint("SELECT * FROM t WHERE id = 1") != fingerprint("SELECT * FROM u WHERE id = 1")
+    assert len(fingerprint("SELECT 1")) == 16
@@ -0,0 +1,66 @@
+import re
+from typing import Dict, Any, List
+from utils.sql_utils import extract_sql_queries, split_sql_statements
+
+DECISION_HEADING = "## Decision summary"
+# Feedback is kept verbatim up to this length; the summary as a whole stays under MAX_SUMMARY_CHARS
+MAX_FEEDBACK_CHARS = 400
+MAX_DECISION_CHARS = 1500
+MAX_SUMMARY_CHARS = 3000
+
+DECISION_SECTION = re.compile(rf"^{re.escape(DECISION_HEADING)}\s*$(?P<body>.*?)(?=^#{{1,2}} |\Z)",
+                              re.IGNORECASE | re.MULTILINE | re.DOTALL)
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def decision_summary(analysis: str) -> str:
+    """The analysis' decision summary section, or its SQL statements when the model left it out."""
+    match = DECISION_SECTION.search(analysis or "")
+    if match and match.group("body").strip():
+        body = match.group("body").strip()
+        return body if len(body) <= MAX_DECISION_CHARS else body[:MAX_DECISION_CHARS - 3].rstrip() + "..."
+    statements = split_sql_statements(extract_sql_queries(analysis or ""))
+    if statements:
+        return "\n".join(f"- {_clip(s, 200)}" for s in statements)[:MAX_DECISION_CHARS]
+    return _clip(analysis or "", MAX_DECISION_CHARS)
+
+
+def add_round(rounds: List[Dict[str, Any]], feedback: str, analysis: str) -> List[Dict[str, Any]]:
+    """rounds with one more analysis round appended."""
+    return list(rounds or []) + [{"feedback": _clip(feedback or "", MAX_FEEDBACK_CHARS),
+                                  "decisions": decision_summary(analysis)}]
+
+
+def render_summary(rounds: List[Dict[str, Any]]) -> str:
+    """Compact running summary: every piece of feedback so far and the latest decisions.
+
+    Earlier decisions are superseded by the latest round and left out; the
+    oldest feedback is dropped first when the summary outgrows MAX_SUMMARY_CHARS.
+    """
+    if not rounds:
+        return ""
+    latest = f"Current recommendations (round {len(rounds)}):\n{rounds[-1]['decisions']}"
+    feedback = [f"{i}. {r['feedback']}" for i, r in enumerate(rounds, 1) if r["feedback"]]
+    omitted = 0
+    while feedback and len(latest) + sum(len(f) + 1 for f in feedback) > MAX_SUMMARY_CHARS:
+        feedback.pop(0)
+        omitted += 1
+    lines = []
+    if feedback or omitted:
+        lines.append("Feedback given so far" + (f" ({omitted} earlier rounds omitted)" if omitted else "") + ":")
+        lines += feedback
+        lines.append("")
+    lines.append(latest)
+    return "\n".join(lines)
+
+
+def feedback_delta(rounds: List[Dict[str, Any]], feedback: str) -> str:
+    """feedback unless the latest round already answered it."""
+    feedback = (feedback or "").strip()
+    if rounds and _clip(feedback, MAX_FEEDBACK_CHARS) == rounds[-1]["feedback"]:
+        return ""
+    return feedback
@@ -0,0 +1,289 @@
+# checkpointer.py
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+from langgraph.checkpoint.base import WRITES_IDX_MAP
+from langgraph.checkpoint.memory import InMemorySaver
+from sql.pool import redact
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_PATH = ".graph_checkpoints.sqlite"
+DEFAULT_FLUSH_INTERVAL = 0.5
+MAX_BATCH = 500
+# Checkpoints kept per thread and namespace; older ones are only needed for time travel
+KEEP_CHECKPOINTS = 20
+# Threads held in memory at once; the least recently used are reloaded from disk on demand
+MAX_LOADED_THREADS = 64
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS checkpoints (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL,
+        checkpoint_id TEXT NOT NULL,
+        parent_id TEXT,
+        type TEXT NOT NULL,
+        checkpoint BLOB NOT NULL,
+        metadata_type TEXT NOT NULL,
+        metadata BLOB NOT NULL,
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+    );
+    CREATE TABLE IF NOT EXISTS blobs (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL,
+        channel TEXT NOT NULL,
+        version TEXT NOT NULL,
+        type TEXT NOT NULL,
+        value BLOB NOT NULL,
+        PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+    );
+    CREATE TABLE IF NOT EXISTS writes (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL,
+        checkpoint_id TEXT NOT NULL,
+        task_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        channel TEXT NOT NULL,
+        type TEXT NOT NULL,
+        value BLOB NOT NULL,
+        task_path TEXT NOT NULL,
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+    );
+"""
+
+
+def _redacted(value):
+    """value with the password removed from every db_config-like dict in it."""
+    if isinstance(value, dict):
+        if "password" in value and "database" in value:
+            return redact(value)
+        return {k: _redacted(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redacted(v) for v in value]
+    return value
+
+
+class SQLiteCheckpointer(InMemorySaver):
+    """Checkpointer that serves graph state from memory and persists it to SQLite.
+
+    Nodes never wait on disk: put()/put_writes() update the in-memory saver and
+    queue the rows, which a background thread writes in batched transactions.
+    A thread's checkpoints are loaded from disk the first time it is accessed,
+    so interrupted sessions can be resumed after a restart. Only the latest
+    KEEP_CHECKPOINTS per thread are kept, and database passwords are never
+    stored: get_pool supplies them again when a resumed node connects.
+    """
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_PATH, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        super().__init__()
+        self.path = path
+        self.flush_interval = flush_interval
+        self._loaded: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._writer = threading.Thread(target=self._write_loop, name="checkpoint-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _load_thread(self, thread_id: str):
+        with self._lock:
+            if thread_id in self._loaded:
+                self._loaded.move_to_end(thread_id)
+                return
+            # Rows still queued for this thread are newer than what is on disk
+            self.flush()
+            rows = self._conn.execute(
+                "SELECT checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata "
+                "FROM checkpoints WHERE thread_id = ?", (thread_id,)
+            ).fetchall()
+            for ns, checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata in rows:
+                self.storage[thread_id][ns].setdefault(
+                    checkpoint_id, ((type_, checkpoint), (metadata_type, metadata), parent_id)
+                )
+            for ns, channel, version, type_, value in self._conn.execute(
+                "SELECT checkpoint_ns, channel, version, type, value FROM blobs WHERE thread_id = ?", (thread_id,)
+            ):
+                self.blobs.setdefault((thread_id, ns, channel, version), (type_, value))
+            for ns, checkpoint_id, task_id, idx, channel, type_, value, task_path in self._conn.execute(
+                "SELECT checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path "
+                "FROM writes WHERE thread_id = ?", (thread_id,)
+            ):
+                self.writes.setdefault((thread_id, ns, checkpoint_id), {}).setdefault(
+                    (task_id, idx), (task_id, channel, (type_, value), task_path)
+                )
+            self._loaded[thread_id] = None
+            if rows:
+                logger.info(f"Loaded {len(rows)} checkpoints for thread {thread_id}")
+            for ns in list(self.storage.get(thread_id, {})):
+                self._prune(thread_id, ns)
+            while len(self._loaded) > MAX_LOADED_THREADS:
+                self._unload(next(iter(self._loaded)))
+
+    def _unload(self, thread_id: str):
+        """Drop a thread from memory; everything it holds is on disk or queued for it."""
+        self._loaded.pop(thread_id, None)
+        self.storage.pop(thread_id, None)
+        for key in [k for k in self.blobs if k[0] == thread_id]:
+            del self.blobs[key]
+        for key in [k for k in self.writes if k[0] == thread_id]:
+            del self.writes[key]
+
+    def _prune(self, thread_id: str, ns: str, keep: int = KEEP_CHECKPOINTS):
+        """Forget all but the newest keep checkpoints of a thread, with their writes and unreferenced blobs."""
+        checkpoints = self.storage[thread_id][ns]
+        if len(checkpoints) <= keep:
+            return
+        # Checkpoint ids are time-ordered uuid6 values
+        ordered = sorted(checkpoints)
+        for checkpoint_id in ordered[:-keep]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, ns, checkpoint_id), None)
+            for table in ("checkpoints", "writes"):
+                self._queue.put((
+                    f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, ns, checkpoint_id),
+                ))
+        referenced = set()
+        for checkpoint, _, _ in checkpoints.values():
+            referenced.update(self.serde.loads_typed(checkpoint)["channel_versions"].items())
+        for key in [k for k in self.blobs if k[:2] == (thread_id, ns) and (k[2], k[3]) not in referenced]:
+            del self.blobs[key]
+            self._queue.put((
+                "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, ns, key[2], str(key[3])),
+            ))
+
+    def _thread_ids(self):
+        with self._lock:
+            self.flush()
+            on_disk = [t for (t,) in self._conn.execute("SELECT DISTINCT thread_id FROM checkpoints")]
+            return list(dict.fromkeys(on_disk + list(self.storage)))
+
+    def get_tuple(self, config):
+        self._load_thread(config["configurable"]["thread_id"])
+        return super().get_tuple(config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        if config:
+            self._load_thread(config["configurable"]["thread_id"])
+            yield from super().list(config, filter=filter, before=before, limit=limit)
+            return
+        # One thread at a time, so listing everything does not load every thread at once
+        for thread_id in self._thread_ids():
+            if limit is not None and limit <= 0:
+                return
+            for item in self.list({"configurable": {"thread_id": thread_id}}, filter=filter, before=before, limit=limit):
+                if limit is not None:
+                    limit -= 1
+                yield item
+
+    def get_delta_channel_history(self, *args, **kwargs):
+        config = kwargs.get("config", args[0] if args else None)
+        if config:
+            self._load_thread(config["configurable"]["thread_id"])
+        return super().get_delta_channel_history(*args, **kwargs)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        self._load_thread(thread_id)
+        checkpoint = dict(checkpoint, channel_values=_redacted(checkpoint["channel_values"]))
+        result = super().put(config, checkpoint, metadata, new_versions)
+        ns = result["configurable"]["checkpoint_ns"]
+        checkpoint_id = result["configurable"]["checkpoint_id"]
+        (type_, data), (metadata_type, metadata_data), parent_id = self.storage[thread_id][ns][checkpoint_id]
+        for channel, version in new_versions.items():
+            blob_type, value = self.blobs[(thread_id, ns, channel, version)]
+            self._queue.put((
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                (thread_id, ns, channel, str(version), blob_type, value),
+            ))
+        self._queue.put((
+            "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (thread_id, ns, checkpoint_id, parent_id, type_, data, metadata_type, metadata_data),
+        ))
+        if len(self.storage[thread_id][ns]) >= 2 * KEEP_CHECKPOINTS:
+            self._prune(thread_id, ns, KEEP_CHECKPOINTS)
+        return result
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        self._load_thread(thread_id)
+        writes = [(channel, _redacted(value)) for channel, value in writes]
+        super().put_writes(config, writes, task_id, task_path)
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        stored = self.writes.get((thread_id, ns, checkpoint_id), {})
+        for idx, (channel, _) in enumerate(writes):
+            key = (task_id, WRITES_IDX_MAP.get(channel, idx))
+            if key not in stored:
+                continue
+            _, channel, (type_, value), path = stored[key]
+            self._queue.put((
+                "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, ns, checkpoint_id, task_id, key[1], channel, type_, value, path),
+            ))
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            self._loaded[thread_id] = None
+        super().delete_thread(thread_id)
+        for table in ("checkpoints", "blobs", "writes"):
+            self._queue.put((f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,)))
+
+    def has_thread(self, thread_id: str) -> bool:
+        self._load_thread(thread_id)
+        return bool(self.storage.get(thread_id))
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until every queued write has been committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _write_loop(self):
+        while True:
+            batch, waiters = [], []
+            item = self._queue.get()
+            # Collect whatever else arrives within the flush interval into one transaction
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if waiters or len(batch) >= MAX_BATCH:
+                    break
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    with self._conn:
+                        for statement, params in batch:
+                            self._conn.execute(statement, params)
+                    logger.debug(f"Persisted {len(batch)} checkpoint rows")
+                except sqlite3.Error as e:
+                    logger.error(f"Checkpoint write failed: {str(e)}")
+            for waiter in waiters:
+                waiter.set()
+
+
+_checkpointer: Optional[SQLiteCheckpointer] = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer() -> SQLiteCheckpointer:
+    """Process-wide checkpointer; the file location can be set with CHECKPOINT_DB."""
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            _checkpointer = SQLiteCheckpointer(os.environ.get("CHECKPOINT_DB", DEFAULT_CHECKPOINT_PATH))
+        return _checkpointer
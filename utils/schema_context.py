@@ -0,0 +1,246 @@
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Set
+from sql.introspection import column_summary, get_catalog
+
+DEFAULT_TOKEN_BUDGET = 4000
+# Budget for the tables a feedback round refers to; the rest was summarized already
+DEFAULT_SLICE_TOKEN_BUDGET = 800
+# Rough tokens-per-character ratio for English/SQL text with BPE tokenizers
+CHARS_PER_TOKEN = 4
+
+TYPE_ABBREVIATIONS = {
+    "integer": "int",
+    "bigint": "int8",
+    "smallint": "int2",
+    "boolean": "bool",
+    "character varying": "varchar",
+    "character": "char",
+    "timestamp with time zone": "timestamptz",
+    "timestamp without time zone": "timestamp",
+    "time without time zone": "time",
+    "double precision": "float8",
+    "real": "float4",
+}
+
+INDEX_COLUMNS = re.compile(r"USING (\w+) (\(.*\))(.*)$")
+FOREIGN_KEY = re.compile(r"FOREIGN KEY \((.*?)\) REFERENCES ([^(]+)\((.*?)\)")
+
+
+@dataclass
+class SchemaContext:
+    text: str
+    tokens: int
+    full_tokens: int
+    tables_included: List[str] = field(default_factory=list)
+    tables_omitted: List[str] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.full_tokens - self.tokens, 0)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _terms(text: str) -> Set[str]:
+    terms = set()
+    for word in re.findall(r"[a-z0-9_]+", (text or "").lower()):
+        for part in [word] + word.split("_"):
+            if len(part) > 2:
+                terms.add(part)
+                # Naive singularization so "orders" matches "order_id"
+                if part.endswith("s"):
+                    terms.add(part[:-1])
+    return terms
+
+
+def _short_type(dtype: str) -> str:
+    for long, short in TYPE_ABBREVIATIONS.items():
+        if dtype.startswith(long):
+            return short + dtype[len(long):]
+    return dtype
+
+
+def _human_size(size: int) -> str:
+    for unit in ("B", "kB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def _magnitude(value: int) -> int:
+    """Order of magnitude of a counter, stable across ordinary statistics refreshes."""
+    return math.floor(math.log10(value)) if value and value > 0 else -1
+
+
+def _approx_rows(rows: int) -> str:
+    if rows <= 0:
+        return "empty"
+    rounded = 10 ** _magnitude(rows)
+    for unit, scale in (("B", 10 ** 9), ("M", 10 ** 6), ("k", 10 ** 3)):
+        if rounded >= scale:
+            return f"{rounded // scale}{unit}+ rows"
+    return f"{rounded}+ rows"
+
+
+def _approx_size(size: int) -> str:
+    return f"{_human_size(2 ** math.floor(math.log2(size)))}+"
+
+
+def _neighbors(catalog: Dict[str, Dict[str, Any]]) -> Dict[str, Set[str]]:
+    neighbors = {key: set() for key in catalog}
+    for key, table in catalog.items():
+        for con in table["constraints"]:
+            ref = con.get("references")
+            if ref and ref in catalog and ref != key:
+                neighbors[key].add(ref)
+                neighbors[ref].add(key)
+    return neighbors
+
+
+def rank_tables(catalog: Dict[str, Dict[str, Any]], query: str) -> List[str]:
+    """Order tables by relevance to the request: name and column matches first,
+    then their foreign-key neighbours, with the magnitude of table activity as
+    the tiebreaker so routine statistics refreshes keep the order."""
+    terms = _terms(query)
+    scores = {}
+    for key, table in catalog.items():
+        name_terms = _terms(table["name"])
+        score = 0.0
+        if table["name"].lower() in terms or key.lower() in (query or "").lower():
+            score += 20
+        score += 10 * len(name_terms & terms)
+        column_hits = sum(1 for col in table["columns"] if _terms(col["name"]) & terms)
+        score += 3 * min(column_hits, 5)
+        scores[key] = score
+
+    neighbors = _neighbors(catalog)
+    boosted = dict(scores)
+    for key, score in scores.items():
+        for other in neighbors[key]:
+            boosted[other] += score * 0.5
+
+    for key, table in catalog.items():
+        scans = (table.get("seq_scan") or 0) + (table.get("idx_scan") or 0)
+        boosted[key] += (1 + _magnitude(scans)) * 0.5 + (1 + _magnitude(table.get("row_estimate") or 0)) * 0.25
+
+    return sorted(catalog, key=lambda k: (-round(boosted[k], 6), k))
+
+
+def encode_table(table: Dict[str, Any]) -> str:
+    """Compact one-line encoding of a table's columns, keys, indexes and size.
+
+    Sizes are rounded to their order of magnitude and scan counters left out,
+    so the encoding only changes when the schema or the data size really does.
+    """
+    key = table["name"] if table["schema"] == "public" else f"{table['schema']}.{table['name']}"
+    pk_columns, fks = set(), []
+    for con in table["constraints"]:
+        if con["type"] == "p":
+            pk_columns.update(c.strip().strip('"') for c in re.findall(r"\((.*?)\)", con["definition"])[0].split(","))
+        elif con["type"] == "f":
+            match = FOREIGN_KEY.search(con["definition"])
+            if match:
+                fks.append(f"{match.group(1)}->{match.group(2).strip()}({match.group(3)})")
+
+    columns = []
+    for col in table["columns"]:
+        flags = " PK" if col["name"] in pk_columns else (" NN" if col["not_null"] else "")
+        columns.append(f"{col['name']} {_short_type(col['type'])}{flags}")
+
+    parts = [f"{key}({', '.join(columns)})"]
+    stats = []
+    if table.get("row_estimate") is not None:
+        stats.append(_approx_rows(table["row_estimate"]))
+    if table.get("total_bytes"):
+        stats.append(_approx_size(table["total_bytes"]))
+    if stats:
+        parts.append(f"[{', '.join(stats)}]")
+
+    indexes = []
+    for idx in table["indexes"]:
+        if idx.get("primary"):
+            continue
+        match = INDEX_COLUMNS.search(idx["definition"])
+        cols = match.group(2) if match else ""
+        method = "" if not match or match.group(1) == "btree" else f" {match.group(1)}"
+        extra = match.group(3).strip() if match else ""
+        unique = "UNIQUE " if idx.get("unique") else ""
+        invalid = " INVALID" if not idx.get("valid", True) else ""
+        indexes.append(f"{unique}{idx['name']}{method}{cols}{(' ' + extra) if extra else ''}{invalid}")
+    if indexes:
+        parts.append(f"idx: {'; '.join(indexes)}")
+    if fks:
+        parts.append(f"fk: {'; '.join(fks)}")
+    return " ".join(parts)
+
+
+def build_schema_context(catalog: Dict[str, Dict[str, Any]], query: str = "",
+                         token_budget: int = DEFAULT_TOKEN_BUDGET) -> SchemaContext:
+    """Encode the most relevant tables for query into at most token_budget tokens."""
+    full_tokens = estimate_tokens(str(column_summary(catalog)))
+    ranked = rank_tables(catalog, query)
+    encoded = {key: encode_table(catalog[key]) for key in ranked}
+    costs = {key: estimate_tokens(line) + 1 for key, line in encoded.items()}
+    # Leave room for the line naming the omitted tables unless everything fits
+    reserve = 0
+    if sum(costs.values()) > token_budget:
+        reserve = estimate_tokens(f"-- {len(catalog)} more tables omitted") + 1
+
+    lines, included, omitted = [], [], []
+    used = 0
+    for key in ranked:
+        if used + costs[key] <= token_budget - reserve:
+            lines.append(encoded[key])
+            included.append(key)
+            used += costs[key]
+        else:
+            omitted.append(key)
+
+    if omitted:
+        names = [catalog[k]["name"] if catalog[k]["schema"] == "public" else k for k in omitted]
+        line, shown = f"-- {len(omitted)} more tables omitted", ""
+        for i, name in enumerate(names, 1):
+            shown = f"{shown}, {name}" if shown else name
+            listing = f"-- {len(omitted)} more tables: {shown}" + (" ..." if i < len(names) else "")
+            if used + estimate_tokens(listing) + 1 > token_budget:
+                break
+            line = listing
+        if used + estimate_tokens(line) + 1 <= token_budget:
+            lines.append(line)
+
+    text = "\n".join(lines)
+    return SchemaContext(text=text, tokens=estimate_tokens(text), full_tokens=full_tokens,
+                         tables_included=included, tables_omitted=omitted)
+
+
+def load_schema_context(db_config: Dict[str, Any], query: str = "",
+                        token_budget: int = DEFAULT_TOKEN_BUDGET) -> SchemaContext:
+    """Build a schema context from the cached catalog of db_config."""
+    return build_schema_context(get_catalog(db_config), query, token_budget)
+
+
+def mentioned_tables(catalog: Dict[str, Dict[str, Any]], text: str) -> List[str]:
+    """Tables named in text, in the order rank_tables puts them."""
+    terms = _terms(text)
+    lowered = (text or "").lower()
+
+    def named(name: str) -> bool:
+        # Every word of the table name, singular or plural: "order items" names order_items
+        parts = [p for p in name.lower().split("_") if len(p) > 2]
+        return bool(parts) and all(p in terms or p.rstrip("s") in terms for p in parts)
+
+    return [key for key in rank_tables(catalog, text)
+            if key.lower() in lowered or named(catalog[key]["name"])]
+
+
+def load_schema_slice(db_config: Dict[str, Any], text: str,
+                      token_budget: int = DEFAULT_SLICE_TOKEN_BUDGET) -> SchemaContext:
+    """Encode only the tables text refers to, e.g. the ones a piece of feedback is about."""
+    catalog = get_catalog(db_config)
+    mentioned = mentioned_tables(catalog, text)
+    return build_schema_context({key: catalog[key] for key in mentioned}, text, token_budget)
@@ -1,6 +1,8 @@
 import re
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from typing import List, Tuple
+from sql.pool import get_pool
+from sql.result_set import DEFAULT_MAX_ROWS, fetch_bounded
+from sql.introspection import get_catalog, column_summary
 
 
 # Saving the SQL Queries to further execute them
@@ -27,52 +29,178 @@ def extract_sql_queries(content: str) -> str:
     
     return "\n\n".join(extracted_queries)
 
+def extract_streaming_sql(content: str) -> Tuple[List[str], str]:
+    """Split partially streamed markdown into finished SQL blocks and the block still being written."""
+    sql_block_pattern = r"```sql\s*(.*?)\s*```"
+    complete, last_end = [], 0
+    for query in re.finditer(sql_block_pattern, content, re.MULTILINE | re.DOTALL):
+        complete.append(query.group(1).strip())
+        last_end = query.end()
+
+    open_block = ""
+    start = content.find("```sql", last_end)
+    if start != -1:
+        # Drop a closing fence that has only partially arrived
+        open_block = content[start + len("```sql"):].strip().rstrip("`").rstrip()
+    return complete, open_block
+
+DOLLAR_QUOTE = re.compile(r"\$([A-Za-z_\200-\377][A-Za-z0-9_\200-\377]*)?\$")
+
+def split_sql_statements(script: str) -> List[str]:
+    """
+    Split a SQL script into statements on top-level semicolons.
+
+    Semicolons inside string literals (including E'' escapes), quoted
+    identifiers, dollar-quoted bodies, comments, parentheses and
+    BEGIN ATOMIC ... END function bodies do not end a statement.
+    Comment-only fragments are dropped.
+    """
+    statements = []
+    start = 0
+    i = 0
+    n = len(script)
+    depth = 0
+    atomic = 0
+    has_code = False
+    word_start = None
+
+    def flush_word(end):
+        nonlocal atomic
+        word = script[word_start:end].upper()
+        if word == "ATOMIC" and script[:word_start].rstrip().upper().endswith("BEGIN"):
+            atomic += 1
+        elif atomic and word == "CASE":
+            atomic += 1
+        elif atomic and word == "END":
+            atomic -= 1
+
+    while i < n:
+        c = script[i]
+        if word_start is not None and not (c.isalnum() or c in "_$"):
+            flush_word(i)
+            word_start = None
+
+        if c == "-" and script.startswith("--", i):
+            end = script.find("\n", i)
+            i = n if end == -1 else end + 1
+            continue
+        if c == "/" and script.startswith("/*", i):
+            nesting = 1
+            i += 2
+            while i < n and nesting:
+                if script.startswith("/*", i):
+                    nesting += 1
+                    i += 2
+                elif script.startswith("*/", i):
+                    nesting -= 1
+                    i += 2
+                else:
+                    i += 1
+            continue
+
+        if c == "'":
+            escapes = i > 0 and script[i - 1] in "eE" and (i < 2 or not (script[i - 2].isalnum() or script[i - 2] == "_"))
+            i += 1
+            while i < n:
+                if escapes and script[i] == "\\":
+                    i += 2
+                    continue
+                if script[i] == "'":
+                    if script.startswith("''", i):
+                        i += 2
+                        continue
+                    break
+                i += 1
+            i += 1
+            has_code = True
+            continue
+        if c == '"':
+            i += 1
+            while i < n:
+                if script[i] == '"':
+                    if script.startswith('""', i):
+                        i += 2
+                        continue
+                    break
+                i += 1
+            i += 1
+            has_code = True
+            continue
+        if c == "$" and word_start is None:
+            match = DOLLAR_QUOTE.match(script, i)
+            if match:
+                tag = match.group(0)
+                end = script.find(tag, match.end())
+                i = n if end == -1 else end + len(tag)
+                has_code = True
+                continue
+
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth = max(depth - 1, 0)
+        elif c == ";" and depth == 0 and not atomic:
+            statement = script[start:i].strip()
+            if has_code:
+                statements.append(statement)
+            start = i + 1
+            has_code = False
+            i += 1
+            continue
+
+        if not c.isspace():
+            has_code = True
+            if word_start is None and (c.isalpha() or c == "_"):
+                word_start = i
+        i += 1
+
+    if word_start is not None:
+        flush_word(n)
+    statement = script[start:].strip()
+    if has_code and statement:
+        statements.append(statement)
+    return statements
+
+# Statements that PostgreSQL refuses to run inside a transaction block
+NON_TRANSACTIONAL = re.compile(
+    r"^\s*(?:vacuum\b|create\s+database\b|drop\s+database\b|alter\s+system\b|create\s+tablespace\b|"
+    r"drop\s+tablespace\b|(?:create|drop)\s+(?:unique\s+)?index\s+concurrently\b|reindex\b.*\bconcurrently\b|"
+    r"(?:create|drop)\s+subscription\b)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+def requires_autocommit(statement: str) -> bool:
+    return bool(NON_TRANSACTIONAL.match(_strip_leading_comments(statement)))
+
+def _strip_leading_comments(statement: str) -> str:
+    return re.sub(r"^(?:\s*(?:--[^\n]*\n?|/\*.*?\*/))*", "", statement, flags=re.DOTALL)
+
+# Statements EXPLAIN can plan; DDL and utility commands are not explainable.
+EXPLAINABLE = ("select", "with", "insert", "update", "delete", "values", "table", "merge")
+
+def is_explainable(query: str) -> bool:
+    words = _strip_leading_comments(query).lstrip("( \n\t").split(None, 1)
+    return bool(words) and words[0].lower() in EXPLAINABLE
+
 def get_db_connection(db_config: dict):
-    try:
-        connection = psycopg2.connect(**db_config)
-        return connection
-    except Exception as e:
-        print("Error connecting to database:", e)
-        raise
+    """Check out a pooled connection for db_config; use as a context manager."""
+    return get_pool(db_config).connection()
 
-def execute_query(db_config: dict, query: str):
-    conn = get_db_connection(db_config)
+def execute_query(db_config: dict, query: str, max_rows: int = DEFAULT_MAX_ROWS):
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(query)
-            results = cursor.fetchall()
-        conn.commit()
-        return results
+        with get_db_connection(db_config) as conn:
+            return fetch_bounded(conn, query, max_rows).to_dicts()
     except Exception as e:
-        conn.rollback()
         print("Error executing query:", e)
         raise
-    finally:
-        conn.close()
 
 def get_schema_info(db_config: dict):
     """
     Dynamically fetch the schema: table names and their columns 
-    from the public schema.
+    from every non-system schema.
     """
-    conn = get_db_connection(db_config)
-    schema = {}
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT table_name, column_name 
-                FROM information_schema.columns 
-                WHERE table_schema = 'ecommerce'
-                ORDER BY table_name, ordinal_position;
-            """)
-            rows = cursor.fetchall()
-            for table, column in rows:
-                if table not in schema:
-                    schema[table] = []
-                schema[table].append(column)
-        return schema
+        return column_summary(get_catalog(db_config), with_types=False)
     except Exception as e:
         print("Error fetching schema info:", e)
         raise
-    finally:
-        conn.close()
@@ -0,0 +1,367 @@
+# telemetry.py
+import atexit
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "stonebraker"
+DEFAULT_SPAN_FILE = ".telemetry_spans.jsonl"
+DEFAULT_METRICS_PORT = 9464
+FLUSH_INTERVAL = 1.0
+MAX_BATCH = 1000
+MAX_RUNS = 20
+MAX_SPANS_PER_RUN = 5000
+MAX_ATTRIBUTE_LENGTH = 500
+# Seconds; spans range from sub-millisecond statements to minute-long LLM calls
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# OTLP SpanKind: spans calling out to the LLM or the database are clients
+SPAN_KINDS = {"run": 1, "node": 1, "llm": 3, "db": 3}
+STATEMENT_SPANS = ("db.statement", "db.query", "db.benchmark")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("telemetry_span", default=None)
+_node: ContextVar[Optional[str]] = ContextVar("telemetry_node", default=None)
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, kind: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)[:MAX_ATTRIBUTE_LENGTH]}
+
+
+def to_otlp(span: Span) -> Dict[str, Any]:
+    otlp = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": SPAN_KINDS.get(span.kind, 1),
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items() if v is not None]
+                      + [{"key": "span.kind", "value": {"stringValue": span.kind}}],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Telemetry:
+    """Collects finished spans, exports them as OTLP/JSON lines and keeps
+    Prometheus metrics and the spans of recent runs in memory."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path if path is not None else os.environ.get("TELEMETRY_FILE", DEFAULT_SPAN_FILE)
+        self._lock = threading.Lock()
+        self._runs: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._durations: Dict[tuple, _Histogram] = defaultdict(_Histogram)
+        self._counters: Dict[tuple, float] = defaultdict(float)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer = None
+        if self.path:
+            self._writer = threading.Thread(target=self._write_loop, name="telemetry-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.flush)
+
+    def record(self, span: Span):
+        seconds = span.duration_ms / 1000
+        with self._lock:
+            self._durations[(span.kind, span.name)].observe(seconds)
+            if span.error:
+                self._counters[("stonebraker_span_errors_total", ("kind", span.kind), ("name", span.name))] += 1
+            if span.kind == "llm":
+                model = ("model", str(span.attributes.get("llm.model")))
+                self._counters[("stonebraker_llm_requests_total", model)] += 1
+                if span.attributes.get("llm.cache_hit"):
+                    self._counters[("stonebraker_llm_cache_hits_total", model)] += 1
+                for kind in ("prompt", "completion"):
+                    tokens = span.attributes.get(f"llm.{kind}_tokens")
+                    if tokens:
+                        self._counters[("stonebraker_llm_tokens_total", model, ("type", kind))] += tokens
+            elif span.kind == "db" and (span.attributes.get("db.rows") or 0) > 0:
+                self._counters[("stonebraker_db_rows_total",)] += span.attributes["db.rows"]
+            # Lone statements outside any run would only push real runs out of memory
+            if span.parent_id or span.kind in ("run", "node"):
+                spans = self._runs.setdefault(span.trace_id, [])
+                if len(spans) < MAX_SPANS_PER_RUN:
+                    spans.append(span)
+                self._runs.move_to_end(span.trace_id)
+                while len(self._runs) > MAX_RUNS:
+                    self._runs.popitem(last=False)
+        if self._writer:
+            self._queue.put(span)
+
+    def spans(self, trace_id: str) -> List[Span]:
+        with self._lock:
+            return list(self._runs.get(trace_id, []))
+
+    def flush(self, timeout: Optional[float] = None):
+        if not self._writer:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _write_loop(self):
+        while True:
+            batch, waiters = [], []
+            item = self._queue.get()
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= MAX_BATCH:
+                    break
+                try:
+                    item = self._queue.get(timeout=FLUSH_INTERVAL)
+                except queue.Empty:
+                    break
+            if batch:
+                # One ExportTraceServiceRequest per line, as written by the OTLP file exporter
+                request = {"resourceSpans": [{
+                    "resource": {"attributes": [
+                        {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                        {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                    ]},
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": [to_otlp(s) for s in batch]}],
+                }]}
+                try:
+                    # A single O_APPEND write keeps lines whole when batch workers share the file
+                    fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                    try:
+                        os.write(fd, (json.dumps(request) + "\n").encode())
+                    finally:
+                        os.close(fd)
+                except OSError as e:
+                    logger.error(f"Span export failed: {str(e)}")
+            for waiter in waiters:
+                waiter.set()
+
+    def prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        lines = ["# HELP stonebraker_span_duration_seconds Duration of graph nodes, LLM calls and SQL statements",
+                 "# TYPE stonebraker_span_duration_seconds histogram"]
+        with self._lock:
+            durations = {key: (list(h.counts), h.sum, h.count) for key, h in self._durations.items()}
+            counters = dict(self._counters)
+        for (kind, name), (counts, total, count) in sorted(durations.items()):
+            labels = f'kind="{kind}",name="{_escape(name)}"'
+            for bound, bucket in zip(BUCKETS, counts):
+                lines.append(f'stonebraker_span_duration_seconds_bucket{{{labels},le="{bound}"}} {bucket}')
+            lines.append(f'stonebraker_span_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"stonebraker_span_duration_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"stonebraker_span_duration_seconds_count{{{labels}}} {count}")
+        declared = set()
+        for (metric, *labels), value in sorted(counters.items(), key=lambda item: str(item[0])):
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+            lines.append(f"{metric}{{{rendered}}} {value:g}" if rendered else f"{metric} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_telemetry: Optional[Telemetry] = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry() -> Telemetry:
+    """Process-wide collector; spans go to TELEMETRY_FILE (empty to disable the file)."""
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry()
+        return _telemetry
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", activate: bool = True, **attributes):
+    """Time the enclosed block as a child of the current span.
+
+    Spans opened inside a graph node carry the node's name, so LLM and
+    database time can be attributed to the node that spent it. Generators
+    pass activate=False: a span that stays current across a yield would
+    leak into the consumer's context.
+    """
+    current = Span(name, kind, _current.get(), attributes)
+    node = _node.get()
+    if node and kind != "node":
+        current.attributes.setdefault("graph.node", node)
+    token = _current.set(current) if activate else None
+    try:
+        yield current
+    except GeneratorExit:
+        # The consumer stopped early (e.g. a streamed response abandoned by a rerun)
+        raise
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {str(e)}"[:MAX_ATTRIBUTE_LENGTH]
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        if token is not None:
+            _current.reset(token)
+        get_telemetry().record(current)
+
+
+@contextmanager
+def trace_run(name: str, **attributes):
+    """Root span for one user-visible run (an analysis, a test, a batch job)."""
+    token = _current.set(None)
+    try:
+        with span(name, "run", **attributes) as run:
+            yield run
+    finally:
+        _current.reset(token)
+
+
+def traced_node(graph: str, name: str, fn: Callable) -> Callable:
+    """Wrap a graph node so each execution is recorded as a span."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _node.set(name)
+        try:
+            with span(f"{graph}.{name}", "node", **{"graph.name": graph, "graph.node": name}):
+                return fn(*args, **kwargs)
+        finally:
+            _node.reset(token)
+    return wrapper
+
+
+def run_breakdown(trace_id: str) -> Dict[str, Any]:
+    """Where the time of a run went: LLM vs database per graph node."""
+    spans = get_telemetry().spans(trace_id)
+    root = next((s for s in spans if s.kind == "run"), None)
+    nodes = defaultdict(lambda: {"wall_ms": 0.0, "llm_ms": 0.0, "db_ms": 0.0, "runs": 0})
+    totals = {"llm_ms": 0.0, "db_ms": 0.0, "connect_ms": 0.0, "llm_calls": 0, "cache_hits": 0, "prompt_tokens": 0,
+              "completion_tokens": 0, "statements": 0, "rows": 0, "errors": 0}
+    # Statements run inside a connection span; count database time once
+    db_spans = {s.span_id for s in spans if s.kind == "db"}
+    for s in spans:
+        attrs = s.attributes
+        nested = s.parent_id in db_spans
+        totals["errors"] += 1 if s.error else 0
+        if s.kind == "node":
+            node = nodes[attrs["graph.node"]]
+            node["wall_ms"] += s.duration_ms
+            node["runs"] += 1
+        elif s.kind in ("llm", "db"):
+            if not nested:
+                totals[f"{s.kind}_ms"] += s.duration_ms
+                if attrs.get("graph.node"):
+                    nodes[attrs["graph.node"]][f"{s.kind}_ms"] += s.duration_ms
+            if s.kind == "llm":
+                totals["llm_calls"] += 1
+                totals["cache_hits"] += 1 if attrs.get("llm.cache_hit") else 0
+                totals["prompt_tokens"] += attrs.get("llm.prompt_tokens") or 0
+                totals["completion_tokens"] += attrs.get("llm.completion_tokens") or 0
+            elif s.name == "db.connection":
+                totals["connect_ms"] += attrs.get("db.connect_ms") or 0.0
+            elif s.name in STATEMENT_SPANS:
+                totals["statements"] += 1
+                totals["rows"] += max(attrs.get("db.rows") or 0, 0)
+    total_ms = root.duration_ms if root else sum(n["wall_ms"] for n in nodes.values())
+    return {
+        "trace_id": trace_id,
+        "name": root.name if root else None,
+        "total_ms": round(total_ms, 1),
+        **{k: round(v, 1) if isinstance(v, float) else v for k, v in totals.items()},
+        "other_ms": round(max(total_ms - totals["llm_ms"] - totals["db_ms"], 0.0), 1),
+        "nodes": [{"node": name, **{k: round(v, 1) if isinstance(v, float) else v for k, v in n.items()},
+                   "other_ms": round(max(n["wall_ms"] - n["llm_ms"] - n["db_ms"], 0.0), 1)}
+                  for name, n in nodes.items()],
+    }
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_telemetry().prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: Optional[int] = None, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics for Prometheus; port from METRICS_PORT, 0 disables it. Idempotent."""
+    global _server
+    port = int(os.environ.get("METRICS_PORT", DEFAULT_METRICS_PORT)) if port is None else port
+    with _telemetry_lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"Metrics endpoint not started on port {port}: {str(e)}")
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+        return _server